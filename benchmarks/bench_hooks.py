@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# Copyright 2021 pguimaraes
+# See LICENSE file for licensing details.
+
+"""
+
+Scaling benchmarks of the charm hooks, built on ops.testing.Harness.
+
+Creates synthetic clusters, the leader plus peers with their relation
+data already published, and measures the wall time and the memory
+allocated by:
+
+config-changed, cluster-relation-changed (a peer changes its data),
+update-status and generate_env_file_minio.
+
+It also measures cold-import: the time a fresh interpreter takes to
+import the charm, paid by every hook before it runs.
+
+Everything that touches the system (users, disks, services, files) is
+patched out, so only the charm's own logic is measured. Each hook ends
+with a framework commit, as a real dispatch does.
+
+Results are saved as JSON, which can be compared between commits:
+
+    tox -e bench -- --output new.json
+    tox -e bench -- --output new.json --compare old.json
+
+With --compare, exits with 1 if any case got slower than --threshold
+times its previous wall time.
+
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from mock import PropertyMock, patch
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "lib"))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+import artifacts  # noqa
+import charm  # noqa
+import charms.minio.v1.object_storage as obj_stor  # noqa
+from ops.testing import Harness  # noqa
+
+UNITS = [4, 16, 64, 256]
+DISKS = [4, 32]
+SCENARIOS = ["config-changed", "cluster-relation-changed",
+             "update-status", "generate_env_file_minio"]
+
+PATCHES = [
+    (charm, "userAdd", {}),
+    (charm, "groupAdd", {}),
+    (charm, "apt_update", {}),
+    (charm, "service_running", {"return_value": True}),
+    (charm, "service_resume", {}),
+    (charm, "service_restart", {}),
+    (charm, "open_port", {}),
+    (charm, "close_port", {}),
+    (charm, "OpsCoordinator", {}),
+    (charm, "set_folders_and_permissions", {}),
+    (artifacts, "atomic_write", {}),
+    (charm.subprocess, "check_call", {}),
+    (charm.subprocess, "check_output", {}),
+    (charm.MinioDiskMapHelper, "attach_disks", {}),
+    (charm.MinioCharm, "_min_disk_size", {"return_value": 1 << 40}),
+    # Restarts are not part of the benchmark
+    (charm.MinioCharm, "_check_if_need_restart", {"return_value": False}),
+]
+
+
+def _start_patches(disks):
+    patchers = [patch.object(obj, attr, **kwargs)
+                for obj, attr, kwargs in PATCHES]
+    patchers.append(patch.object(
+        charm.MinioDiskMapHelper, "used_folders",
+        return_value=["/data{}".format(i) for i in range(1, disks + 1)]))
+    patchers.append(patch.object(
+        obj_stor.ObjectStorageRelationProvider, "advertise_addr",
+        new_callable=PropertyMock, return_value="10.0.0.0"))
+    for p in patchers:
+        p.start()
+    return patchers
+
+
+def build_cluster(units, disks):
+    """Returns a Harness with the leader and units - 1 peers."""
+    harness = Harness(charm.MinioCharm)
+    harness.add_storage("data", disks)
+    harness.set_leader(True)
+    harness.update_config({
+        "min-units": units,
+        "min-disks": 4,
+        "textfile-collector-dir": "",
+    })
+    cluster_id = harness.add_relation("cluster", "minio")
+    folders = ",".join("/data{}".format(i) for i in range(1, disks + 1))
+    for i in range(1, units):
+        name = "minio/{}".format(i)
+        harness.add_relation_unit(cluster_id, name)
+        harness.update_relation_data(cluster_id, name, {
+            "num_disks": str(disks),
+            "url": "http://minio-{}.bench:9000".format(i),
+            "used_folders": folders,
+            "disk_size": str(1 << 40),
+            "sans": "minio-{}.bench".format(i),
+        })
+    harness.begin()
+    harness.charm.minio.hostname = "minio-0.bench"
+    # First config-changed forms the cluster, as on a real deployment
+    harness.charm.on.config_changed.emit()
+    harness.framework.commit()
+    return harness, cluster_id
+
+
+def _run(harness, cluster_id, scenario, i):
+    if scenario == "config-changed":
+        harness.charm.on.config_changed.emit()
+    elif scenario == "cluster-relation-changed":
+        harness.update_relation_data(cluster_id, "minio/1", {
+            "disk_size": str((1 << 40) + i)})
+    elif scenario == "update-status":
+        harness.charm.on.update_status.emit()
+    elif scenario == "generate_env_file_minio":
+        harness.charm.generate_env_file_minio()
+    harness.framework.commit()
+
+
+def measure(harness, cluster_id, scenario, rounds):
+    """Returns the median wall time, in ms, and the peak KiB allocated."""
+    times = []
+    for i in range(rounds):
+        start = time.perf_counter()
+        _run(harness, cluster_id, scenario, i)
+        times.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    _run(harness, cluster_id, scenario, rounds)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(times), peak / 1024
+
+
+def cold_import(rounds):
+    """Returns the median ms a fresh interpreter takes to import charm."""
+    code = ("import time; t = time.perf_counter(); import charm; "
+            "print(time.perf_counter() - t)")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        [os.path.join(ROOT, "lib"), os.path.join(ROOT, "src")]))
+    times = [float(subprocess.check_output(
+        [sys.executable, "-c", code], cwd=ROOT, env=env)) * 1000
+        for _ in range(rounds)]
+    wall = statistics.median(times)
+    print("{:<26} {:>30.2f} ms".format("cold-import", wall))
+    return {"scenario": "cold-import", "units": 0, "disks": 0,
+            "wall_ms": round(wall, 3), "peak_kib": 0}
+
+
+def run(units_list, disks_list, rounds):
+    results = [cold_import(rounds)]
+    for disks in disks_list:
+        patchers = _start_patches(disks)
+        try:
+            for units in units_list:
+                harness, cluster_id = build_cluster(units, disks)
+                for scenario in SCENARIOS:
+                    wall, peak = measure(harness, cluster_id, scenario,
+                                         rounds)
+                    results.append({
+                        "scenario": scenario,
+                        "units": units,
+                        "disks": disks,
+                        "wall_ms": round(wall, 3),
+                        "peak_kib": round(peak, 1),
+                    })
+                    print("{:<26} units={:<4} disks={:<3} {:>10.2f} ms "
+                          "{:>10.1f} KiB".format(scenario, units, disks,
+                                                 wall, peak))
+                harness.cleanup()
+        finally:
+            for p in patchers:
+                p.stop()
+    return results
+
+
+def _commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def _key(result):
+    return (result["scenario"], result["units"], result["disks"])
+
+
+def compare(old, new, threshold):
+    """Prints the ratio of each case, returns the regressions."""
+    before = {_key(r): r for r in old["results"]}
+    regressions = []
+    for r in new["results"]:
+        o = before.get(_key(r))
+        if not o or not o["wall_ms"]:
+            continue
+        ratio = r["wall_ms"] / o["wall_ms"]
+        print("{:<26} units={:<4} disks={:<3} {:>6.2f}x wall "
+              "{:>6.2f}x peak".format(
+                  r["scenario"], r["units"], r["disks"], ratio,
+                  r["peak_kib"] / o["peak_kib"] if o["peak_kib"] else 0))
+        if ratio > threshold:
+            regressions.append(r)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--units", type=int, nargs="+", default=UNITS)
+    parser.add_argument("--disks", type=int, nargs="+", default=DISKS)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--compare", help="results of a previous run")
+    parser.add_argument("--threshold", type=float, default=1.5)
+    args = parser.parse_args()
+
+    doc = {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "rounds": args.rounds,
+        "results": run(args.units, args.disks, args.rounds),
+    }
+    with open(args.output, "w") as f:
+        json.dump(doc, f, indent=2, sort_keys=True)
+    if not args.compare:
+        return 0
+    with open(args.compare) as f:
+        old = json.load(f)
+    print("Compared to {}:".format(old.get("commit") or args.compare))
+    regressions = compare(old, doc, args.threshold)
+    if regressions:
+        print("{} case(s) over {}x slower".format(
+            len(regressions), args.threshold))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
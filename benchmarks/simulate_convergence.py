@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+# Copyright 2021 pguimaraes
+# See LICENSE file for licensing details.
+
+"""
+
+Offline simulator of how a cluster converges to its steady state.
+
+Each unit runs the real MinioCharm handlers on its own ops.testing.Harness.
+A fake Juju delivers the events through a single FIFO queue: whenever a
+hook changes the unit's data (or the application data, on the leader),
+each peer gets a cluster-relation-changed with the changes, as Juju
+does. Deferred events are re-run at the start of each hook, as Juju's
+dispatch does.
+
+Steady state is reached once the queue is empty, all units agree on
+MINIO_VOLUMES and all of them are active.
+
+Scenarios:
+bootstrap: deploy --units units from scratch.
+add-units: add --add units to a running cluster, as a new server pool.
+remove-unit: remove the last unit of a running cluster.
+rotate-certs: set new ssl_cert/ssl_key on every unit.
+change-min-units: change min-units on every unit.
+
+Reported, per scenario: hooks run, deferred events re-run, relation
+writes (keys changed), restart requests and service restarts.
+
+    tox -e sim -- --scenario all --units 4 --add 4 --output sim.json
+
+"""
+
+import argparse
+import base64
+import collections
+import json
+import os
+import sys
+
+from mock import PropertyMock, patch
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "lib"))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+import artifacts  # noqa
+import charm  # noqa
+import scheduler  # noqa
+import charms.minio.v1.object_storage as obj_stor  # noqa
+from ops.framework import Framework  # noqa
+from ops.model import ActiveStatus  # noqa
+from ops.testing import Harness  # noqa
+
+APP = "minio"
+DISKS = 4
+MAX_EVENTS = 20000
+# update-status rounds run while events stay deferred
+IDLE_ROUNDS = 10
+# Framework events are not hooks
+NOT_HOOKS = ["PreCommitEvent", "CommitEvent"]
+
+SCENARIOS = ["bootstrap", "add-units", "remove-unit", "rotate-certs",
+             "change-min-units"]
+
+
+class Counters(object):
+
+    def __init__(self):
+        self.events = collections.Counter()
+        self.deferred_reruns = 0
+        self.relation_writes = 0
+        self.restart_requests = 0
+
+    def to_dict(self, restarts):
+        return {
+            "hooks": sum(self.events.values()),
+            "deferred_reruns": self.deferred_reruns,
+            "relation_writes": self.relation_writes,
+            "restart_requests": self.restart_requests,
+            "service_restarts": restarts,
+            "events": dict(self.events),
+        }
+
+
+COUNTERS = Counters()
+
+
+def _counting_emit(emit):
+    def wrapper(framework, event):
+        name = type(event).__name__
+        if name not in NOT_HOOKS and not event.deferred:
+            COUNTERS.events[name] += 1
+        return emit(framework, event)
+    return wrapper
+
+
+def _counting_request(request):
+    def wrapper(self, ctx, services):
+        COUNTERS.restart_requests += 1
+        return request(self, ctx, services)
+    return wrapper
+
+
+def _fake_pem(label, seed):
+    body = base64.b64encode(
+        "{}-{}".format(label, seed).encode() * 8).decode()
+    return "-----BEGIN {}-----\n{}\n-----END {}-----\n".format(
+        label, body, label)
+
+
+class SimUnit(object):
+    """A unit of the simulated cluster."""
+
+    def __init__(self, index, config):
+        self.name = "{}/{}".format(APP, index)
+        self.harness = Harness(charm.MinioCharm)
+        self.harness.set_model_name("sim")
+        self.harness.add_storage("data", DISKS)
+        self.harness.update_config(config)
+        self.harness.set_leader(index == 0)
+        self.rel_id = self.harness.add_relation("cluster", APP)
+        self._seen = {}
+
+    @property
+    def charm(self):
+        return self.harness.charm
+
+    def snapshot(self):
+        """Returns the changes of own data (and app, on the leader)."""
+        changes = {}
+        buckets = [self.name] + ([APP] if self.charm.unit.is_leader()
+                                 else [])
+        for bucket in buckets:
+            data = dict(self.harness.get_relation_data(self.rel_id, bucket))
+            old = self._seen.get(bucket, {})
+            diff = {k: v for k, v in data.items() if old.get(k) != v}
+            diff.update({k: "" for k in old if k not in data})
+            if diff:
+                changes[bucket] = diff
+            self._seen[bucket] = data
+        return changes
+
+    def dispatch(self, fn):
+        """Runs a hook: deferred events first, then fn, then commit."""
+        framework = self.harness.framework
+        pending = len(list(framework._storage.notices(None)))
+        if pending:
+            COUNTERS.deferred_reruns += pending
+            framework.reemit()
+        fn()
+        framework.commit()
+
+
+class Simulation(object):
+
+    def __init__(self, units, config=None):
+        self.config = {
+            "min-units": units,
+            "min-disks": 4,
+            "textfile-collector-dir": "",
+        }
+        self.config.update(config or {})
+        self.units = []
+        self.queue = collections.deque()
+
+    def enqueue(self, unit, fn):
+        self.queue.append((unit, fn))
+
+    def _propagate(self, source, changes):
+        for bucket, diff in changes.items():
+            COUNTERS.relation_writes += len(diff)
+            for target in self.units:
+                if target is source:
+                    continue
+                self.enqueue(target, (
+                    lambda t=target, b=bucket, d=diff:
+                    t.harness.update_relation_data(t.rel_id, b, d)))
+
+    def run(self):
+        """Delivers events until the queue is empty."""
+        count = 0
+        idle = 0
+        while self.queue:
+            count += 1
+            if count > MAX_EVENTS:
+                raise RuntimeError("No convergence after {} events".format(
+                    MAX_EVENTS))
+            unit, fn = self.queue.popleft()
+            if unit not in self.units:
+                # Unit removed meanwhile
+                continue
+            unit.dispatch(fn)
+            changes = unit.snapshot()
+            self._propagate(unit, changes)
+            if changes:
+                idle = 0
+            if not self.queue and idle < IDLE_ROUNDS:
+                # Juju keeps running update-status, which also re-runs
+                # deferred events, until nothing else happens
+                idle += 1
+                for u in self.units:
+                    if list(u.harness.framework._storage.notices(None)):
+                        self.enqueue(u, u.charm.on.update_status.emit)
+
+    def add_unit(self):
+        unit = SimUnit(len(self.units), self.config)
+        # The new unit sees the data its peers already published
+        for peer in self.units:
+            unit.harness.add_relation_unit(unit.rel_id, peer.name)
+            unit.harness.update_relation_data(
+                unit.rel_id, peer.name,
+                peer.harness.get_relation_data(peer.rel_id, peer.name))
+        if self.units:
+            leader = self.units[0]
+            unit.harness.update_relation_data(
+                unit.rel_id, APP,
+                leader.harness.get_relation_data(leader.rel_id, APP))
+        self.units.append(unit)
+        self.enqueue(unit, unit.harness.begin_with_initial_hooks)
+        for peer in self.units[:-1]:
+            self.enqueue(peer, lambda p=peer, u=unit:
+                         p.harness.add_relation_unit(p.rel_id, u.name))
+        return unit
+
+    def remove_unit(self, unit):
+        self.units.remove(unit)
+        unit.harness.cleanup()
+        for peer in self.units:
+            self.enqueue(peer, lambda p=peer:
+                         p.harness.remove_relation_unit(p.rel_id, unit.name))
+
+    def set_config(self, values):
+        self.config.update(values)
+        for u in self.units:
+            self.enqueue(u, lambda u=u: u.harness.update_config(values))
+
+    def converged(self):
+        volumes = set(u.charm.cluster.minio_volumes for u in self.units)
+        active = all(isinstance(u.charm.unit.status, ActiveStatus)
+                     for u in self.units)
+        return len(volumes) == 1 and "" not in volumes and active
+
+    def statuses(self):
+        return {u.name: str(u.charm.unit.status) for u in self.units}
+
+
+def _hostname(provider):
+    return "{}.sim".format(provider._unit.name.replace("/", "-"))
+
+
+def _patches():
+    """Starts the patches, returns them and the service_restart mock."""
+    patchers = [
+        patch.object(charm, "userAdd"),
+        patch.object(charm, "groupAdd"),
+        patch.object(charm, "apt_update"),
+        patch.object(charm, "service_running", return_value=True),
+        patch.object(charm, "service_resume"),
+        patch.object(charm, "open_port"),
+        patch.object(charm, "close_port"),
+        patch.object(charm, "set_folders_and_permissions"),
+        patch.object(charm, "wait_healthy", return_value=0.1),
+        patch.object(charm, "wait_cert_served", return_value=0.1),
+        patch.object(scheduler, "wait_healthy", return_value=0.1),
+        patch.object(artifacts, "atomic_write"),
+        patch.object(charm.subprocess, "check_call"),
+        patch.object(charm.subprocess, "check_output"),
+        patch.object(charm.MinioDiskMapHelper, "attach_disks"),
+        patch.object(charm.MinioDiskMapHelper, "used_folders",
+                     return_value=["/data{}".format(i)
+                                   for i in range(1, DISKS + 1)]),
+        patch.object(charm.MinioCharm, "_min_disk_size",
+                     return_value=1 << 40),
+        patch.object(obj_stor.ObjectStorageRelationProvider,
+                     "advertise_addr", new_callable=PropertyMock,
+                     return_value="10.0.0.0"),
+        # Each unit has its own hostname, hence its own url
+        patch.object(obj_stor.ObjectStorageRelationProvider, "hostname",
+                     new=property(_hostname)),
+        patch.object(Framework, "_emit", _counting_emit(Framework._emit)),
+        patch.object(charm.MinioCharm, "_request_restart",
+                     _counting_request(charm.MinioCharm._request_restart)),
+        patch.object(charm, "service_restart"),
+    ]
+    started = [p.start() for p in patchers]
+    return patchers, started[-1]
+
+
+def _bootstrap(units):
+    sim = Simulation(units)
+    for _ in range(units):
+        sim.add_unit()
+    sim.run()
+    return sim
+
+
+def run_scenario(name, units, add):
+    """Returns the counters of the scenario, after its own setup."""
+    global COUNTERS
+    patchers, service_restart = _patches()
+    try:
+        COUNTERS = Counters()
+        if name == "bootstrap":
+            sim = _bootstrap(units)
+        else:
+            sim = _bootstrap(units)
+            COUNTERS = Counters()
+            service_restart.reset_mock()
+            if name == "add-units":
+                # New units form a pool of their own
+                sim.set_config({"min-units": add})
+                for _ in range(add):
+                    sim.add_unit()
+            elif name == "remove-unit":
+                sim.remove_unit(sim.units[-1])
+            elif name == "rotate-certs":
+                sim.set_config({
+                    "ssl_cert": base64.b64encode(
+                        _fake_pem("CERTIFICATE", 2).encode()).decode(),
+                    "ssl_key": base64.b64encode(
+                        _fake_pem("PRIVATE KEY", 2).encode()).decode()})
+            elif name == "change-min-units":
+                sim.set_config({"min-units": max(units - 1, 1)})
+            sim.run()
+        result = COUNTERS.to_dict(service_restart.call_count)
+        result.update({
+            "scenario": name,
+            "units": len(sim.units),
+            "converged": sim.converged(),
+        })
+        if not result["converged"]:
+            result["statuses"] = sim.statuses()
+        for u in sim.units:
+            u.harness.cleanup()
+        return result
+    finally:
+        for p in patchers:
+            p.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--scenario", default="all",
+                        choices=SCENARIOS + ["all"])
+    parser.add_argument("--units", type=int, default=4)
+    parser.add_argument("--add", type=int, default=4,
+                        help="units added by add-units")
+    parser.add_argument("--output", default="sim_output.json")
+    args = parser.parse_args()
+
+    scenarios = SCENARIOS if args.scenario == "all" else [args.scenario]
+    results = []
+    for name in scenarios:
+        r = run_scenario(name, args.units, args.add)
+        results.append(r)
+        print("{:<18} units={:<4} hooks={:<6} deferred={:<5} writes={:<6} "
+              "restart requests={:<4} restarts={:<4} converged={}".format(
+                  name, r["units"], r["hooks"], r["deferred_reruns"],
+                  r["relation_writes"], r["restart_requests"],
+                  r["service_restarts"], r["converged"]))
+    with open(args.output, "w") as f:
+        json.dump({"results": results}, f, indent=2, sort_keys=True)
+    return 0 if all(r["converged"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
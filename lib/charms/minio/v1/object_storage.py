@@ -1,8 +1,12 @@
+import logging
+
 from ops.framework import Object, StoredState
 from wand.apps.relations.relation_manager_base import RelationManagerBase
 
 from charmhelpers.contrib.network.ip import get_hostname
 
+logger = logging.getLogger(__name__)
+
 
 class ObjectStorageRelationManager(RelationManagerBase):
 
@@ -40,13 +44,21 @@ class ObjectStorageRelationProvider(ObjectStorageRelationManager):
                   secure,
                   service):
         if self.relations:
-            self.send(
-                {
-                    "access-key": access_key,
-                    "namespace": namespace,
-                    "port": port,
-                    "secret-key": secret_key,
-                    "secure": secure,
-                    "service": service,
-                }
-            )
\ No newline at end of file
+            info = {
+                "access-key": access_key,
+                "namespace": namespace,
+                "port": port,
+                "secret-key": secret_key,
+                "secure": secure,
+                "service": service,
+            }
+            # Each write fires -relation-changed on the other side, even
+            # if nothing changed: skip it if all relations have the values
+            if all(r.data[self._unit].get(k) == str(v)
+                   for r in self.relations for k, v in info.items()):
+                logger.debug("send_info: values unchanged, write "
+                             "suppressed")
+                return
+            self.send(info)
+            logger.debug("send_info: values sent to {} relation(s)".format(
+                len(self.relations)))
\ No newline at end of file
@@ -0,0 +1,192 @@
+"""
+
+Wrappers around the minio client admin commands and the health endpoints
+of the minio server.
+
+The client is pointed at the cluster through the MC_HOST_<alias>
+environment variable instead of a persisted alias, therefore no credentials
+are written to disk when running admin commands.
+
+Health endpoints, as described on:
+https://github.com/minio/minio/blob/master/docs/metrics/healthcheck/README.md
+/minio/health/live: the node process is up
+/minio/health/ready: the node is ready to serve requests
+/minio/health/cluster: the cluster has write quorum
+
+"""
+
+import hashlib
+import json
+import logging
+import os
+import socket
+import ssl
+import subprocess
+import time
+
+from urllib.error import URLError
+from urllib.parse import urlparse
+from urllib.request import urlopen
+
+logger = logging.getLogger(__name__)
+
+# The mcli package installs the client as "mcli" to avoid clashing with
+# midnight commander's "mc".
+MC_BIN = "mcli"
+MC_ALIAS = "minio"
+
+HEALTH_LIVE = "/minio/health/live"
+HEALTH_READY = "/minio/health/ready"
+HEALTH_CLUSTER = "/minio/health/cluster"
+
+
+class MinioAdminCommandError(Exception):
+    def __init__(self, cmd, output):
+        super().__init__(
+            "Command {} failed with: {}".format(" ".join(cmd), output))
+
+
+class MinioAdmin(object):
+
+    def __init__(self, url, user, password, ca_path=None):
+        """Admin client for the cluster served at url.
+
+        Args:
+            url: http(s)://<hostname>:<port> of one of the minio units
+            user, password: root credentials of the cluster
+            ca_path: CA chain file, used if url is https
+        """
+        self._url = url
+        self._user = user
+        self._password = password
+        self._ca_path = ca_path
+
+    def host_env(self):
+        """Returns the environment variables that point mcli at the
+        cluster."""
+        u = urlparse(self._url)
+        env = {"MC_HOST_{}".format(MC_ALIAS): "{}://{}:{}@{}".format(
+            u.scheme, self._user, self._password, u.netloc)}
+        if self._ca_path:
+            # Go's TLS stack honors SSL_CERT_FILE for the root CAs
+            env["SSL_CERT_FILE"] = self._ca_path
+        return env
+
+    def _env(self):
+        env = os.environ.copy()
+        env.update(self.host_env())
+        return env
+
+    def run(self, *args):
+        """Runs mcli --json admin <args> against the cluster.
+
+        Returns the list of json documents printed by the command.
+        """
+        cmd = [MC_BIN, "--json", "admin"] + list(args)
+        try:
+            out = subprocess.check_output(
+                cmd, env=self._env(), stderr=subprocess.STDOUT)
+        except subprocess.CalledProcessError as e:
+            raise MinioAdminCommandError(cmd, e.output)
+        except OSError as e:
+            # e.g. mcli is not installed yet
+            raise MinioAdminCommandError(cmd, e)
+        result = []
+        for line in out.decode("utf-8").splitlines():
+            try:
+                result.append(json.loads(line))
+            except ValueError:
+                logger.debug("Ignoring non-json output: {}".format(line))
+        return result
+
+    def config_set(self, subsystem, values):
+        """Sets the keys of a config subsystem, e.g. heal max_io=10.
+
+        Args:
+            subsystem: name of the subsystem, as in mcli admin config get
+            values: dict of key and value
+        """
+        return self.run("config", "set", MC_ALIAS, subsystem, *[
+            "{}={}".format(k, v) for k, v in sorted(values.items())])
+
+    def config_get(self, subsystem):
+        """Returns the current keys of a config subsystem."""
+        return self.run("config", "get", MC_ALIAS, subsystem)
+
+    def service_restart(self):
+        """Restarts all the servers of the cluster at once."""
+        return self.run("service", "restart", MC_ALIAS)
+
+
+def _ssl_context(ca_path=None):
+    if ca_path and os.path.exists(ca_path):
+        return ssl.create_default_context(cafile=ca_path)
+    return ssl.create_default_context()
+
+
+def is_healthy(url, path=HEALTH_CLUSTER, timeout=5, ca_path=None):
+    """Probes one of the health endpoints of url."""
+    ctx = _ssl_context(ca_path) if url.startswith("https") else None
+    try:
+        with urlopen(url + path, timeout=timeout, context=ctx) as r:
+            return r.status == 200
+    except (URLError, OSError, ValueError):
+        return False
+
+
+def wait_healthy(url, path=HEALTH_CLUSTER, timeout=300,
+                 interval=2, ca_path=None):
+    """Waits until the health endpoint of url answers with 200.
+
+    Returns the seconds it took or None if it timed out.
+    """
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        if is_healthy(url, path=path, ca_path=ca_path):
+            return time.monotonic() - start
+        time.sleep(interval)
+    return None
+
+
+def cert_fingerprint(pem):
+    """Returns the sha256 of the DER form of a PEM certificate."""
+    return hashlib.sha256(ssl.PEM_cert_to_DER_cert(pem)).hexdigest()
+
+
+def served_cert_fingerprint(host, port, server_name=None, timeout=5):
+    """Runs a TLS handshake against host:port and returns the sha256 of
+    the certificate served, or None if the handshake failed.
+
+    The certificate is not validated, it only needs to be compared.
+    """
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    ctx.check_hostname = False
+    ctx.verify_mode = ssl.CERT_NONE
+    try:
+        with socket.create_connection((host, port), timeout=timeout) as s:
+            with ctx.wrap_socket(
+                    s, server_hostname=server_name or host) as tls:
+                der = tls.getpeercert(binary_form=True)
+    except (OSError, ssl.SSLError):
+        return None
+    return hashlib.sha256(der).hexdigest() if der else None
+
+
+def wait_cert_served(host, port, pem, server_name=None,
+                     timeout=30, interval=1):
+    """Waits until host:port serves the certificate pem.
+
+    Returns the seconds it took or None if it timed out.
+    """
+    expected = cert_fingerprint(pem)
+    start = time.monotonic()
+    while True:
+        served = served_cert_fingerprint(
+            host, port, server_name=server_name)
+        if served == expected:
+            return time.monotonic() - start
+        if time.monotonic() - start >= timeout:
+            logger.warning("{}:{} still serves {}, expected {}".format(
+                host, port, served, expected))
+            return None
+        time.sleep(interval)
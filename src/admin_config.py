@@ -0,0 +1,161 @@
+"""
+
+Settings minio applies at runtime, set through its admin config API.
+
+Most of minio's subsystems can be changed on a running cluster with
+mcli admin config set, without a restart. The admin-config option holds
+them as yaml, one mapping of keys per subsystem:
+
+api:
+  requests_max: 1600
+scanner:
+  speed: slow
+notify_webhook:primary:
+  endpoint: https://hooks.example.com/minio
+
+The leader applies them, reads each subsystem back with mcli admin config
+get and compares every key with what was set. minio keeps the values in
+the cluster's own config, so a single apply reaches every server.
+
+Settings that only apply at startup stay on minio_env_extra_opts, which is
+rendered to the env file and applied by a restart.
+
+"""
+
+import hashlib
+import json
+import logging
+import shlex
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+# Subsystems, or prefixes of subsystems with targets, set at runtime
+LIVE_SUBSYSTEMS = [
+    "api",
+    "heal",
+    "scanner",
+    "compression",
+    "notify_",
+    "logger_webhook",
+    "audit_webhook",
+]
+
+# Env prefixes of the live subsystems, better set through admin-config
+LIVE_ENV_PREFIXES = [
+    "MINIO_API_",
+    "MINIO_HEAL_",
+    "MINIO_SCANNER_",
+    "MINIO_COMPRESSION_",
+    "MINIO_NOTIFY_",
+    "MINIO_LOGGER_WEBHOOK_",
+    "MINIO_AUDIT_WEBHOOK_",
+]
+
+
+class MinioInvalidAdminConfig(Exception):
+    def __init__(self, msg):
+        super().__init__("Invalid admin-config: {}".format(msg))
+
+
+def _is_live(subsystem):
+    name = subsystem.split(":", 1)[0]
+    return any(name == s or (s.endswith("_") and name.startswith(s))
+               for s in LIVE_SUBSYSTEMS)
+
+
+def parse_admin_config(raw):
+    """Returns {subsystem: {key: value}} of the admin-config option.
+
+    Values are kept as strings, as minio reads them back.
+
+    Raises:
+        MinioInvalidAdminConfig if it is not a mapping of mappings or
+        has subsystems that are not set at runtime
+    """
+    try:
+        doc = yaml.safe_load(raw or "") or {}
+    except yaml.YAMLError as e:
+        raise MinioInvalidAdminConfig(str(e))
+    if not isinstance(doc, dict):
+        raise MinioInvalidAdminConfig("expected a mapping of subsystems")
+    result = {}
+    for subsystem, kv in doc.items():
+        if not _is_live(str(subsystem)):
+            raise MinioInvalidAdminConfig(
+                "{} is not set at runtime, use minio_env_extra_opts".format(
+                    subsystem))
+        if not isinstance(kv, dict) or not kv:
+            raise MinioInvalidAdminConfig(
+                "{} must be a mapping of keys".format(subsystem))
+        result[str(subsystem)] = {
+            str(k): _to_str(v) for k, v in kv.items()}
+    return result
+
+
+def _to_str(v):
+    if isinstance(v, bool):
+        return "on" if v else "off"
+    return str(v)
+
+
+def fingerprint(config):
+    return hashlib.sha256(
+        json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def live_env_keys(env):
+    """Returns the keys of env that could be set at runtime instead."""
+    return sorted(k for k in env
+                  if any(str(k).startswith(p) for p in LIVE_ENV_PREFIXES))
+
+
+def parse_config_get(docs):
+    """Returns {key: value} of mcli --json admin config get output.
+
+    Understands both the structured output, a list of kv pairs, and the
+    older one, a single "subsystem key=value ..." line.
+    """
+    values = {}
+    for doc in docs:
+        for cfg in doc.get("config", []) or []:
+            for kv in cfg.get("kv", []) or []:
+                values[kv["key"]] = kv.get("value", "")
+        line = doc.get("value")
+        if isinstance(line, str):
+            for token in shlex.split(line)[1:]:
+                if "=" in token:
+                    k, v = token.split("=", 1)
+                    values[k] = v
+    return values
+
+
+def apply_admin_config(admin, config):
+    """Sets each subsystem and reads it back.
+
+    Args:
+        admin: MinioAdmin of the cluster
+        config: as returned by parse_admin_config
+    Returns:
+        {"subsystem.key": (wanted, found)} of the keys that did not take
+        the value set, empty if all did
+    Raises:
+        MinioAdminCommandError if mcli fails
+    """
+    mismatches = {}
+    for subsystem, values in sorted(config.items()):
+        out = admin.config_set(subsystem, values)
+        if any("restart" in str(d.get("message", "")).lower()
+               for d in out):
+            logger.warning("{} only takes effect after minio restarts"
+                           .format(subsystem))
+        found = parse_config_get(admin.config_get(subsystem))
+        for k, v in sorted(values.items()):
+            if found.get(k) != v:
+                mismatches["{}.{}".format(subsystem, k)] = (v, found.get(k))
+    if mismatches:
+        logger.error("admin-config not applied: {}".format(mismatches))
+    else:
+        logger.info("admin-config applied: {}".format(sorted(config)))
+    return mismatches
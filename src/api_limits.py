@@ -0,0 +1,88 @@
+"""
+
+Sizes minio's api subsystem from the resources of the host.
+
+requests_max: requests a node serves at once, the rest wait in a queue.
+              Each request holds a buffer per drive it touches: about one
+              erasure block read and one written, 2MiB per drive. At most
+              half of the RAM goes to those buffers, and no more than
+              REQUESTS_PER_CPU requests per CPU.
+requests_deadline: how long a request may wait in that queue.
+cluster_deadline: how long a node waits for its peers to answer.
+Both deadlines start at minio's default, 10s, and grow with the drives
+each CPU has to serve, as those requests take longer.
+
+Each unit publishes its own values and the resources they came from.
+minio's api config is cluster-wide, hence the leader settles on values
+safe for every node: the lowest requests_max and the longest deadlines.
+
+"""
+
+import os
+
+MIB = 1 << 20
+
+REQUEST_MEMORY_PER_DRIVE = 2 * MIB
+MEMORY_SHARE = 0.5
+MIN_REQUESTS = 32
+REQUESTS_PER_CPU = 256
+BASE_DEADLINE = 10
+MAX_DEADLINE = 60
+
+
+def host_resources(meminfo="/proc/meminfo"):
+    """Returns {"ram": bytes, "cpus": count} of this host."""
+    ram = 0
+    try:
+        with open(meminfo) as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    # Value in kB
+                    ram = int(line.split()[1]) * 1024
+                    break
+    except (OSError, ValueError, IndexError):
+        ram = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    return {"ram": ram, "cpus": os.cpu_count() or 1}
+
+
+def compute_limits(ram, cpus, drives):
+    """Returns {"requests_max": ..., "requests_deadline": ...,
+    "cluster_deadline": ...}, deadlines in seconds."""
+    cpus = max(cpus, 1)
+    drives = max(drives, 1)
+    by_memory = int(ram * MEMORY_SHARE /
+                    (drives * REQUEST_MEMORY_PER_DRIVE))
+    requests_max = max(MIN_REQUESTS,
+                       min(by_memory, cpus * REQUESTS_PER_CPU))
+    # Drives per CPU, rounded up
+    deadline = min(MAX_DEADLINE, BASE_DEADLINE * -(-drives // cpus))
+    return {
+        "requests_max": requests_max,
+        "requests_deadline": deadline,
+        "cluster_deadline": deadline,
+    }
+
+
+def merge_limits(per_unit):
+    """Returns the limits safe for all the units, None if none published.
+
+    Args:
+        per_unit: dict of unit name and its limits
+    """
+    limits = [v for v in per_unit.values() if v]
+    if not limits:
+        return None
+    return {
+        "requests_max": min(v["requests_max"] for v in limits),
+        "requests_deadline": max(v["requests_deadline"] for v in limits),
+        "cluster_deadline": max(v["cluster_deadline"] for v in limits),
+    }
+
+
+def api_config(limits):
+    """Returns limits as the keys of minio's api subsystem."""
+    return {
+        "requests_max": str(limits["requests_max"]),
+        "requests_deadline": "{}s".format(limits["requests_deadline"]),
+        "cluster_deadline": "{}s".format(limits["cluster_deadline"]),
+    }
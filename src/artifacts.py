@@ -0,0 +1,135 @@
+"""
+
+Incremental rendering of the files managed by the charm.
+
+Each artifact (env file, service file, certificates) has a name and a
+fingerprint of its inputs, i.e. the template context or the raw content.
+Fingerprints are kept by the charm across hooks, and an artifact is only
+rendered and written again if its fingerprint changed or its target is gone.
+
+Writes are atomic: content goes to a temporary file on the same folder,
+which is then renamed over the target. Therefore, minio never reads a
+partially written file.
+
+"""
+
+import grp
+import hashlib
+import json
+import logging
+import os
+import pwd
+import tempfile
+
+from charmhelpers.core.templating import render as render_template
+
+logger = logging.getLogger(__name__)
+
+
+def fingerprint(inputs):
+    """Returns a stable hash of any json-serializable inputs."""
+    return hashlib.sha256(
+        json.dumps(inputs, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def atomic_write(target, content, owner="root", group="root", perms=0o444):
+    """Writes content to target, replacing it in one rename."""
+    folder = os.path.dirname(target)
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(
+        dir=folder, prefix=".{}.".format(os.path.basename(target)))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content.encode("utf-8")
+                    if isinstance(content, str) else content)
+            f.flush()
+            os.fchown(f.fileno(), pwd.getpwnam(owner).pw_uid,
+                      grp.getgrnam(group).gr_gid)
+            os.fchmod(f.fileno(), perms)
+            os.fsync(f.fileno())
+        os.replace(tmp, target)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+class ArtifactRenderer(object):
+
+    def __init__(self, fingerprints):
+        """Renderer that remembers the inputs of each artifact.
+
+        Args:
+            fingerprints: dict-like, persisted by the caller across hooks,
+                          which maps artifact names to their fingerprints.
+        """
+        self._fingerprints = fingerprints
+        self._changed = []
+
+    @property
+    def changed(self):
+        """Artifacts written since this renderer was created."""
+        return list(self._changed)
+
+    def _unchanged(self, name, target, fp):
+        return self._fingerprints.get(name) == fp and \
+            os.path.exists(target)
+
+    def _same_content(self, name, target, content, fp):
+        """Checks if target already holds content, e.g. fingerprints were
+        lost. If so, just record the fingerprint.
+        """
+        try:
+            with open(target, "rb") as f:
+                current = f.read()
+        except OSError:
+            return False
+        if current != (content.encode("utf-8")
+                       if isinstance(content, str) else content):
+            return False
+        self._fingerprints[name] = fp
+        return True
+
+    def _commit(self, name, fp):
+        self._fingerprints[name] = fp
+        if name not in self._changed:
+            self._changed.append(name)
+        logger.info("Artifact {} changed and was rewritten".format(name))
+
+    def render(self, name, source, target, context,
+               owner="root", group="root", perms=0o444):
+        """Renders the template source into target if context changed.
+
+        Returns True if the target was rewritten.
+        """
+        fp = fingerprint(
+            {"source": source, "context": context, "owner": owner,
+             "group": group, "perms": perms})
+        if self._unchanged(name, target, fp):
+            logger.debug("Artifact {} unchanged, skipping".format(name))
+            return False
+        content = render_template(source, None, context)
+        if self._same_content(name, target, content, fp):
+            return False
+        atomic_write(target, content, owner=owner, group=group, perms=perms)
+        self._commit(name, fp)
+        return True
+
+    def write(self, name, target, content,
+              owner="root", group="root", perms=0o444):
+        """Writes content into target if it changed.
+
+        Returns True if the target was rewritten.
+        """
+        fp = fingerprint(
+            {"content": content, "owner": owner,
+             "group": group, "perms": perms})
+        if self._unchanged(name, target, fp):
+            logger.debug("Artifact {} unchanged, skipping".format(name))
+            return False
+        if self._same_content(name, target, content, fp):
+            return False
+        atomic_write(target, content, owner=owner, group=group, perms=perms)
+        self._commit(name, fp)
+        return True
@@ -19,13 +19,25 @@ import json
 import os
 import base64
 import sys
+import time
+
+# Start of the hook, before the imports, see _account_startup
+STARTED = time.monotonic()
+
 import yaml
+
+from urllib.parse import urlparse
 sys.path.append('lib')
 
 from ops.charm import CharmBase, InstallEvent
 from ops.framework import StoredState
 from ops.main import main
-from ops.model import ActiveStatus, BlockedStatus, MaintenanceStatus
+from ops.model import (
+    ActiveStatus,
+    BlockedStatus,
+    MaintenanceStatus,
+    ModelError
+)
 
 from wand.apps.relations.tls_certificates import (
     TLSCertificateRequiresRelation,
@@ -37,8 +49,6 @@ from charmhelpers.fetch.ubuntu import (
     apt_update
 )
 
-from wand.contrib.disk_map import DiskMapHelper
-
 from wand.contrib.linux import (
     userAdd,
     groupAdd,
@@ -47,10 +57,7 @@ from wand.contrib.linux import (
     set_folders_and_permissions
 )
 
-from wand.security.ssl import (
-    genRandomPassword,
-    saveCrtChainToFile
-)
+from wand.security.ssl import genRandomPassword
 
 from wand.contrib.coordinator import (
     RestartCharmEvent,
@@ -68,115 +75,41 @@ from charmhelpers.core.hookenv import (
     close_port
 )
 
-from charmhelpers.core.templating import render
-
-from cluster import (
-    MinioClusterManager,
-    MinioClusterNumDisksMustBeDivisibleBy4
+from cluster import MinioClusterManager
+from topology import (
+    MinioClusterInvalidTopology,
+    expand_pools,
+    parse_parity,
+    pool_volumes
 )
 from charms.minio.v1.object_storage import ObjectStorageRelationProvider
+from package_cache import (
+    PackageCache,
+    PackageChecksumMismatchError,
+    is_installed,
+    sha256sum
+)
+from upgrade import ClusterUpgrade
+from hook_cache import HookCache
+from timing import HOOK_METRIC, PHASE_METRIC, HookTimer, hook_name
+from restart_queue import RestartQueue
+from scheduler import RestartScheduler
+from artifacts import ArtifactRenderer, fingerprint
+import restart_policy
+from admin import (
+    HEALTH_LIVE,
+    MinioAdmin,
+    MinioAdminCommandError,
+    wait_cert_served,
+    wait_healthy
+)
+from heal import RUNNING as HEAL_RUNNING, HealJob
+from disks import MinioDiskMapHelper
+import admin_config
+import api_limits
 
-from nrpe.client import NRPEClient
 from monitoring import PrometheusMonitorCluster, PrometheusMonitorNode
-from loadbalancer_interface import LBProvider
-
-
-DISK_LAYOUT = """- /data1:
-  - fs-type: ext4
-  - options: ''
-- /data2:
-  - fs-type: ext4
-  - options: ''
-- /data3:
-  - fs-type: ext4
-  - options: ''
-- /data4:
-  - fs-type: ext4
-  - options: ''
-- /data5:
-  - fs-type: ext4
-  - options: ''
-- /data6:
-  - fs-type: ext4
-  - options: ''
-- /data7:
-  - fs-type: ext4
-  - options: ''
-- /data8:
-  - fs-type: ext4
-  - options: ''
-- /data9:
-  - fs-type: ext4
-  - options: ''
-- /data10:
-  - fs-type: ext4
-  - options: ''
-- /data11:
-  - fs-type: ext4
-  - options: ''
-- /data12:
-  - fs-type: ext4
-  - options: ''
-- /data13:
-  - fs-type: ext4
-  - options: ''
-- /data14:
-  - fs-type: ext4
-  - options: ''
-- /data15:
-  - fs-type: ext4
-  - options: ''
-- /data16:
-  - fs-type: ext4
-  - options: ''
-- /data17:
-  - fs-type: ext4
-  - options: ''
-- /data18:
-  - fs-type: ext4
-  - options: ''
-- /data19:
-  - fs-type: ext4
-  - options: ''
-- /data20:
-  - fs-type: ext4
-  - options: ''
-- /data21:
-  - fs-type: ext4
-  - options: ''
-- /data22:
-  - fs-type: ext4
-  - options: ''
-- /data23:
-  - fs-type: ext4
-  - options: ''
-- /data24:
-  - fs-type: ext4
-  - options: ''
-- /data25:
-  - fs-type: ext4
-  - options: ''
-- /data26:
-  - fs-type: ext4
-  - options: ''
-- /data27:
-  - fs-type: ext4
-  - options: ''
-- /data28:
-  - fs-type: ext4
-  - options: ''
-- /data29:
-  - fs-type: ext4
-  - options: ''
-- /data30:
-  - fs-type: ext4
-  - options: ''
-- /data31:
-  - fs-type: ext4
-  - options: ''
-- /data32:
-  - fs-type: ext4
-  - options: ''"""
+
 
 logger = logging.getLogger(__name__)
 
@@ -190,6 +123,33 @@ CA_CERT_PATH = "/home/{}/.minio/certs/CAs/"
 CONFIG_ENV = "/etc/minio/"
 SVC_FILE = "/etc/systemd/system/minio.service"
 
+# Pairs of (resource name, config option) for each package to be installed.
+# The resource, if attached, takes precedence over the URL in the config.
+PACKAGES = [
+    ("minio-package", "package"),
+    ("mcli-package", "mcli-package"),
+]
+# Source of a package taken from an attached resource
+RESOURCE_SOURCE = "resource:"
+
+# Restarts kept for the restart-history action
+RESTART_HISTORY_LEN = 20
+
+# Hooks that need neither the load balancer nor the nrpe relations. They
+# run every few minutes on every unit, so they skip importing and setting
+# those up, unless an event deferred earlier refers to them.
+LIGHT_HOOKS = ["update-status"]
+
+# Names found on the paths of the events, and of their observers, of the
+# helpers that are not always built. ops drops a deferred event whose type
+# or observer is missing when it emits that event again.
+LB_AND_NRPE_PATHS = ["lb-provider", "lb_provider", "LBProvider",
+                     "nrpe-external-master", "nrpe_external_master",
+                     "NRPEClient"]
+CERTIFICATES_PATHS = ["TLSCertificateRequiresRelation"]
+PROMETHEUS_PATHS = ["PrometheusMonitorNode"]
+DISKS_PATHS = ["data_storage", "DiskMapHelper"]
+
 
 class MinioCharm(CharmBase):
     """Charm the Minio for Baremetal and VM."""
@@ -199,11 +159,33 @@ class MinioCharm(CharmBase):
 
     def __init__(self, *args):
         super().__init__(*args)
+        # Latency histograms of hooks and phases, see timing.py
+        self._stored.set_default(hook_timings="{}")
+        self.timer = HookTimer(json.loads(self._stored.hook_timings))
+        self.framework.observe(self.framework.on.pre_commit,
+                               self._on_framework_pre_commit)
         self.framework.observe(self.on.install, self._on_install)
         self.framework.observe(
             self.on.config_changed, self._on_config_changed)
         self.framework.observe(
             self.on.upgrade_action, self._on_upgrade_action)
+        self.framework.observe(
+            self.on.upgrade_status_action, self._on_upgrade_status_action)
+        self.framework.observe(
+            self.on.upgrade_abort_action, self._on_upgrade_abort_action)
+        self.framework.observe(
+            self.on.topology_action, self._on_topology_action)
+        self.framework.observe(
+            self.on.restart_history_action, self._on_restart_history_action)
+        self.framework.observe(
+            self.on.hook_timings_action, self._on_hook_timings_action)
+        self.framework.observe(
+            self.on.heal_status_action, self._on_heal_status_action)
+        self.framework.observe(
+            self.on.disk_profile_action, self._on_disk_profile_action)
+        self.framework.observe(
+            self.on.reformat_empty_disks_action,
+            self._on_reformat_empty_disks_action)
         self.framework.observe(
             self.on.cluster_relation_joined,
             self._on_cluster_relation_joined)
@@ -235,37 +217,133 @@ class MinioCharm(CharmBase):
         self.framework.observe(self.on.restart_event,
                                self._on_restart_event)
 
-        self.lb_provider = LBProvider(self, "lb-provider")
-        self.framework.observe(self.lb_provider.on.available,
-                               self._on_lb_provider_available)
-
-        self.nrpe = NRPEClient(self, 'nrpe-external-master')
-        self.framework.observe(self.nrpe.on.nrpe_available, self.on_nrpe_available)
+        self.lb_provider = None
+        self.nrpe = None
+        self._deferred = self._deferred_paths()
+        if hook_name() not in LIGHT_HOOKS or \
+           self._has_deferred(LB_AND_NRPE_PATHS):
+            self._observe_lb_and_nrpe()
 
         self.framework.observe(self.on.update_status,
                                self.on_update_status)
         self.minio = ObjectStorageRelationProvider(self, "object-storage")
-        self.cluster = MinioClusterManager(self, "cluster", None, "data")
-        self.certificates = \
-            TLSCertificateRequiresRelation(self, 'certificates')
+        # Relation data, config and certificates read once per hook
+        self.hook_cache = HookCache()
+        self.framework.observe(self.framework.on.commit,
+                               self._on_framework_commit)
+        self.cluster = MinioClusterManager(
+            self, "cluster", None, "data", cache=self.hook_cache)
+        # Helpers below are only built once a hook uses them
+        self._certificates = None
         self._stored.set_default(package="")
         self._stored.set_default(ctx="{}")
+        self._stored.set_default(fingerprints={})
+        self.renderer = ArtifactRenderer(self._stored.fingerprints)
         self._stored.set_default(need_restart=False)
+        # Scope of the pending restart, as classified by restart_policy
+        self._stored.set_default(restart_scope=restart_policy.NONE)
         self.services = ["minio"]
         self._stored.set_default(minio_root_pwd=genRandomPassword())
-        self.prometheus = \
-            PrometheusMonitorNode(self, 'prometheus-manual')
+        self._prometheus = None
         # DiskMapHelper expects a map of folder names and equivalent
         # mounting options to be used for the disks mounted via juju
         # storage. Given we need some previsiblity on the naming of those
-        # disks, the charm itself will set 32 different mount names.
-
-        # Implements disk-related logic
-        self._stored.set_default(disks=DISK_LAYOUT)
-        self.disks = DiskMapHelper(
-            self, self._stored.disks, "data",
-            self.config["user"], self.config["group"])
+        # disks, the charm itself will set 32 different mount names, see
+        # disks.py.
+        self._disks = None
         self._stored.set_default(port=-1)
+        self.package_cache = PackageCache()
+        self.upgrade = ClusterUpgrade(
+            self, self.cluster,
+            phase_timeout=self.config["upgrade-timeout"])
+        # Context to be saved once a batched restart happens
+        self._stored.set_default(pending_ctx="{}")
+        # Last restarts of this unit and, on the leader, of the cluster
+        self._stored.set_default(restart_history="[]")
+        # Digest of the cluster application data last acted upon
+        self._stored.set_default(cluster_generation="")
+        # When the leader started waiting for the expected units
+        self._stored.set_default(bootstrap_started=0)
+        # Fingerprint of the admin-config the leader last applied
+        self._stored.set_default(admin_config_applied="")
+        # Background heal started by this unit, see heal.py
+        self._stored.set_default(heal_started=0)
+        self._stored.set_default(heal_progress="{}")
+        # Heal that could not start, retried on update-status
+        self._stored.set_default(heal_pending=False)
+        # Restarts waiting to run on this unit, see restart_queue.py
+        self._stored.set_default(restart_queue="[]")
+        self.restart_queue = RestartQueue(
+            self._stored.restart_queue,
+            cap=self.config["restart-backoff-cap"])
+        self.restarts = RestartScheduler(
+            self, self.cluster,
+            max_batch=max(self.config["restart-batch-size"], 0),
+            ready_timeout=self.config["restart-ready-timeout"])
+        # Lazy helpers observe their events before deferred ones are
+        # emitted again, which happens right after this __init__
+        if self._has_deferred(CERTIFICATES_PATHS):
+            self.certificates
+        if self._has_deferred(PROMETHEUS_PATHS):
+            self.prometheus
+        if self._has_deferred(DISKS_PATHS):
+            self.disks
+        self._account_startup()
+
+    def _deferred_paths(self):
+        """Returns the event and observer paths of the deferred events."""
+        return ["{} {}".format(event_path, observer_path)
+                for event_path, observer_path, _ in
+                self.framework._storage.notices(None)]
+
+    def _has_deferred(self, names):
+        return any(n in p for p in self._deferred for n in names)
+
+    def _observe_lb_and_nrpe(self):
+        from loadbalancer_interface import LBProvider
+        from nrpe.client import NRPEClient
+        self.lb_provider = LBProvider(self, "lb-provider")
+        self.framework.observe(self.lb_provider.on.available,
+                               self._on_lb_provider_available)
+
+        self.nrpe = NRPEClient(self, 'nrpe-external-master')
+        self.framework.observe(self.nrpe.on.nrpe_available, self.on_nrpe_available)
+
+    def _account_startup(self):
+        """Accounts the imports and the setup of the charm as the startup
+        phase, once per process: Harness builds several charms in one."""
+        global STARTED
+        if STARTED is None:
+            return
+        took = time.monotonic() - STARTED
+        STARTED = None
+        logger.debug("Charm started in {:.3f}s".format(took))
+        self.timer.observe(PHASE_METRIC, "startup", took)
+
+    @property
+    def certificates(self):
+        if self._certificates is None:
+            self._certificates = \
+                TLSCertificateRequiresRelation(self, 'certificates')
+        return self._certificates
+
+    @property
+    def prometheus(self):
+        if self._prometheus is None:
+            self._prometheus = \
+                PrometheusMonitorNode(self, 'prometheus-manual')
+        return self._prometheus
+
+    @property
+    def disks(self):
+        """Implements disk-related logic."""
+        if self._disks is None:
+            self._disks = MinioDiskMapHelper(
+                self, "data", self.config["user"], self.config["group"],
+                fs_type=self.config["disk-fs-type"],
+                mkfs_options=self.config["disk-mkfs-options"],
+                mount_options=self.config["disk-mount-options"])
+        return self._disks
 
     def _on_lb_provider_available(self, event):
         if not (self.unit.is_leader() and self.lb_provider.is_available):
@@ -295,19 +373,206 @@ class MinioCharm(CharmBase):
             # We can drop any other restart events that were stacked and
             # waiting for processing.
             return
+        start = time.time()
         if event.restart():
+            took = self._record_unit_restart(restart_policy.ROLLING, start)
             # Restart was successful, if the charm is keeping track
-            # of a context, that is the place it should be updated
-            self._stored.ctx = event.ctx
+            # of a context, that is the place it should be updated.
+            # Requests merged meanwhile carry the latest context.
+            entries = self.restart_queue.scheduled(restart_policy.ROLLING)
+            ctx = entries[0]["ctx"] if entries else event.ctx
+            self._stored.ctx = ctx if isinstance(ctx, str) \
+                else json.dumps(ctx)
             # Toggle need_restart as we just did it.
             self._stored.need_restart = False
-            self.model.unit.status = \
-                ActiveStatus("service running")
+            self._stored.restart_scope = restart_policy.NONE
+            self._restart_finished([e["services"] for e in entries], took)
         else:
             # defer the RestartEvent as it is still waiting for the
             # lock to be released.
             event.defer()
 
+    def _request_restart(self, ctx, services):
+        """Requests a restart of services to apply ctx.
+
+        The strategy comes from restart-strategy or, if "auto", from the
+        scope of the change, see restart_policy.choose_strategy. Rolling
+        restarts go one unit at a time, as the coordinator lock allows.
+        Batched and simultaneous restarts are scheduled by the leader, see
+        scheduler.py, once self.restarts.process() runs.
+
+        A request for services that already wait for a restart is merged
+        into it, and a restart that failed waits for its backoff, see
+        restart_queue.py.
+        """
+        if isinstance(ctx, str):
+            ctx = json.loads(ctx)
+        strategy = self._restart_strategy()
+        entry = self.restart_queue.entry(services)
+        changed = entry is not None and entry["ctx"] != ctx
+        if self.restart_queue.push(services, ctx, strategy=strategy):
+            self._start_restart(ctx, services, strategy)
+        elif changed and entry["scheduled"] and \
+                entry["strategy"] != restart_policy.ROLLING:
+            # The leader must schedule the new context. An outstanding
+            # rolling restart applies the queue's context instead.
+            self._start_restart(ctx, services, entry["strategy"])
+        else:
+            logger.info("Restart of {} merged into the queue, {}".format(
+                services, self.restart_queue.summary()))
+
+    def _restart_strategy(self):
+        strategy = restart_policy.choose_strategy(
+            # Services found down have no scope, restarting is enough
+            max(self._stored.restart_scope, restart_policy.UNIT),
+            self.config["restart-strategy"],
+            self.config["restart-batch-size"])
+        if not self.cluster.relation:
+            return restart_policy.ROLLING
+        return strategy
+
+    def _start_restart(self, ctx, services, strategy):
+        logger.info("Restart strategy: {}".format(strategy))
+        if strategy == restart_policy.ROLLING:
+            self.on.restart_event.emit(ctx, services=services)
+            return
+        self._stored.pending_ctx = json.dumps(ctx)
+        self.restarts.request(
+            services, strategy=strategy,
+            config=restart_policy.cluster_fingerprint(ctx))
+
+    def _retry_restarts(self):
+        """Starts again the restarts whose backoff is over."""
+        strategy = self._restart_strategy()
+        for e in self.restart_queue.due(strategy):
+            logger.info("Retrying restart of {}".format(e["services"]))
+            self._stored.need_restart = True
+            self._start_restart(e["ctx"], e["services"], strategy)
+
+    def _restart_finished(self, services_list, took):
+        """Drops the restarted entries from the queue or, if minio did
+        not come back, retries them after their backoff."""
+        for services in services_list:
+            if took is None:
+                self.restart_queue.failed(services)
+            else:
+                self.restart_queue.done(services)
+        if took is None:
+            self.model.unit.status = BlockedStatus(self._with_restart_queue(
+                "Service did not come back after restart"))
+        else:
+            self.model.unit.status = \
+                ActiveStatus("service running")
+
+    def _with_restart_queue(self, msg):
+        """Appends the state of the restart queue to a status message."""
+        summary = self.restart_queue.summary()
+        return "{} ({})".format(msg, summary) if summary else msg
+
+    def restart_services(self, services, strategy=restart_policy.BATCHED):
+        """Restarts services once the batch of this unit is scheduled."""
+        start = time.time()
+        for svc in services:
+            service_restart(svc)
+        took = self._record_unit_restart(strategy, start)
+        self._stored.ctx = self._stored.pending_ctx
+        self._stored.need_restart = False
+        self._stored.restart_scope = restart_policy.NONE
+        self._restart_finished([services], took)
+
+    def _record_unit_restart(self, strategy, start):
+        """Records how long this unit was unavailable after a restart.
+
+        Returns the seconds minio took to come back, None if it did not.
+        """
+        took = wait_healthy(self.minio_url(), path=HEALTH_LIVE,
+                            timeout=self.config["restart-ready-timeout"],
+                            ca_path=self.ca_cert_path())
+        self.record_restart({
+            "strategy": strategy,
+            "scope": restart_policy.SCOPE_NAMES[self._stored.restart_scope],
+            "units": [self.unit.name],
+            "started": start,
+            "unavailable":
+                None if took is None else round(time.time() - start, 3)})
+        return took
+
+    def record_restart(self, entry):
+        """Keeps the last RESTART_HISTORY_LEN restarts."""
+        history = json.loads(self._stored.restart_history)
+        history.append(entry)
+        self._stored.restart_history = json.dumps(
+            history[-RESTART_HISTORY_LEN:])
+        logger.info("Restart recorded: {}".format(entry))
+
+    def _on_restart_history_action(self, event):
+        history = json.loads(self._stored.restart_history)
+        # Action results only accept strings as leaves
+        event.set_results({
+            "restarts": {str(i): json.dumps(e)
+                         for i, e in enumerate(reversed(history))}})
+
+    def _on_hook_timings_action(self, event):
+        results = {}
+        for key, metric in [("hooks", HOOK_METRIC), ("phases", PHASE_METRIC)]:
+            # Action keys only accept lowercase letters, digits and dashes
+            results[key] = {
+                label.replace("_", "-"): "count={} mean={:.3f}s".format(
+                    h["count"], h["sum"] / h["count"])
+                for label, h in self.timer.histograms[metric].items()
+                if h["count"]}
+        event.set_results(results)
+
+    def _on_disk_profile_action(self, event):
+        # Action results only accept strings as leaves
+        event.set_results({
+            folder.strip("/"): {k: str(v) for k, v in r.items()}
+            for folder, r in self.disks.report().items()})
+
+    def _on_reformat_empty_disks_action(self, event):
+        dry_run = event.params.get("dry-run", True)
+        try:
+            folders = self.disks.reformat_empty(dry_run=dry_run)
+        except (OSError, subprocess.CalledProcessError) as e:
+            event.fail("Reformat failed: {}".format(e))
+            return
+        if folders and not dry_run:
+            set_folders_and_permissions(
+                folders, self.config["user"], self.config["group"])
+        event.set_results({
+            "dry-run": str(dry_run),
+            "reformatted": ",".join(folders)})
+
+    def standard_parity(self):
+        """Parity of the STANDARD storage class, if set, or None."""
+        return self._parity("standard-parity", "MINIO_STORAGE_CLASS_STANDARD")
+
+    def rrs_parity(self):
+        """Parity of the RRS storage class, if set, or None."""
+        return self._parity("rrs-parity", "MINIO_STORAGE_CLASS_RRS")
+
+    def _parity(self, option, env_key):
+        return self.hook_cache.get(
+            option, lambda: self._read_parity(option, env_key))
+
+    def _read_parity(self, option, env_key):
+        # The option takes precedence over minio_env_extra_opts
+        if self.config[option] >= 0:
+            return self.config[option]
+        return parse_parity(self._extra_opts().get(env_key))
+
+    def _extra_opts(self):
+        """minio_env_extra_opts, parsed once per hook. Do not change it."""
+        return self.hook_cache.get(
+            "minio_env_extra_opts",
+            lambda: yaml.safe_load(
+                self.config.get("minio_env_extra_opts", "")) or {})
+
+    def _topologies(self):
+        """Erasure layout of each pool, with the configured parities."""
+        return self.cluster.topologies(
+            parity=self.standard_parity(), rrs_parity=self.rrs_parity())
+
     def on_nrpe_available(self, event):
         check_name = "check_{}".format(
             self.model.unit.name.replace("/", "_"))
@@ -321,17 +586,31 @@ class MinioCharm(CharmBase):
         # Save all new checks to filesystem and to Nagios
         self.nrpe.commit()
 
+    def _request_prometheus_cluster(self):
+        """Leader submits the cluster-wide entries for prometheus."""
+        endpoint = self.minio.hostname or None
+        p = PrometheusMonitorCluster(self, 'prometheus-manual')
+        p.request(
+            self.config["prometheus_port"],
+            metrics_path=self.config["prometheus_metrics_path"],
+            endpoint=endpoint,
+            ca_cert=self.get_ssl_cacert()
+            if len(self.get_ssl_cacert()) > 0 else None,
+            hook_metrics_targets=self._hook_metrics_targets())
+
+    def _hook_metrics_targets(self):
+        """node-exporter endpoints of all units, exporting hook latency."""
+        port = self.config["node-exporter-port"]
+        if not port or not self.config["textfile-collector-dir"]:
+            return []
+        hosts = [self.minio.hostname]
+        hosts.extend(urlparse(e["url"]).hostname
+                     for e in self.cluster.peer_endpoints().values())
+        return ["{}:{}".format(h, port) for h in hosts if h]
+
     def _on_prometheus_relation_joined(self, event):
         if self.unit.is_leader():
-            # The leader submit the cluster-wide entry for prometheus
-            endpoint = self.minio.hostname or None
-            p = PrometheusMonitorCluster(self, 'prometheus-manual')
-            p.request(
-                self.config["prometheus_port"],
-                metrics_path=self.config["prometheus_metrics_path"],
-                endpoint=endpoint,
-                ca_cert=self.get_ssl_cacert()
-                if len(self.get_ssl_cacert()) > 0 else None)
+            self._request_prometheus_cluster()
         # Every node should submit a "node" entry for prometheus
         endpoint = self.minio.hostname or None
         self.prometheus.request(
@@ -350,6 +629,9 @@ class MinioCharm(CharmBase):
         self._on_config_changed(event)
 
     def _on_certificates_relation_changed(self, event):
+        # New certificates may have arrived
+        self.hook_cache.invalidate("ssl_cert")
+        self.hook_cache.invalidate("ssl_key")
         self._on_config_changed(event)
 
     def on_update_status(self, event):
@@ -373,6 +655,18 @@ class MinioCharm(CharmBase):
             coordinator = OpsCoordinator()
             coordinator.resume()
             coordinator.release()
+        # Retry any batched restart held waiting for a unit to be ready
+        # and the restarts whose backoff is over
+        self._retry_restarts()
+        self.restarts.process()
+        # Leader fails an upgrade stuck on a unit past upgrade-timeout
+        self.upgrade.process()
+        # Bootstrap settle timeout may have expired with no other hook
+        # to notice it
+        if self.unit.is_leader() and self._stored.bootstrap_started and \
+           not self.cluster.pools:
+            self._on_config_changed(event)
+            return
 
         # 1) Check if unit is not already blocked, if so keep the status
         if isinstance(self.model.unit.status, MaintenanceStatus):
@@ -400,8 +694,20 @@ class MinioCharm(CharmBase):
         # 3) Check self.services status: which are running
         svc_list = [s for s in self.services if not service_running(s)]
         if len(svc_list) == 0:
+            # Leader retries admin-config if mcli failed earlier
+            error = self._apply_admin_config()
+            if error:
+                self.model.unit.status = BlockedStatus(error)
+                return
+            if self._stored.heal_pending:
+                error = self._start_heal()
+                if error:
+                    self.model.unit.status = BlockedStatus(error)
+                    return
             self.model.unit.status = \
-                ActiveStatus("{} running".format(self.services))
+                ActiveStatus("{} running{}{}".format(
+                    self.services, self._topology_summary(),
+                    self._heal_summary()))
             # The status is not in Maintenance and we can see the service
             # is up, therefore we can switch to Active.
             return
@@ -412,11 +718,12 @@ class MinioCharm(CharmBase):
         logger.warn(
             "Found services {} not running, requesting restart".format(
                 svc_list))
-        self.on.restart_event.emit(self._stored.ctx, services=svc_list)
+        self._request_restart(self._stored.ctx, svc_list)
         self._stored.need_restart = True
-        self.model.unit.status = \
-            BlockedStatus("(Wait Restart) Services not running that"
-                          " should be: {}".format(",".join(svc_list)))
+        self.model.unit.status = BlockedStatus(self._with_restart_queue(
+            "(Wait Restart) Services not running that should be: {}".format(
+                ",".join(svc_list))))
+        self.restarts.process()
 
     @property
     def ctx(self):
@@ -442,18 +749,148 @@ class MinioCharm(CharmBase):
            not self.cluster.ack_peer_restablished:
             # Yes, now, if auto-heal is set, run the process or log it
             if self.config["auto-heal"]:
-                cmd = ["mc", "admin", "heal", "-r",
-                       self.minio.hostname + "/"]
-                logger.info("auto-heal procedure ran, output: {}".format(
-                    subprocess.check_output(cmd)))
+                # Heal runs for hours on large clusters, not in the hook
+                error = self._start_heal()
+                if error:
+                    self.model.unit.status = BlockedStatus(error)
             else:
                 logger.warn("peers are gone but auto-heal disabled"
                             " ignoring...")
             self.cluster.ack_peer_restablished = True
 
+    def _start_heal(self):
+        """Starts a heal of the cluster in the background, see heal.py.
+
+        Returns the error to be shown on the status, or "". A heal that
+        could not start is retried on update-status.
+        """
+        job = HealJob(self.minio_admin())
+        try:
+            job.throttle(self.config["heal-max-sleep"],
+                         self.config["heal-max-io"])
+        except (MinioAdminCommandError, OSError) as e:
+            logger.warning("Could not set the heal speed: {}".format(e))
+        try:
+            started = job.start()
+        except (OSError, subprocess.CalledProcessError) as e:
+            logger.error("Could not start the heal: {}".format(e))
+            self._stored.heal_pending = True
+            return "Heal could not start, retrying: {}".format(e)
+        self._stored.heal_pending = False
+        if started:
+            self._stored.heal_started = time.time()
+            self._stored.heal_progress = "{}"
+        return ""
+
+    def _heal_status(self):
+        """Returns the state and progress of the last heal, or None if
+        this unit never started one."""
+        if not self._stored.heal_started:
+            return None
+        job = HealJob(self.minio_admin())
+        progress = job.progress(json.loads(self._stored.heal_progress))
+        self._stored.heal_progress = json.dumps(progress)
+        status = {k: v for k, v in progress.items() if k != "offset"}
+        try:
+            status["state"] = job.state()
+        except (OSError, subprocess.CalledProcessError) as e:
+            logger.warning("Could not check the heal job: {}".format(e))
+            status["state"] = "unknown"
+        status["started"] = self._stored.heal_started
+        return status
+
+    def _publish_api_limits(self):
+        """Publishes the api limits sized from this unit's resources."""
+        basis = api_limits.host_resources()
+        basis["drives"] = len(self.disks.used_folders())
+        self.cluster.set_api_limits({
+            "limits": api_limits.compute_limits(
+                basis["ram"], basis["cpus"], basis["drives"]),
+            "basis": basis})
+
+    def _settle_admin_config(self):
+        """Returns admin-config plus, if auto-api-limits is set, the api
+        limits safe for every unit, which the leader publishes.
+
+        Keys set on admin-config take precedence over the computed ones.
+        """
+        config = admin_config.parse_admin_config(self.config["admin-config"])
+        if not self.config["auto-api-limits"]:
+            return config
+        docs = self.cluster.unit_api_limits()
+        limits = api_limits.merge_limits(
+            {u: d.get("limits") for u, d in docs.items()})
+        if limits is None:
+            return config
+        api = api_limits.api_config(limits)
+        api.update(config.get("api", {}))
+        config["api"] = api
+        self.cluster.api_limits = {
+            "api": api,
+            "units": {u: d.get("basis", {}) for u, d in docs.items()}}
+        return config
+
+    def _apply_admin_config(self):
+        """Leader sets admin-config on the running cluster, see
+        admin_config.py.
+
+        Returns the error to be shown on the status, or "".
+        """
+        if not self.unit.is_leader():
+            return ""
+        try:
+            config = self._settle_admin_config()
+        except admin_config.MinioInvalidAdminConfig as e:
+            return str(e)
+        fp = admin_config.fingerprint(config)
+        if fp == self._stored.admin_config_applied:
+            return ""
+        try:
+            mismatches = admin_config.apply_admin_config(
+                self.minio_admin(), config)
+        except MinioAdminCommandError as e:
+            # Cluster may not be serving yet, retried on update-status
+            logger.warning("Could not apply admin-config: {}".format(e))
+            return ""
+        if mismatches:
+            return "admin-config not applied: {}".format(
+                ", ".join(sorted(mismatches)))
+        self._stored.admin_config_applied = fp
+        return ""
+
+    def _heal_summary(self):
+        """Returns the heal progress to be added to the status."""
+        status = self._heal_status()
+        if not status or status["state"] != HEAL_RUNNING:
+            return ""
+        return ", healing: {} scanned, {} healed, {} remaining".format(
+            status.get("scanned", 0), status.get("healed", 0),
+            status.get("remaining", 0))
+
+    def _on_heal_status_action(self, event):
+        status = self._heal_status()
+        if status is None:
+            event.set_results({"state": "not-started"})
+            return
+        # Action results only accept strings as leaves
+        event.set_results({k: str(v) for k, v in status.items()})
+
     def _on_cluster_relation_changed(self, event):
         self.cluster.relation_changed(event)
-        self._on_config_changed(event)
+        self.cluster.publish_topology()
+        # Move forward any coordinated upgrade before the config
+        self.upgrade.process()
+        self.restarts.process()
+        generation = self.cluster.generation()
+        if self.cluster.topology_doc and \
+           generation == self._stored.cluster_generation:
+            # Peers' data reaches this unit through the leader's topology
+            # document: nothing this unit acts upon has changed.
+            logger.debug("Cluster generation {} unchanged, skipping".format(
+                self.cluster.topology_doc["gen"]))
+        else:
+            self._stored.cluster_generation = generation
+            self._on_config_changed(event)
 
         # The leader should account for peers that were gone
         if not self.unit.is_leader():
@@ -496,36 +933,254 @@ class MinioCharm(CharmBase):
         self._on_config_changed(event)
 
     def _on_upgrade_action(self, event):
-        self._do_install_or_upgrade()
+        if event.params.get("coordinated", False):
+            if not self.unit.is_leader() or not self.cluster.relation:
+                event.fail("Coordinated upgrades must run on the leader "
+                           "of a cluster")
+                return
+            if self.upgrade.in_progress:
+                event.fail("Upgrade already in progress")
+                return
+            doc = self.upgrade.start(self._package_sources())
+            event.set_results({
+                "id": doc["id"],
+                "phase": doc["phase"],
+                "message": "Run upgrade-status to follow the upgrade"})
+            if not self.upgrade.in_progress:
+                # Done or failed within this hook, e.g. a single unit:
+                # no relation-changed will come to clear the status
+                self._on_config_changed(event)
+            return
+        if not self._do_install_or_upgrade():
+            event.fail("Installation of minio packages failed, "
+                       "check the unit logs")
+
+    def _on_upgrade_status_action(self, event):
+        doc = self.upgrade.status()
+        if not doc.get("id"):
+            event.set_results({"phase": "none"})
+            return
+        event.set_results({
+            "id": doc["id"],
+            "phase": doc["phase"],
+            "message": doc.get("message", ""),
+            # Action results only accept strings as leaves
+            "timings": {k: "{:.1f}s".format(v)
+                        for k, v in doc["timings"].items()},
+            "units": {u.replace("/", "-"): json.dumps(st)
+                      for u, st in doc["units"].items()}})
+
+    def _on_upgrade_abort_action(self, event):
+        if not self.unit.is_leader():
+            event.fail("Upgrades can only be aborted on the leader")
+            return
+        if not self.upgrade.abort():
+            event.fail("No upgrade in progress")
+            return
+        event.set_results({"phase": self.cluster.upgrade["phase"]})
+        # The leader does not get relation-changed for its own writes
+        self._on_config_changed(event)
+
+    def _package_sources(self):
+        """Returns the (source, sha256) pairs of the packages.
+
+        An attached resource is used first, as "resource:<name>" and the
+        digest of its file. Otherwise, the URL and *-sha256 options set in
+        the config, sha256 may be empty.
+        """
+        sources = []
+        for resource, opt in PACKAGES:
+            path = self._get_resource(resource)
+            if path:
+                sources.append((RESOURCE_SOURCE + resource, sha256sum(path)))
+            else:
+                sources.append((self.config.get(opt, ""),
+                                self.config.get(opt + "-sha256", "")))
+        return sources
+
+    def fetch_packages(self, sources):
+        """Returns the local paths of the sources, in the same order.
+
+        Resources are read from Juju, URLs are fetched concurrently into
+        the package cache. Both are checked against their sha256, if set.
+
+        Raises:
+            PackageChecksumMismatchError, subprocess.CalledProcessError
+        """
+        paths = {}
+        to_fetch = []
+        for source, sha256 in sources:
+            if not source.startswith(RESOURCE_SOURCE):
+                to_fetch.append((source, sha256))
+                continue
+            resource = source[len(RESOURCE_SOURCE):]
+            path = self._get_resource(resource)
+            found = sha256sum(path) if path else "missing"
+            if sha256 and sha256 != found:
+                raise PackageChecksumMismatchError(source, sha256, found)
+            logger.info("Using resource {}".format(resource))
+            paths[source] = path
+        paths.update(zip([s for s, _ in to_fetch],
+                         self.package_cache.fetch_all(to_fetch)))
+        return [paths[s] for s, _ in sources]
+
+    def mark_package_installed(self):
+        """Records the package config as the one installed."""
+        self._stored.package = self.config.get("package", "")
+
+    def _get_resource(self, name):
+        """Returns the path of the resource name or None if not attached.
+
+        Juju attaches an empty file when no resource has been uploaded,
+        treat that case as if the resource was not there.
+        """
+        try:
+            path = self.model.resources.fetch(name)
+        except (ModelError, NameError):
+            return None
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return None
+        return str(path)
+
+    def _install_deb(self, path):
+        """Installs the .deb at path, unless that version is already there.
+
+        apt is only needed if dpkg could not resolve dependencies of the
+        package, in which case apt-get finishes the installation.
+        """
+        if is_installed(path):
+            logger.info("{} already installed, skipping".format(path))
+            return
+        try:
+            subprocess.check_output(["dpkg", "-i", path])
+        except subprocess.CalledProcessError:
+            logger.warning("dpkg failed for {}, fixing dependencies "
+                           "with apt".format(path))
+            apt_update(fatal=True)
+            subprocess.check_output(
+                ["apt-get", "install", "-f", "-y"])
+
+    def _on_topology_action(self, event):
+        try:
+            topologies = self._topologies()
+        except MinioClusterInvalidTopology as e:
+            event.fail(str(e))
+            return
+        event.set_results({
+            "pool-{}".format(i): {k: str(v) for k, v in t.to_dict().items()}
+            for i, t in enumerate(topologies)})
 
     def _do_install_or_upgrade(self):
-        """Runs the install or upgrade of the minio and nginx packages."""
-        # apt upate before starting the package install/upgrades
-        apt_update()
-        # minio install/upgrade
+        """Runs the install or upgrade of the minio and mcli packages.
+
+        Packages come from the Juju resources if attached, otherwise the
+        URLs set in the config are fetched concurrently into the local
+        package cache, checked against the optional *-sha256 options and
+        only then installed.
+        """
         try:
-            for p in [self.config.get("package", ""),
-                      self.config.get("mcli-package", "")]:
-                subprocess.check_output([
-                    "wget", p,
-                    "-O", "/tmp/minio.deb"
-                ])
-                subprocess.check_output([
-                    "dpkg", "-i", "/tmp/minio.deb"
-                ])
-        except subprocess.CalledProcessError as e:
-            logger.error("Installation of minio packages failed with {}".format(str(e)))
-        self._stored.package = self.config.get("package", "")
+            for p in self.fetch_packages(self._package_sources()):
+                self._install_deb(p)
+        except (subprocess.CalledProcessError,
+                PackageChecksumMismatchError) as e:
+            logger.error("Installation of minio packages failed "
+                         "with {}".format(str(e)))
+            return False
+        self.mark_package_installed()
+        return True
 
-    def _check_if_need_restart(self, ctx):
-        # ctx can be a string or dict, then check and convert accordingly
-        c = json.dumps(ctx) if isinstance(ctx, dict) else ctx
-        if c == self._stored.ctx:
-            logger.debug("Current state: {}, saved state: {}".format(
-                c, self._stored.ctx))
+    def _check_if_need_restart(self, ctx, changes):
+        """Classifies the differences between the saved and new contexts.
+
+        Returns True if the service must be restarted. If the changes can
+        be applied live, or need nothing, the new context is saved right
+        away, unless a restart is already pending and will save it.
+
+        The saved context is the one minio runs with. It is compared even
+        if no artifact was rewritten: a hook that wrote the files and then
+        failed is retried with the stored state rolled back, and finds the
+        files already up to date while minio still runs the old ones.
+
+        Args:
+            ctx: new context
+            changes: list of the artifacts changed by self.renderer
+        """
+        if not changes and not self.ctx:
+            # Nothing recorded yet, e.g. stored state older than the
+            # context: take what is on disk as what is running
+            logger.debug("No artifacts changed, no restart needed")
+            if not self._stored.need_restart:
+                self.ctx = ctx
+            return False
+        scope, details = restart_policy.classify(self.ctx, ctx)
+        if scope == restart_policy.NONE:
+            logger.debug("No context changes, no restart needed")
+            if not self._stored.need_restart:
+                self.ctx = ctx
+            return False
+        if not changes:
+            logger.warning("Artifacts already up to date but not applied, "
+                           "a previous hook did not finish")
+        logger.info("Artifacts changed: {}, context changes: {}, "
+                    "scope: {}".format(changes, details,
+                                       restart_policy.SCOPE_NAMES[scope]))
+        # Only the certificates are applied live
+        if scope == restart_policy.LIVE and ctx.get("cert_data") and \
+           not self._cert_reloaded():
+            # minio did not pick the new certificate, fallback to restart
+            scope = restart_policy.UNIT
+        if scope >= restart_policy.UNIT:
+            self._stored.restart_scope = max(
+                scope, self._stored.restart_scope)
+            return True
+        if not self._stored.need_restart:
+            self.ctx = ctx
+        return False
+
+    def _cert_reloaded(self):
+        """Checks, with a TLS handshake, if minio serves the new cert.
+
+        minio watches its certs folder and reloads the certificates once
+        they change. If the service is not running, there is nothing to
+        reload: it will use the new certificates once started.
+        """
+        if not self.service_running():
+            return True
+        took = wait_cert_served(
+            "127.0.0.1", self.config["minio-service-port"],
+            _break_crt_chain(self.get_ssl_cert())[0],
+            server_name=self.minio.hostname,
+            timeout=self.config["tls-reload-timeout"])
+        if took is None:
+            logger.warning("New certificate not served after {}s, "
+                           "restart needed".format(
+                               self.config["tls-reload-timeout"]))
             return False
+        logger.info("New certificate served after {:.1f}s".format(took))
         return True
 
+    def _min_disk_size(self):
+        """Size, in bytes, of the smallest disk mounted for minio."""
+        sizes = []
+        for f in self.disks.used_folders():
+            try:
+                st = os.statvfs(f)
+            except OSError:
+                continue
+            sizes.append(st.f_blocks * st.f_frsize)
+        return min(sizes) if sizes else 0
+
+    def _topology_summary(self):
+        """Returns the erasure layout summary to be added to the status."""
+        try:
+            topologies = self._topologies()
+        except MinioClusterInvalidTopology:
+            return ""
+        if len(topologies) == 1:
+            return ", " + topologies[0].summary()
+        return ", {} pools: {}".format(
+            len(topologies), "; ".join(t.summary() for t in topologies))
+
     def service_running(self):
         for s in self.services:
             if not service_running(s):
@@ -538,32 +1193,53 @@ class MinioCharm(CharmBase):
         1.1) Address user/group setup and disks
         2) Check if we can do a config change or are we waiting for sth:
         2.1) Check certificates
-        2.2) Ensure cluster relation has the correct URL and volumes
+        2.2) Ensure cluster relation has the correct URL and volumes,
+             leader publishes the topology document
         2.3) Check if cluster relation is ready if min-units > 1
         2.3.1) If min-units > 1: check if password available on cluster
+        2.4) Place units into server pools, wait if not placed yet
         3) Initiate context
         4) Generate the environment file for Minio
         5) Restart strategy
         5.1) Check if this is an InstallEvent call, if yes,
              just restart the service
+        5.2) Leader refreshes the prometheus cluster jobs
         6) Open ports
+
+        Each step is timed as a phase, see timing.py.
         """
 
+        try:
+            self._config_changed(event)
+        finally:
+            self.timer.stop()
+
+    def _config_changed(self, event):
         use_certificates = False
         # 1) Treat the case where we are in the middle of an upgrade
+        self.timer.phase("upgrade_check")
+        if self.upgrade.in_progress:
+            # Coordinated upgrade restarts the cluster once it is done
+            self.model.unit.status = BlockedStatus(
+                "coordinated upgrade in progress...")
+            return
         if self._stored.package != self.config["package"]:
             # Operator specified a new package, upgrade time
             # This if should block the application until the operator
             # runs the action to do the upgrade or if automatic-upgrade
             # is true.
             if self.config.get("automatic-upgrade", False):
-                self._do_install_or_upgrade(self.config["package"])
+                if not self._do_install_or_upgrade():
+                    self.model.unit.status = BlockedStatus(
+                        "package upgrade failed, check the logs")
+                    return
             else:
                 self.model.unit.status = BlockedStatus(
                     "package config changed: waiting for upgrade action...")
                 return
         # 1.1) Address user/group setup and disks
         # Create user and group if they do not exist already
+        self.timer.phase("user_group")
         try:
             groupAdd(self.config["group"], system=True)
         except LinuxGroupAlreadyExistsError:
@@ -572,9 +1248,11 @@ class MinioCharm(CharmBase):
             userAdd(self.config["user"], group=self.config["group"])
         except LinuxUserAlreadyExistsError:
             pass
+        self.timer.phase("attach_disks")
         self.disks.attach_disks()
         # 2) Check if we can do a config change or waiting for sth
         # 2.1) Check certificates
+        self.timer.phase("certificates")
         if self.certificates.relation or \
            (len(self.config.get("ssl_cert", "")) > 0 and
             len(self.config.get("ssl_key", "")) > 0): # noqa
@@ -587,11 +1265,14 @@ class MinioCharm(CharmBase):
             if not self._cert_relation_set(event, self.minio):
                 return
         # 2.2) Ensure cluster relation has the correct URL for this unit
+        self.timer.phase("cluster_ready")
         if self.cluster.relations:
-            self.cluster.url = "{}://{}:{}".format(
-                "https" if len(self.get_ssl_cert()) > 0 else "http",
-                self.minio.hostname, self.config["minio-service-port"])
+            self.cluster.url = self.minio_url()
             self.cluster.used_folders = self.disks.used_folders()
+            self.cluster.disk_size = self._min_disk_size()
+            self._publish_api_limits()
+            # Leader gathers the data of all units, see cluster.py
+            self.cluster.publish_topology()
         # 2.3) Check cluster relation readiness
         try:
             if self.config["min-units"] > 1:
@@ -600,7 +1281,7 @@ class MinioCharm(CharmBase):
                         "Waiting for peers")
                     # No need to defer this event
                     return
-        except MinioClusterNumDisksMustBeDivisibleBy4 as e:
+        except MinioClusterInvalidTopology as e:
             self.model.unit.status = BlockedStatus(str(e))
             # Operator must do a change, which will retrigger this logic
             # No need to defer this event
@@ -608,14 +1289,50 @@ class MinioCharm(CharmBase):
         # 2.3.1) If min-units > 1: check if password available on cluster
         if not self.unit.is_leader():
             self._stored.minio_root_pwd = self.cluster.get_root_pwd()
+        # 2.4) Leader places the units into server pools and sets the
+        # volumes. Units not placed yet wait for a new pool to be formed.
+        if self.unit.is_leader():
+            self._update_pools()
+        if self._expected_units() > 1 and not self.cluster.pools:
+            # Leader still waits for the expected units, starting minio
+            # now would mean a restart per unit that joins
+            self.model.unit.status = BlockedStatus(
+                "Waiting for {} of {} expected units to bootstrap".format(
+                    len(self.cluster.peer_endpoints()) + 1,
+                    self._expected_units()))
+            return
+        if self.cluster.is_pending():
+            self.model.unit.status = BlockedStatus(
+                self.cluster.pending_reason or
+                "Waiting for more units to form a new server pool")
+            return
+        # 2.5) Storage class parities must fit the erasure sets of every
+        # pool, otherwise minio refuses to start
+        if self.cluster.relations:
+            try:
+                self._topologies()
+            except MinioClusterInvalidTopology as e:
+                self.model.unit.status = BlockedStatus(str(e))
+                return
         # 3) and 4) Generate context and env file
+        self.timer.phase("render")
         ctx = {}
         ctx["env_minio"] = self.generate_env_file_minio()
         ctx["minio_svc"] = self.generate_service_file_minio()
         if use_certificates:
             ctx["cert_data"] = self.generate_certificates()
+        changes = self.renderer.changed
+        if "env_minio" in changes:
+            live = admin_config.live_env_keys(ctx["env_minio"])
+            if live:
+                logger.warning(
+                    "{} can be set without a restart through "
+                    "admin-config".format(", ".join(live)))
+        if "minio_svc" in changes:
+            subprocess.check_call(["systemctl", "daemon-reload"])
 
         # 5) Restart Strategy
+        self.timer.phase("restart_decision")
 
         if self.unit.is_leader():
             # Now, we need to always handle the locks, even if acquire() was not
@@ -638,6 +1355,8 @@ class MinioCharm(CharmBase):
             for svc in self.services:
                 service_resume(svc)
                 service_restart(svc)
+            # Later changes are classified against what is running now
+            self.ctx = ctx
             self.model.unit.status = \
                 ActiveStatus("Service is running")
             return
@@ -647,21 +1366,34 @@ class MinioCharm(CharmBase):
             MaintenanceStatus("Building context...")
         logger.debug("Context: {}, saved state is: {}".format(
             ctx, self._stored.ctx))
-        if self._check_if_need_restart(ctx):
-            self.on.restart_event.emit(ctx, services=self.services)
+        if self._check_if_need_restart(ctx, changes):
+            self._request_restart(ctx, self.services)
             self._stored.need_restart = True
-            self.model.unit.status = \
-                BlockedStatus("Waiting for restart event")
+            self.model.unit.status = BlockedStatus(
+                self._with_restart_queue("Waiting for restart event"))
+            # Leader may schedule its own batch right away
+            self.restarts.process()
             return
         elif self.service_running():
-            self.model.unit.status = \
-                ActiveStatus("Service is running")
+            # 5.1.1) Leader applies the live settings, no restart needed
+            error = self._apply_admin_config()
+            if error:
+                self.model.unit.status = BlockedStatus(error)
+            else:
+                self.model.unit.status = ActiveStatus(
+                    "Service is running" + self._topology_summary())
         else:
             self.model.unit.status = \
                 BlockedStatus("Service not running that "
                               "should be: {}".format(self.services))
 
+        # 5.2) Leader keeps the hook latency targets up to date, as
+        # units come and go
+        if self.unit.is_leader() and self.prometheus.relations:
+            self._request_prometheus_cluster()
+
         # 6) Open ports
+        self.timer.phase("ports")
         if self._stored.port != self.config.get("minio-service-port", 9000):
             if self._stored.port > 0:
                 close_port(self._stored.port)
@@ -671,21 +1403,29 @@ class MinioCharm(CharmBase):
     def generate_certificates(self):
         """Generate the certificates: CA, cert and key files obtained
         either by relations or config.
+
+        Returns the fingerprints of the cert and key, so the context does
+        not carry the certificates themselves.
         """
         user = self.config["user"]
         group = self.config["group"]
-        ctx = {}
-        ctx["cert"] = self.get_ssl_cert()
-        ctx["key"] = self.get_ssl_key()
-        saveCrtChainToFile(
-            self.get_ssl_cert(),
-            cert_path=TLS_PATH.format(user) + "public.crt",
-            ca_chain_path=CA_CERT_PATH.format(user) + "public.crt",
-            user=user, group=group, force=True)
-        with open(TLS_PATH.format(user) + "private.key", "w") as f:
-            f.write(self.get_ssl_key())
-            f.close()
-        return ctx
+        cert = self.get_ssl_cert()
+        key = self.get_ssl_key()
+        chain = _break_crt_chain(cert)
+        # Each file is swapped atomically. minio reloads the pair on every
+        # change, therefore write the CA chain and key first and the cert
+        # last: the last change it sees is always a matching pair.
+        if len(chain) > 1:
+            self.renderer.write(
+                "ca", CA_CERT_PATH.format(user) + "public.crt",
+                "".join(chain[1:]), owner=user, group=group, perms=0o644)
+        self.renderer.write(
+            "key", TLS_PATH.format(user) + "private.key", key,
+            owner=user, group=group, perms=0o600)
+        self.renderer.write(
+            "cert", TLS_PATH.format(user) + "public.crt", chain[0],
+            owner=user, group=group, perms=0o644)
+        return {"cert": fingerprint(cert), "key": fingerprint(key)}
 
     def generate_service_file_minio(self):
         """Generate the service file with right user and group
@@ -693,41 +1433,96 @@ class MinioCharm(CharmBase):
         svc = {}
         svc["user"] = self.config["user"]
         svc["group"] = self.config["group"]
-        render(source="minio.service.j2",
-               target=SVC_FILE,
-               owner="root",
-               group="root",
-               perms=0o644,
-               context={
-                   "svc": svc
-               })
+        self.renderer.render(
+            "minio_svc",
+            source="minio.service.j2",
+            target=SVC_FILE,
+            owner="root",
+            group="root",
+            perms=0o644,
+            context={
+                "svc": svc
+            })
         return svc
 
     def generate_env_file_minio(self):
         """Generate the env file that will be present on /etc/default
 
-        1) resolve the volumes if we have a cluster or not
+        1) pick the volumes set by the leader, see _update_pools
         2) MINIO_OPTS: setup the port and EC parity
         3) Set root user credentials
         4) Set Prometheus credentials if relation is stablished
         """
-        env = {}
-        env = \
-            yaml.safe_load(
-                self.config.get("minio_env_extra_opts", "")) or {}
-
-        vol = []
-        if self.cluster.relation:
-            # We have a cluster, then pick info for each unit
-            for k, v in self.cluster.endpoints().items():
-                # Assuming all paths come with /<path>
-                # We do not need a / between URL and path
-                vol.extend(
-                    ["{}{}".format(k, x) for x in v])
-        # Add this unit's folders
-        for x in self.disks.used_folders():
-            vol.append(
-                "{}{}".format(self.cluster.url, x))
+        env = dict(self._extra_opts())
+
+        env["MINIO_VOLUMES"] = self.cluster.minio_volumes
+        for option, key in [
+                ("standard-parity", "MINIO_STORAGE_CLASS_STANDARD"),
+                ("rrs-parity", "MINIO_STORAGE_CLASS_RRS")]:
+            if self.config[option] >= 0:
+                env[key] = "EC:{}".format(self.config[option])
+        env["MINIO_OPTS"] = "\"--address :{}\"".format(
+            self.config["minio-service-port"])
+        env["MINIO_ROOT_USER"] = self.config["minio_root_user"]
+        env["MINIO_ROOT_PASSWORD"] = self.cluster.get_root_pwd()
+        # If prometheus relation does not exist, so self.prometheus
+        # will still have None value from __init__
+        if self.prometheus.relations:
+            env["MINIO_PROMETHEUS_AUTH_TYPE"] = "public"
+        self.renderer.render(
+            "env_minio",
+            source="minio_env",
+            target=CONFIG_ENV + "minio",
+            owner=self.config['user'],
+            group=self.config["group"],
+            perms=0o600,
+            context={
+                "env": env
+            })
+        return env
+
+    def minio_url(self):
+        """URL of the minio server in this unit."""
+        return "{}://{}:{}".format(
+            "https" if len(self.get_ssl_cert()) > 0 else "http",
+            self.minio.hostname, self.config["minio-service-port"])
+
+    def ca_cert_path(self):
+        """Returns the CA chain file if TLS is used, None otherwise."""
+        if len(self.get_ssl_cert()) == 0:
+            return None
+        return CA_CERT_PATH.format(self.config["user"]) + "public.crt"
+
+    def minio_admin(self):
+        """Returns an admin client for the cluster, via this unit."""
+        return MinioAdmin(
+            self.minio_url(), self.config["minio_root_user"],
+            self.cluster.get_root_pwd() or self._stored.minio_root_pwd,
+            ca_path=self.ca_cert_path())
+
+    def _update_pools(self):
+        """Leader sets the server pools and the resulting MINIO_VOLUMES.
+
+        Existing pools are kept as they are, except for new units taking
+        the place of units gone. Other new units are appended as a new
+        pool once they can form a valid one.
+        """
+        endpoints = self.cluster.peer_endpoints()
+        endpoints[self.unit.name] = {
+            "url": self.minio_url(),
+            "folders": self.disks.used_folders()}
+        if not self.cluster.pools and not self._bootstrap_settled(endpoints):
+            # Every unit added to the first pool changes MINIO_VOLUMES,
+            # hence restarts every unit already started: publish the
+            # first pool once.
+            return
+        pools, pending, reason = expand_pools(
+            self.cluster.pools, endpoints, self.config["min-units"])
+        if pending:
+            logger.info("Units {} wait to form a new server pool{}".format(
+                ", ".join(sorted(pending.keys())),
+                ": " + reason if reason else ""))
+        self.cluster.pending_reason = reason
         # This is mandatory because Minio chooses the node to bootstrap
         # the cluster based on who is the first unit in the config.
         # For example, if cluster has following devices:
@@ -739,47 +1534,71 @@ class MinioCharm(CharmBase):
         # as the very first entry in the list, otherwise it will mean
         # the cluster has two options to bootstrap.
         # For that reason, the cluster leader must set the volume config
-        if self.unit.is_leader():
-            # Relation list may change but not the actual nodes
-            vol.sort()
-            self.cluster.minio_volumes = "\"{}\"".format(" ".join(vol))
-        env["MINIO_VOLUMES"] = self.cluster.minio_volumes
-        env["MINIO_OPTS"] = "\"--address :{}\"".format(
-            self.config["minio-service-port"])
-        env["MINIO_ROOT_USER"] = self.config["minio_root_user"]
-        env["MINIO_ROOT_PASSWORD"] = self.cluster.get_root_pwd()
-        # If prometheus relation does not exist, so self.prometheus
-        # will still have None value from __init__
-        if self.prometheus.relations:
-            env["MINIO_PROMETHEUS_AUTH_TYPE"] = "public"
-        render(source="minio_env",
-               target=CONFIG_ENV + "minio",
-               owner=self.config['user'],
-               group=self.config["group"],
-               perms=0o600,
-               context={
-                   "env": env
-               })
-        return env
+        self.cluster.pools = pools
+        self.cluster.minio_volumes = "\"{}\"".format(pool_volumes(pools))
+
+    def _expected_units(self):
+        return max(self.config["expected-units"], self.config["min-units"])
+
+    def _bootstrap_settled(self, endpoints):
+        """True once the first pool can be formed with endpoints.
+
+        Leader waits for expected-units units, with at least min-disks
+        disks, to publish their endpoints. Past bootstrap-settle-timeout
+        since it started waiting, the pool is formed with the units
+        present.
+        """
+        expected = self._expected_units()
+        disks = sum(len(e["folders"]) for e in endpoints.values())
+        if len(endpoints) >= expected and disks >= self.config["min-disks"]:
+            self._stored.bootstrap_started = 0
+            return True
+        now = time.time()
+        if not self._stored.bootstrap_started:
+            self._stored.bootstrap_started = now
+        waited = now - self._stored.bootstrap_started
+        if waited >= self.config["bootstrap-settle-timeout"]:
+            logger.warning(
+                "Bootstrap settle timeout: forming the first pool with {} "
+                "of {} expected units".format(len(endpoints), expected))
+            self._stored.bootstrap_started = 0
+            return True
+        logger.info("Bootstrap: {} of {} units, {} disks, waited {:.0f}s"
+                    .format(len(endpoints), expected, disks, waited))
+        return False
 
     def get_ssl_cacert(self):
         return "".join(_break_crt_chain(self.get_ssl_cert())[1:])
 
+    def _on_framework_pre_commit(self, event):
+        # Stored state must change before the commit saves it
+        self.timer.finish(hook_name())
+        self._stored.hook_timings = json.dumps(self.timer.histograms)
+        self._stored.restart_queue = self.restart_queue.dumps()
+        try:
+            self.timer.write_textfile(self.config["textfile-collector-dir"])
+        except OSError as e:
+            logger.warning("Could not write hook timings: {}".format(e))
+
+    def _on_framework_commit(self, event):
+        # Hook is done, next hook reads everything again
+        self.hook_cache.clear()
+
     def get_ssl_cert(self):
-        if not self.certificates.relation and \
-           len(self.config.get("ssl_cert", "")) == 0 and \
-           len(self.config.get("ssl_key", "")) == 0:
-            # Certificates will not be used
-            return ""
-        return self._get_ssl(self.minio, "cert")
+        return self.hook_cache.get(
+            "ssl_cert", lambda: self._get_ssl_if_used("cert"))
 
     def get_ssl_key(self):
+        return self.hook_cache.get(
+            "ssl_key", lambda: self._get_ssl_if_used("key"))
+
+    def _get_ssl_if_used(self, ty):
         if not self.certificates.relation and \
            len(self.config.get("ssl_cert", "")) == 0 and \
            len(self.config.get("ssl_key", "")) == 0:
             # Certificates will not be used
             return ""
-        return self._get_ssl(self.minio, "key")
+        return self._get_ssl(self.minio, ty)
 
     def _get_ssl(self, relation, ty):
         """Recover the SSL certs based on the relation"""
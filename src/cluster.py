@@ -15,23 +15,60 @@ url: defined per unit and defines the hostname to be used to connect
      http(s)://<hostname/ip>:<port>
 used_folders: folders used for the data of each of the disks. Used to
               construct the MINIO_VOLUMES variable.
+disk_size: size, in bytes, of the smallest disk of the unit. Used to
+           estimate the usable capacity of the cluster.
+upgrade_state: json, progress of this unit on a coordinated upgrade. See
+               upgrade.py for its format.
+restart_request: json, restart this unit waits for. See scheduler.py.
+restart_done: id of the last restart request this unit fulfilled.
+api_limits: json, api limits sized from this unit's resources and the
+            resources themselves: {"limits": {...}, "basis": {"ram": ...,
+            "cpus": ..., "drives": ...}}. See api_limits.py.
+
+Application data:
+minio_volumes: MINIO_VOLUMES value, set by the leader.
+pools: json, list of the server pools, set by the leader. Each pool is a
+       dict of unit names and their {"url": ..., "folders": [...]}.
+root_pwd: root password of the cluster, set by the leader.
+pending_reason: why the units waiting for a server pool cannot form
+                one, set by the leader. Empty if they wait for more units.
+peers_gone: count of units that left the cluster.
+upgrade: json, coordinated upgrade published by the leader.
+restart_batch: json, units allowed to restart now, set by the leader.
+api_limits: json, api limits the leader set on the cluster and the basis
+            of each unit: {"api": {...}, "units": {<unit>: {...}}}.
+topology: json, the data of every unit gathered by the leader:
+    {"gen": ..., "hash": ..., "units": {<unit>: {"url": ...,
+     "folders": [...], "num_disks": ..., "disk_size": ..., "sans": [...],
+     "api_limits": {...}}}}
+
+Walking the data of every peer on every hook grows as O(N^2) across the
+cluster. Instead, only the leader walks the peers and publishes the
+topology document, with a new generation whenever its content hash
+changes. Units read that single key and skip the config-changed logic
+while the generation, and the rest of the application data they use,
+stay the same. Until the leader publishes it, peers' data is read
+directly.
 
 """
 
+import hashlib
+import json
+import logging
+
 from wand.apps.relations.relation_manager_base import RelationManagerBase
 
+from topology import plan
+from ellipsis import has_ellipsis
+from hook_cache import HookCache
 
-class MinioClusterNumDisksMustBeDivisibleBy4(Exception):
-    def __init__(self, num_disks):
-        super().__init__(
-            "Minio Cluster has {} disks, which is "
-            "not divisible by 4".format(str(num_disks)))
+logger = logging.getLogger(__name__)
 
 
 class MinioClusterManager(RelationManagerBase):
 
     def __init__(self, charm, relation_name, url,
-                 storage_name, min_units=3, min_disks=4):
+                 storage_name, min_units=3, min_disks=4, cache=None):
         super().__init__(charm, relation_name)
         self._charm = charm
         self._unit = charm.unit
@@ -41,6 +78,41 @@ class MinioClusterManager(RelationManagerBase):
         self._relation_name = relation_name
         self._storage_name = storage_name
         self._used_folders = []
+        self._disk_size = 0
+        # Relation writes done and suppressed on this hook
+        self._writes = {"sent": 0, "suppressed": 0}
+        self._cache = cache or HookCache()
+
+    def _app_get(self, key, default, parse=None):
+        """Reads key of the application data, once per hook."""
+        def fetch():
+            value = self.relation.data[self._charm.app].get(key, default)
+            return parse(value) if parse else value
+        return self._cache.get((self._charm.app.name, key), fetch)
+
+    def _write(self, bucket, key, value, send):
+        """Writes value on key, unless it is already set.
+
+        Every write fires cluster-relation-changed on all the peers, even
+        if the value did not change.
+        """
+        if self.relation.data[bucket].get(key) == str(value):
+            self._writes["suppressed"] += 1
+            logger.debug("Relation write of {} suppressed, {} sent, {} "
+                         "suppressed".format(key, self._writes["sent"],
+                                             self._writes["suppressed"]))
+            return
+        send(key, value)
+        self._cache.invalidate((bucket.name, key))
+        self._writes["sent"] += 1
+        logger.debug("Relation write of {}, {} sent, {} suppressed".format(
+            key, self._writes["sent"], self._writes["suppressed"]))
+
+    def _send(self, key, value):
+        self._write(self._unit, key, value, self.send)
+
+    def _send_app(self, key, value):
+        self._write(self._charm.app, key, value, self.send_app)
 
     def set_sans(self, s):
         """Sets the sans to be shared across all units.
@@ -49,22 +121,85 @@ class MinioClusterManager(RelationManagerBase):
         """
         if not self.relation:
             return
-        self.send("sans", ",".join(s))
+        self._send("sans", ",".join(s))
 
     def get_sans(self):
         if not self.relation:
             return []
         result = []
-        for u in self.relation.units:
-            result.extend(
-                self.relation.data[u].get("sans", "").split(","))
+        for info in self._peers().values():
+            result.extend(info["sans"])
         return result
 
+    def _unit_info(self, unit):
+        """Returns the data published by unit, as in the topology."""
+        data = self.relation.data[unit]
+        return {
+            "url": data.get("url", ""),
+            "folders": [f for f in data.get("used_folders", "").split(",")
+                        if f],
+            "num_disks": int(data.get("num_disks", 0)),
+            "disk_size": int(data.get("disk_size", 0)),
+            "sans": [s for s in data.get("sans", "").split(",") if s],
+            "api_limits": json.loads(data.get("api_limits", "{}")),
+        }
+
+    @property
+    def topology_doc(self):
+        if not self.relation:
+            return {}
+        return self._app_get("topology", "{}", parse=json.loads)
+
+    def publish_topology(self):
+        """Leader gathers the data of every unit in the topology document.
+
+        Returns True if a new generation was published.
+        """
+        if not self.relation or not self._charm.unit.is_leader():
+            return False
+        units = {u.name: self._unit_info(u) for u in self.all_units()}
+        digest = hashlib.sha256(
+            json.dumps(units, sort_keys=True).encode()).hexdigest()[:16]
+        doc = self.topology_doc
+        if doc.get("hash") == digest:
+            return False
+        gen = doc.get("gen", 0) + 1
+        self._send_app("topology", json.dumps(
+            {"gen": gen, "hash": digest, "units": units},
+            sort_keys=True, separators=(",", ":")))
+        return True
+
+    def generation(self):
+        """Returns a digest of the application data units act upon.
+
+        Includes the upgrade document: units blocked on an upgrade only
+        clear their status when config-changed runs again.
+        """
+        if not self.relation:
+            return ""
+        data = self.relation.data[self._charm.app]
+        return hashlib.sha256(json.dumps(
+            [data.get(k, "") for k in (
+                "topology", "minio_volumes", "pools", "root_pwd",
+                "peers_gone", "upgrade", "pending_reason")]).encode()
+        ).hexdigest()
+
+    def _peers(self):
+        """Returns {unit name: data} of the peers.
+
+        Taken from the topology document, if the leader published it.
+        """
+        units = self.topology_doc.get("units")
+        if units is not None:
+            return {u: info for u, info in units.items()
+                    if u != self._unit.name}
+        return {u.name: self._unit_info(u) for u in self.relation.units}
+
     @property
     def minio_volumes(self):
         if not self.relation:
             return ""
-        return self.relation.data[self._charm.app].get("minio_volumes", "")
+        return self._app_get("minio_volumes", "")
 
     @property
     def min_units(self):
@@ -82,12 +217,22 @@ class MinioClusterManager(RelationManagerBase):
     def used_folders(self):
         return self._used_folders
 
+    @property
+    def disk_size(self):
+        return self._disk_size
+
+    @disk_size.setter
+    def disk_size(self, d):
+        self._disk_size = d
+        if self.relation:
+            self._send("disk_size", str(d))
+
     @property
     def peers_gone(self):
         if not self.relation:
             # No relation detected, no need to worry about it for now
             return 0
-        return int(self.relation.data[self._charm.app].get("peers_gone", 0))
+        return self._app_get("peers_gone", 0, parse=int)
 
     @property
     def ack_peer_restablished(self):
@@ -100,18 +245,18 @@ class MinioClusterManager(RelationManagerBase):
     def ack_peer_restablished(self, ack):
         if not self.relation:
             return
-        self.send("ack_peer_restablished", ack)
+        self._send("ack_peer_restablished", ack)
 
     @peers_gone.setter
     def peers_gone(self, p):
         if not self.relation:
             return
-        self.send_app("peers_gone", p)
+        self._send_app("peers_gone", p)
 
     @minio_volumes.setter
     def minio_volumes(self, v):
         if self._charm.unit.is_leader():
-            self.send_app("minio_volumes", v)
+            self._send_app("minio_volumes", v)
 
     @min_units.setter
     def min_units(self, m):
@@ -124,55 +269,239 @@ class MinioClusterManager(RelationManagerBase):
     @url.setter
     def url(self, u):
         self._url = u
-        self.send("url", self._url)
+        self._send("url", self._url)
 
     @used_folders.setter
     def used_folders(self, f):
         self._used_folders = f
-        self.send("used_folders", ",".join(self._used_folders))
+        self._send("used_folders", ",".join(self._used_folders))
+
+    def all_units(self):
+        """Returns this unit and its peers."""
+        if not self.relation:
+            return [self._unit]
+        return [self._unit] + list(self.relation.units)
+
+    @property
+    def upgrade(self):
+        if not self.relation:
+            return {}
+        return self._app_get("upgrade", "{}", parse=json.loads)
+
+    @upgrade.setter
+    def upgrade(self, u):
+        if self._charm.unit.is_leader():
+            self._send_app("upgrade", json.dumps(u, sort_keys=True))
+
+    def get_upgrade_state(self, unit=None):
+        if not self.relation:
+            return {}
+        return json.loads(self.relation.data[unit or self._unit].get(
+            "upgrade_state", "{}"))
+
+    def set_upgrade_state(self, state):
+        if not self.relation:
+            return
+        self._send("upgrade_state", json.dumps(state, sort_keys=True))
+
+    @property
+    def restart_batch(self):
+        if not self.relation:
+            return {}
+        return self._app_get("restart_batch", "{}", parse=json.loads)
+
+    @restart_batch.setter
+    def restart_batch(self, b):
+        if self._charm.unit.is_leader():
+            self._send_app("restart_batch", json.dumps(b, sort_keys=True))
+
+    def get_restart_request(self, unit=None):
+        if not self.relation:
+            return {}
+        return json.loads(self.relation.data[unit or self._unit].get(
+            "restart_request", "{}"))
+
+    def set_restart_request(self, req):
+        if not self.relation:
+            return
+        self._send("restart_request", json.dumps(req, sort_keys=True))
+
+    def get_restart_done(self, unit=None):
+        if not self.relation:
+            return ""
+        return self.relation.data[unit or self._unit].get("restart_done", "")
+
+    def set_restart_done(self, req_id):
+        if not self.relation:
+            return
+        self._send("restart_done", req_id)
+
+    def get_api_limits(self, unit=None):
+        if not self.relation:
+            return {}
+        return json.loads(self.relation.data[unit or self._unit].get(
+            "api_limits", "{}"))
+
+    def set_api_limits(self, doc):
+        if not self.relation:
+            return
+        self._send("api_limits", json.dumps(doc, sort_keys=True))
+
+    def unit_api_limits(self):
+        """Returns {unit name: api_limits} of this unit and its peers."""
+        if not self.relation:
+            return {}
+        result = {u: info.get("api_limits", {})
+                  for u, info in self._peers().items()}
+        result[self._unit.name] = self.get_api_limits()
+        return result
+
+    @property
+    def api_limits(self):
+        if not self.relation:
+            return {}
+        return self._app_get("api_limits", "{}", parse=json.loads)
+
+    @api_limits.setter
+    def api_limits(self, doc):
+        if self._charm.unit.is_leader():
+            self._send_app("api_limits", json.dumps(doc, sort_keys=True))
 
     def get_root_pwd(self):
         if not self.relation:
             return ""
         # .get considers the case which cluster is not yet formed
         # return an empty value in this case.
-        return self.relation.data[self._charm.app].get("root_pwd", "")
+        return self._app_get("root_pwd", "")
 
     def set_root_pwd(self, pwd):
         if self._charm.unit.is_leader():
-            self.send_app("root_pwd", pwd)
+            self._send_app("root_pwd", pwd)
+
+    def drives_per_unit(self):
+        """Returns a dict of unit names and their number of disks."""
+        result = {
+            self._unit.name:
+                len(self._charm.model.storages[self._storage_name])}
+        if not self.relation:
+            return result
+        for u, info in self._peers().items():
+            result[u] = info["num_disks"]
+        return result
+
+    def drive_size(self):
+        """Smallest disk across the cluster, 0 if not known."""
+        sizes = [self._disk_size]
+        if self.relation:
+            sizes.extend(info["disk_size"]
+                         for info in self._peers().values())
+        sizes = [s for s in sizes if s > 0]
+        return min(sizes) if sizes else 0
+
+    @property
+    def pools(self):
+        if not self.relation:
+            return []
+        return self._app_get("pools", "[]", parse=json.loads)
+
+    @pools.setter
+    def pools(self, p):
+        if self._charm.unit.is_leader():
+            self._send_app("pools", json.dumps(p, sort_keys=True))
+
+    @property
+    def pending_reason(self):
+        if not self.relation:
+            return ""
+        return self._app_get("pending_reason", "")
+
+    @pending_reason.setter
+    def pending_reason(self, reason):
+        # An unset key reads as empty: do not write it again
+        if self._charm.unit.is_leader() and reason != self.pending_reason:
+            self._send_app("pending_reason", reason)
+
+    def is_pending(self):
+        """True if this unit waits for enough peers to form a new pool."""
+        pools = self.pools
+        return bool(pools) and \
+            not any(self._unit.name in p for p in pools)
+
+    def peer_endpoints(self):
+        """Returns {unit name: {"url": ..., "folders": [...]}} of peers."""
+        if not self.relation:
+            return {}
+        return {u: {"url": info["url"], "folders": info["folders"]}
+                for u, info in self._peers().items()
+                if info["url"] and info["folders"]}
+
+    def topologies(self, parity=None, rrs_parity=None):
+        """Erasure layout of each server pool.
+
+        Before any pool is formed, returns the layout all current units
+        would have as a single pool.
+
+        Raises:
+            MinioClusterInvalidTopology if there is no valid layout or the
+            parities do not fit it
+        """
+        pools = self.pools
+        if not pools:
+            return [self.topology(parity=parity, rrs_parity=rrs_parity)]
+        symmetric = len(pools) > 1 or has_ellipsis(self.minio_volumes)
+        return [plan({u: len(e["folders"]) for u, e in p.items()},
+                     parity=parity, symmetric=symmetric,
+                     drive_size=self.drive_size(), rrs_parity=rrs_parity)
+                for p in pools]
+
+    def topology(self, parity=None, rrs_parity=None):
+        """Erasure layout minio will use with the current units.
+
+        Raises:
+            MinioClusterInvalidTopology if there is no valid layout or the
+            parities do not fit it
+        """
+        # minio requires set sizes symmetric with the number of servers
+        # when volumes are given in ellipsis notation
+        return plan(self.drives_per_unit(), parity=parity,
+                    symmetric=has_ellipsis(self.minio_volumes),
+                    drive_size=self.drive_size(), rrs_parity=rrs_parity)
 
     def is_ready(self):
         if not self.relation:
             return False
         if len(self.relation.units) + 1 < self._min_units:
             return False
-        num_disks = len(self._charm.model.storages[self._storage_name])
-        for u in self.relation.units:
-            num_disks += int(self.relation.data[u].get("num_disks", 0))
+        num_disks = sum(self.drives_per_unit().values())
         if num_disks < self._min_disks:
             return False
-        if num_disks % 4 > 0:
-            raise MinioClusterNumDisksMustBeDivisibleBy4(num_disks)
+        if self.pools:
+            # Pools are only formed with valid layouts, new units wait
+            # to form a new pool instead.
+            return True
+        # Raises MinioClusterInvalidTopology if no erasure set fits
+        self.topology()
         return True
 
     def endpoints(self):
         if not self.relation:
             return
-        result = {}
-        for u in self.relation.units:
-            if self.relation.data[u].get("url", None) and \
-               self.relation.data[u].get("used_folders", None):
-                result[self.relation.data[u]["url"]] = \
-                    self.relation.data[u]["used_folders"].split(",")
-        return result
+        return {e["url"]: e["folders"]
+                for e in self.peer_endpoints().values()}
 
     def relation_joined(self, event):
         self.relation_changed(event)
 
     def relation_changed(self, event):
         # Send current count of disks for this unit
-        self.send("num_disks",
-                  len(self._charm.model.storages[self._storage_name]))
-        self.send("url", self._url)
-        self.send("used_folders", ",".join(self._used_folders))
+        self._send("num_disks",
+                   len(self._charm.model.storages[self._storage_name]))
+        # url, folders and disk size are only known once config-changed
+        # set them on this hook: do not overwrite the published values
+        # with empty ones, which would fire a round of hooks on all peers.
+        if self._url:
+            self._send("url", self._url)
+        if self._used_folders:
+            self._send("used_folders", ",".join(self._used_folders))
+        if self._disk_size:
+            self._send("disk_size", str(self._disk_size))
@@ -0,0 +1,343 @@
+"""
+
+Filesystem profile of the data disks.
+
+The profile is set by disk-fs-type, disk-mkfs-options and
+disk-mount-options. minio recommends xfs mounted with noatime, e.g.:
+
+disk-fs-type: xfs
+disk-mkfs-options: -i size=512 -d su=64k,sw=4
+disk-mount-options: noatime
+
+Blank devices are formatted with the profile and mounted with its
+options. Disks already formatted or mounted are never touched: they keep
+their filesystem, fstab entry and folder, even if the profile changed
+since. The report tells which of them differ from the profile, and only
+those still empty can be reformatted, see reformat_empty().
+
+Each storage device keeps the folder, /data1 to /data32, it is mounted
+on or has an fstab entry for. Other devices take the first free folders.
+
+A disk is empty if its folder holds nothing but lost+found. Once minio
+uses a disk it writes its .minio.sys folder there.
+
+attach_disks() runs on every config-changed. A device is prepared once it
+has a filesystem UUID and is mounted. When all of them are, it returns
+without touching the drives: both are read from /dev/disk/by-uuid and
+/proc/mounts, no command runs. Otherwise the devices left are prepared
+in parallel, up to MAX_WORKERS at once: each worker formats its device if
+blank, as mkfs is what takes time on a fresh node, and mounts it.
+
+/etc/fstab is always replaced in one rename, never rewritten in place.
+
+"""
+
+import logging
+import os
+import shlex
+import shutil
+import subprocess
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+
+from wand.contrib.disk_map import DiskMapHelper
+
+from artifacts import atomic_write
+
+logger = logging.getLogger(__name__)
+
+DISK_COUNT = 32
+MOUNTS = "/proc/mounts"
+FSTAB = "/etc/fstab"
+BY_UUID = "/dev/disk/by-uuid"
+
+# Devices prepared at once
+MAX_WORKERS = 8
+
+# mkfs flag to overwrite an existing filesystem
+FORCE_FLAGS = {"xfs": "-f", "ext4": "-F", "ext3": "-F", "ext2": "-F"}
+
+
+def build_layout(fs_type="ext4", mount_options="", count=DISK_COUNT):
+    """Returns the DiskMapHelper layout of count disks: /data1, ..."""
+    return yaml.safe_dump([
+        {"/data{}".format(i): [{"fs-type": fs_type},
+                               {"options": mount_options}]}
+        for i in range(1, count + 1)], default_flow_style=False)
+
+
+def read_mounts(path=MOUNTS):
+    """Returns {mount point: {"device": ..., "fs-type": ...,
+    "options": [...]}}."""
+    result = {}
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) < 4:
+                continue
+            result[fields[1]] = {"device": fields[0], "fs-type": fields[2],
+                                 "options": fields[3].split(",")}
+    return result
+
+
+def read_fstab(path=FSTAB):
+    """Returns {mount point: [spec, mount point, type, options, ...]}."""
+    result = {}
+    try:
+        with open(path) as f:
+            lines = f.readlines()
+    except OSError:
+        return result
+    for line in lines:
+        fields = line.split()
+        if len(fields) >= 4 and not fields[0].startswith("#"):
+            result[fields[1]] = fields
+    return result
+
+
+def set_fstab_entry(folder, spec, fs_type, options, path=FSTAB):
+    """Sets the fstab entry of folder, replacing the file in one rename.
+
+    A crash or a full disk never leaves a truncated fstab behind.
+    """
+    entry = "\t".join([spec, folder, fs_type, options or "defaults",
+                       "0", "2"]) + "\n"
+    try:
+        with open(path) as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        lines = []
+    found = False
+    for i, line in enumerate(lines):
+        fields = line.split()
+        if len(fields) >= 4 and not fields[0].startswith("#") and \
+           fields[1] == folder:
+            lines[i] = entry
+            found = True
+    if not found:
+        if lines and not lines[-1].endswith("\n"):
+            lines[-1] += "\n"
+        lines.append(entry)
+    atomic_write(path, "".join(lines), perms=0o644)
+
+
+def device_fs_type(device):
+    """Returns the filesystem of device, "" if it has none."""
+    return _blkid(device, "TYPE")
+
+
+def device_uuid(device):
+    """Returns the filesystem UUID of device, "" if it has none."""
+    return _blkid(device, "UUID")
+
+
+def _blkid(device, tag):
+    try:
+        return subprocess.check_output(
+            ["blkid", "-o", "value", "-s", tag, device]).decode().strip()
+    except subprocess.CalledProcessError:
+        # blkid exits with 2 if nothing was found
+        return ""
+
+
+def device_uuids(path=BY_UUID):
+    """Returns {device: uuid} of the devices that have a filesystem."""
+    try:
+        names = os.listdir(path)
+    except OSError:
+        return {}
+    return {os.path.realpath(os.path.join(path, n)): n for n in names}
+
+
+def is_empty(folder):
+    return not [e for e in os.listdir(folder) if e != "lost+found"]
+
+
+def missing_options(wanted, current):
+    """Returns the mount options of wanted that current lacks."""
+    return [o for o in wanted.split(",") if o and o not in current]
+
+
+def _folder_index(folder):
+    return int(folder[len("/data"):])
+
+
+class MinioDiskMapHelper(DiskMapHelper):
+
+    def __init__(self, charm, storage_name, user, group, fs_type="ext4",
+                 mkfs_options="", mount_options="", count=DISK_COUNT):
+        super().__init__(charm, build_layout(fs_type, mount_options, count),
+                         storage_name, user, group)
+        self._charm = charm
+        self._storage_name = storage_name
+        self._user = user
+        self._group = group
+        self._fs_type = fs_type
+        self._mkfs_options = mkfs_options
+        self._mount_options = mount_options
+        self._folders = ["/data{}".format(i) for i in range(1, count + 1)]
+        self._fstab_lock = threading.Lock()
+
+    def _devices(self):
+        return [str(s.location)
+                for s in self._charm.model.storages[self._storage_name]]
+
+    def _spec_device(self, spec, uuids):
+        """Returns the device of an fstab spec: UUID=... or a path."""
+        if spec.startswith("UUID="):
+            return next((d for d, u in uuids.items()
+                         if u == spec[len("UUID="):]), None)
+        return os.path.realpath(spec)
+
+    def assignments(self):
+        """Returns {device: folder} of the storage devices.
+
+        A device mounted on a folder, or with an fstab entry for it, keeps
+        it. The others take the first free folders.
+        """
+        mounts = read_mounts()
+        fstab = read_fstab()
+        uuids = device_uuids()
+        taken = {}
+        for folder in self._folders:
+            if folder in fstab:
+                device = self._spec_device(fstab[folder][0], uuids)
+                if device:
+                    taken[device] = folder
+            if folder in mounts:
+                taken[os.path.realpath(mounts[folder]["device"])] = folder
+        free = [f for f in self._folders
+                if f not in fstab and f not in mounts]
+        result = {}
+        for device in self._devices():
+            folder = taken.get(os.path.realpath(device))
+            if folder is None:
+                if not free:
+                    logger.warning("No folder left for {}".format(device))
+                    continue
+                folder = free.pop(0)
+            result[device] = folder
+        return result
+
+    def used_folders(self):
+        return sorted(self.assignments().values(), key=_folder_index)
+
+    def mkfs(self, device, force=False):
+        cmd = ["mkfs.{}".format(self._fs_type)]
+        if force and self._fs_type in FORCE_FLAGS:
+            cmd.append(FORCE_FLAGS[self._fs_type])
+        cmd += shlex.split(self._mkfs_options) + [device]
+        logger.info("Formatting {}: {}".format(device, " ".join(cmd)))
+        subprocess.check_call(cmd)
+
+    def unprepared(self):
+        """Returns the devices with no filesystem UUID or not mounted."""
+        uuids = device_uuids()
+        mounted = {os.path.realpath(m["device"])
+                   for m in read_mounts().values()}
+        return [d for d in self._devices()
+                if os.path.realpath(d) not in uuids or
+                os.path.realpath(d) not in mounted]
+
+    def _mount(self, device, folder):
+        """Mounts device on folder through its fstab entry.
+
+        A device with no entry gets one with the filesystem it has: the
+        profile only applies to the disks it formatted.
+        """
+        os.makedirs(folder, exist_ok=True)
+        fs_type = device_fs_type(device)
+        uuid = device_uuid(device)
+        # Workers add their entries to the same fstab
+        with self._fstab_lock:
+            if folder not in read_fstab():
+                set_fstab_entry(
+                    folder, "UUID={}".format(uuid) if uuid else device,
+                    fs_type,
+                    self._mount_options if fs_type == self._fs_type else "")
+        if folder not in read_mounts():
+            subprocess.check_call(["mount", folder])
+        shutil.chown(folder, self._user, self._group)
+
+    def _prepare(self, device, folder):
+        """Formats device if blank, then mounts it on folder."""
+        start = time.monotonic()
+        if not device_fs_type(device):
+            self.mkfs(device)
+        formatted = time.monotonic()
+        self._mount(device, folder)
+        logger.debug("Prepared {} on {}: mkfs {:.2f}s, mount {:.2f}s".format(
+            device, folder, formatted - start, time.monotonic() - formatted))
+
+    def attach_disks(self):
+        """Formats the blank devices with the profile and mounts them.
+
+        Each device is prepared by its own worker, from mkfs to mount.
+        Returns right away if all the devices are already prepared.
+        """
+        pending = self.unprepared()
+        if not pending:
+            logger.debug("All disks prepared, nothing to attach")
+            return
+        folders = self.assignments()
+        pending = [d for d in pending if d in folders]
+        if not pending:
+            return
+        start = time.monotonic()
+        with ThreadPoolExecutor(
+                max_workers=min(MAX_WORKERS, len(pending))) as pool:
+            # list() raises the first failure, after all of them ran
+            list(pool.map(lambda d: self._prepare(d, folders[d]), pending))
+        logger.debug("Prepared {} disks in {:.2f}s".format(
+            len(pending), time.monotonic() - start))
+
+    def report(self):
+        """Returns the current profile of each disk and if it matches."""
+        mounts = read_mounts()
+        result = {}
+        for folder in self.used_folders():
+            m = mounts.get(folder)
+            if not m:
+                result[folder] = {"mounted": False}
+                continue
+            missing = missing_options(self._mount_options, m["options"])
+            result[folder] = {
+                "mounted": True,
+                "device": m["device"],
+                "fs-type": m["fs-type"],
+                "options": ",".join(m["options"]),
+                "matches-profile":
+                    m["fs-type"] == self._fs_type and not missing,
+                "missing-options": ",".join(missing),
+                "empty": is_empty(folder),
+            }
+        return result
+
+    def reformat_empty(self, dry_run=True):
+        """Reformats the disks that differ from the profile and are empty.
+
+        Returns the folders reformatted, or to be, if dry_run.
+        """
+        done = []
+        for folder, r in sorted(self.report().items()):
+            if not r["mounted"] or r["fs-type"] == self._fs_type:
+                continue
+            if not r["empty"]:
+                logger.info("{} holds data, not reformatting it".format(
+                    folder))
+                continue
+            done.append(folder)
+            if dry_run:
+                continue
+            subprocess.check_call(["umount", folder])
+            self.mkfs(r["device"], force=True)
+            # Its fstab entry now points to the new filesystem
+            set_fstab_entry(
+                folder, "UUID={}".format(device_uuid(r["device"])),
+                self._fs_type, self._mount_options)
+            subprocess.check_call(["mount", folder])
+        return done
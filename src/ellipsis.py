@@ -0,0 +1,82 @@
+"""
+
+Compresses the list of minio endpoints into minio's ellipsis notation, as
+described on:
+https://docs.min.io/docs/distributed-minio-quickstart-guide.html
+
+For example, 4 units with 2 disks each:
+http://minio-0:9000/data1 http://minio-0:9000/data2 ...
+http://minio-3:9000/data2
+becomes:
+http://minio-{0...3}:9000/data{1...2}
+
+The notation only applies if every unit uses the same folders and the
+hostnames only differ on one consecutive numeric range, e.g. IPs on the
+same subnet or hostnames with a sequential index. Otherwise, the caller
+should fallback to the explicit list.
+
+"""
+
+import re
+
+_NUMBERS = re.compile(r"(\d+)")
+
+
+def compress_sequence(values):
+    """Compresses values into prefix{a...b}suffix, if possible.
+
+    All values must be equal except for a single numeric run, which must
+    be a consecutive range once sorted. Zero-padded numbers must share the
+    same width, as minio expands {01...16} with padding.
+
+    Returns the compressed string or None.
+    """
+    values = list(set(values))
+    if len(values) == 1:
+        return values[0]
+    parts = [_NUMBERS.split(v) for v in values]
+    if any(len(p) != len(parts[0]) for p in parts):
+        return None
+    varying = [i for i in range(len(parts[0]))
+               if len(set(p[i] for p in parts)) > 1]
+    # Odd indexes of re.split's result are the numeric runs
+    if len(varying) != 1 or varying[0] % 2 == 0:
+        return None
+    i = varying[0]
+    numbers = [p[i] for p in parts]
+    padded = any(n.startswith("0") and len(n) > 1 for n in numbers)
+    if padded and len(set(len(n) for n in numbers)) > 1:
+        return None
+    if not padded and any(n != str(int(n)) for n in numbers):
+        return None
+    ints = sorted(int(n) for n in numbers)
+    if ints != list(range(ints[0], ints[0] + len(ints))):
+        return None
+    fmt = "{:0" + str(len(numbers[0])) + "d}" if padded else "{}"
+    return "{}{{{}...{}}}{}".format(
+        "".join(parts[0][:i]), fmt.format(ints[0]), fmt.format(ints[-1]),
+        "".join(parts[0][i + 1:]))
+
+
+def compress_endpoints(endpoints):
+    """Compresses the endpoints of a server pool into a single argument.
+
+    Args:
+        endpoints: dict of each unit's url and its list of folders
+    Returns:
+        url{a...b}/folder{c...d} or None if not possible
+    """
+    if not endpoints:
+        return None
+    folders = [tuple(sorted(f)) for f in endpoints.values()]
+    if len(set(folders)) > 1 or not folders[0]:
+        return None
+    hosts = compress_sequence(endpoints.keys())
+    paths = compress_sequence(folders[0])
+    if hosts is None or paths is None:
+        return None
+    return hosts + paths
+
+
+def has_ellipsis(volumes):
+    return "..." in volumes
@@ -0,0 +1,172 @@
+"""
+
+Healing of the cluster as a background job.
+
+A heal walks every object of the cluster, which takes hours on large
+clusters. It runs as a transient systemd unit instead of inside a hook,
+so the unit keeps handling its hooks meanwhile:
+
+systemd-run --unit minio-heal ... mcli --json admin heal -r minio/
+
+The credentials reach mcli through an EnvironmentFile readable by root
+only, not on its command line. Its output, one json document per item,
+is written to HEAL_LOG and read back to report progress.
+
+minio paces the heal itself, as set by its heal subsystem:
+max_sleep: longest pause between two healed objects.
+max_io: concurrent heal operations allowed before it pauses.
+Lower values leave more of the bandwidth to the clients.
+
+Progress is counted from HEAL_LOG:
+scanned: items visited.
+healed: items that were degraded and are whole again.
+remaining: items still degraded after the heal visited them.
+
+"""
+
+import json
+import logging
+import os
+import subprocess
+
+from admin import MC_ALIAS, MC_BIN
+
+logger = logging.getLogger(__name__)
+
+HEAL_UNIT = "minio-heal"
+HEAL_LOG = "/var/log/minio/heal.json"
+HEAL_ENV = "/etc/minio/heal.env"
+
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+NOT_STARTED = "not-started"
+
+
+def count_progress(lines, progress=None):
+    """Updates progress with the heal output lines.
+
+    Args:
+        lines: json lines printed by mcli --json admin heal
+        progress: counters so far, as returned by a previous call
+    Returns:
+        dict of scanned, healed, remaining and errors
+    """
+    progress = dict(progress or
+                    {"scanned": 0, "healed": 0, "remaining": 0, "errors": 0})
+    for line in lines:
+        try:
+            item = json.loads(line)
+        except ValueError:
+            continue
+        if item.get("status") == "error":
+            progress["errors"] += 1
+            continue
+        if "before" not in item and "after" not in item:
+            continue
+        progress["scanned"] += 1
+        before = item.get("before", {}).get("color", "")
+        after = item.get("after", {}).get("color", "")
+        if after and after != "green":
+            progress["remaining"] += 1
+        elif before and before != "green":
+            progress["healed"] += 1
+    return progress
+
+
+class HealJob(object):
+
+    def __init__(self, admin, unit=HEAL_UNIT, log_path=HEAL_LOG,
+                 env_path=HEAL_ENV):
+        """
+        Args:
+            admin: MinioAdmin of the cluster
+        """
+        self._admin = admin
+        self._unit = unit
+        self._log_path = log_path
+        self._env_path = env_path
+
+    def throttle(self, max_sleep="", max_io=0):
+        """Sets how fast minio heals, empty values keep minio's own."""
+        values = {}
+        if max_sleep:
+            values["max_sleep"] = max_sleep
+        if max_io > 0:
+            values["max_io"] = max_io
+        if values:
+            self._admin.config_set("heal", values)
+
+    def _systemd_state(self):
+        out = subprocess.check_output(
+            ["systemctl", "show", "--property=ActiveState,Result",
+             self._unit]).decode("utf-8")
+        return dict(line.split("=", 1) for line in out.splitlines()
+                    if "=" in line)
+
+    def state(self):
+        """Returns RUNNING, DONE, FAILED or NOT_STARTED."""
+        props = self._systemd_state()
+        if props.get("ActiveState") in ("active", "activating"):
+            return RUNNING
+        if props.get("ActiveState") == "failed" or \
+           props.get("Result", "success") != "success":
+            return FAILED
+        if os.path.exists(self._log_path):
+            return DONE
+        return NOT_STARTED
+
+    def start(self):
+        """Starts a heal of the whole cluster, unless one is running.
+
+        Returns:
+            True if a new heal started
+        """
+        if self.state() == RUNNING:
+            logger.info("Heal already running, not starting another")
+            return False
+        fd = os.open(self._env_path,
+                     os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            for k, v in sorted(self._admin.host_env().items()):
+                f.write("{}={}\n".format(k, v))
+        if os.path.exists(self._log_path):
+            os.unlink(self._log_path)
+        # A failed job keeps its unit name until reset
+        subprocess.call(["systemctl", "reset-failed", self._unit])
+        subprocess.check_call([
+            "systemd-run", "--unit", self._unit,
+            "--description", "minio heal started by the charm",
+            "--property", "EnvironmentFile={}".format(self._env_path),
+            "--property", "StandardOutput=file:{}".format(self._log_path),
+            "--property", "Nice=10",
+            MC_BIN, "--json", "admin", "heal", "-r", MC_ALIAS + "/"])
+        logger.info("Heal started as {}".format(self._unit))
+        return True
+
+    def progress(self, previous=None):
+        """Counts the items written to the log since previous.
+
+        Only the new part of the log is read: previous carries the
+        counters and the offset read so far.
+        """
+        previous = previous or {}
+        offset = previous.get("offset", 0)
+        try:
+            with open(self._log_path, "rb") as f:
+                if os.fstat(f.fileno()).st_size < offset:
+                    # Log of a new heal
+                    offset, previous = 0, {}
+                f.seek(offset)
+                lines = []
+                for line in iter(f.readline, b""):
+                    if not line.endswith(b"\n"):
+                        # Half-written, read it on the next call
+                        break
+                    lines.append(line)
+                    offset += len(line)
+        except OSError:
+            return previous
+        progress = count_progress(lines, previous)
+        progress["offset"] = offset
+        return progress
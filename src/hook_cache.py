@@ -0,0 +1,48 @@
+"""
+
+Values read, and parsed, at most once per hook.
+
+Within a single hook, the same relation keys, config options and decoded
+certificates are read several times. Juju only changes them between hooks,
+so they can be kept for the rest of the hook. The exception are the
+charm's own writes, which must invalidate the cached key. Parsed values
+are shared between readers: copy them before any change.
+
+The charm drops the cache on the framework commit, once the hook is done,
+and logs how many reads it saved.
+
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class HookCache(object):
+
+    def __init__(self):
+        self._values = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, fetch):
+        """Returns the cached value of key or, if not cached, fetch()."""
+        if key in self._values:
+            self.hits += 1
+            return self._values[key]
+        self.misses += 1
+        value = fetch()
+        self._values[key] = value
+        return value
+
+    def invalidate(self, key):
+        self._values.pop(key, None)
+
+    def clear(self):
+        """Drops all the values and logs the reads saved on this hook."""
+        if self.hits or self.misses:
+            logger.debug("Hook cache: {} reads, {} saved".format(
+                self.misses, self.hits))
+        self._values = {}
+        self.hits = 0
+        self.misses = 0
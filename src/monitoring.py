@@ -6,10 +6,15 @@ from wand.apps.relations.base_prometheus_monitoring import (
 class PrometheusMonitorCluster(BasePrometheusMonitor):
 
     def request(self, port, metrics_path='/minio/v2/metrics/',
-                endpoint=None, ca_cert=None):
+                endpoint=None, ca_cert=None, hook_metrics_targets=None):
         """Request registers the Prometheus scrape job.
         port: to be used as part of the target
+        hook_metrics_targets: node-exporter host:port of each unit, where
+                              the charm's hook latency is exported, see
+                              timing.py. Registered as a companion job.
         """
+        if hook_metrics_targets:
+            self.request_hook_metrics(hook_metrics_targets)
         name = "{}_cluster".format(self._charm.app.name)
         # advertise_addr given that minio endpoint uses advertise_addr
         # to find its hostname
@@ -32,6 +37,30 @@ class PrometheusMonitorCluster(BasePrometheusMonitor):
             return
         super().request(name, job_data=job)
 
+    def request_hook_metrics(self, targets):
+        """Registers the scrape job of the charm's hook latency metrics.
+
+        node-exporter serves them from its textfile collector, only the
+        charm's metrics are kept from that scrape.
+        """
+        name = "{}_charm_hooks".format(self._charm.app.name)
+        job = {
+            'job_name': name,
+            'job_data': {
+                'static_configs': [{
+                    'targets': sorted(targets)
+                }],
+                'scheme': 'http',
+                'metrics_path': '/metrics',
+                'metric_relabel_configs': [{
+                    'source_labels': ['__name__'],
+                    'regex': 'minio_charm_.*',
+                    'action': 'keep'
+                }]
+            }
+        }
+        super().request(name, job_data=job)
+
 
 class PrometheusMonitorNode(BasePrometheusMonitor):
 
@@ -0,0 +1,220 @@
+"""
+
+Local cache for the minio and mcli packages.
+
+Packages are stored content-addressed, i.e. named after their sha256, and
+an index maps each URL to the digest of the file downloaded from it:
+
+{
+    "<url>": {
+        "sha256": ...,
+        "fetched": ...,
+        "size": ...,
+        "mtime": ...,
+    }
+}
+
+Params:
+sha256: digest of the package downloaded from that url, which is also the
+        name of the file in the cache folder.
+fetched: timestamp of the download, used to prune the oldest entries.
+size, mtime: of the cached file once verified. The file is only hashed
+             again if either changed.
+
+A package is only downloaded again if the URL is not in the index, if the
+cached file is gone or if its content no longer matches the recorded (or
+the operator supplied) digest. Downloads go to a partial file, only moved
+into place once its digest is verified.
+
+"""
+
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+PACKAGE_CACHE_DIR = "/var/cache/minio-charm/packages/"
+
+
+class PackageChecksumMismatchError(Exception):
+    def __init__(self, url, expected, found):
+        super().__init__(
+            "Package {} has sha256 {}, expected {}".format(
+                url, found, expected))
+
+
+def sha256sum(path, block_size=1 << 20):
+    """Returns the sha256 hexdigest of the file at path."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def deb_info(path):
+    """Returns the Package and Version fields of a .deb file.
+
+    Missing fields are simply not present on the returned dict.
+    """
+    out = subprocess.check_output(
+        ["dpkg-deb", "--field", path, "Package", "Version"])
+    result = {}
+    for line in out.decode("utf-8").splitlines():
+        if ":" not in line:
+            continue
+        k, v = line.split(":", 1)
+        result[k.strip()] = v.strip()
+    return result
+
+
+def installed_version(package):
+    """Returns the installed version of package or None if not installed.
+    """
+    try:
+        out = subprocess.check_output(
+            ["dpkg-query", "--show", "--showformat=${Version}", package],
+            stderr=subprocess.DEVNULL)
+    except subprocess.CalledProcessError:
+        return None
+    return out.decode("utf-8").strip() or None
+
+
+def is_installed(path):
+    """Checks if the exact package version in path is already installed."""
+    info = deb_info(path)
+    if "Package" not in info or "Version" not in info:
+        return False
+    return installed_version(info["Package"]) == info["Version"]
+
+
+class PackageCache(object):
+
+    def __init__(self, cache_dir=PACKAGE_CACHE_DIR, max_entries=4):
+        self._cache_dir = cache_dir
+        self._max_entries = max_entries
+
+    @property
+    def cache_dir(self):
+        return self._cache_dir
+
+    def _index_path(self):
+        return os.path.join(self._cache_dir, "index.json")
+
+    def _load_index(self):
+        try:
+            with open(self._index_path()) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self, index):
+        tmp = self._index_path() + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp, self._index_path())
+
+    def _path(self, digest):
+        return os.path.join(self._cache_dir, "{}.deb".format(digest))
+
+    def lookup(self, url, sha256=None, index=None):
+        """Returns the path of a cached and valid copy of url or None."""
+        index = index if index is not None else self._load_index()
+        entry = index.get(url)
+        if not entry:
+            return None
+        if sha256 and sha256 != entry["sha256"]:
+            # Operator pinned a different digest, the cached copy is stale
+            return None
+        path = self._path(entry["sha256"])
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if entry.get("size") == st.st_size and \
+           entry.get("mtime") == st.st_mtime:
+            return path
+        if sha256sum(path) != entry["sha256"]:
+            return None
+        entry["size"], entry["mtime"] = st.st_size, st.st_mtime
+        return path
+
+    def _download(self, url, sha256=None):
+        """Downloads url into the cache and returns its digest."""
+        tmp = os.path.join(
+            self._cache_dir, "partial-{}".format(
+                hashlib.sha256(url.encode("utf-8")).hexdigest()))
+        try:
+            subprocess.check_output(["wget", "-q", url, "-O", tmp])
+            digest = sha256sum(tmp)
+            if sha256 and sha256 != digest:
+                raise PackageChecksumMismatchError(url, sha256, digest)
+        except Exception:
+            # Never leave a partial download behind
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        os.replace(tmp, self._path(digest))
+        return digest
+
+    def fetch_all(self, packages, max_workers=2):
+        """Fetches all the packages concurrently.
+
+        Args:
+            packages: list of (url, sha256) tuples, sha256 may be empty
+        Returns:
+            list of the paths in the cache, in the same order as packages
+        """
+        os.makedirs(self._cache_dir, exist_ok=True)
+        index = self._load_index()
+        paths = []
+        missing = {}
+        for url, sha256 in packages:
+            path = self.lookup(url, sha256, index=index)
+            paths.append(path)
+            if path:
+                logger.debug("Package {} found in cache at {}".format(
+                    url, path))
+            else:
+                missing[url] = sha256
+        if missing:
+            # Each URL is downloaded once, even if listed more than once
+            with ThreadPoolExecutor(
+                    max_workers=max(1, min(max_workers, len(missing)))) as ex:
+                futures = {url: ex.submit(self._download, url, sha256)
+                           for url, sha256 in missing.items()}
+                for url, fut in futures.items():
+                    digest = fut.result()
+                    st = os.stat(self._path(digest))
+                    index[url] = {"sha256": digest, "fetched": time.time(),
+                                  "size": st.st_size,
+                                  "mtime": st.st_mtime}
+                    logger.info("Package {} downloaded to {}".format(
+                        url, self._path(digest)))
+            paths = [self._path(index[url]["sha256"])
+                     for url, _ in packages]
+            self._prune(index, keep=[url for url, _ in packages])
+        # Also keeps the size and mtime of the files verified by lookup
+        self._save_index(index)
+        return paths
+
+    def _prune(self, index, keep):
+        """Drops the oldest entries beyond max_entries and their files."""
+        entries = sorted(
+            [u for u in index.keys() if u not in keep],
+            key=lambda u: index[u]["fetched"], reverse=True)
+        allowed = max(0, self._max_entries - len(keep))
+        for url in entries[allowed:]:
+            digest = index.pop(url)["sha256"]
+            if any(e["sha256"] == digest for e in index.values()):
+                continue
+            try:
+                os.remove(self._path(digest))
+            except OSError:
+                pass
@@ -0,0 +1,129 @@
+"""
+
+Classifies the differences between two contexts of the charm by what is
+needed to apply them to the minio service.
+
+Scopes, from least to most disruptive:
+none: nothing to do, e.g. the value did not change.
+live: minio picks up the change without a restart, e.g. certificates,
+      which minio reloads from its certs folder.
+unit: only this unit must be restarted, e.g. an extra env option.
+cluster: all units must be restarted, as they must agree on the value,
+         e.g. MINIO_VOLUMES or root credentials.
+
+Keys not listed here are treated as "unit", i.e. restart to be safe.
+
+The scope picks the restart strategy when restart-strategy is "auto":
+cluster: simultaneous, all units restart in the same window.
+unit: batched if restart-batch-size allows more than one unit at a time,
+      rolling otherwise.
+
+"""
+
+import hashlib
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+NONE = 0
+LIVE = 1
+UNIT = 2
+CLUSTER = 3
+
+SCOPE_NAMES = {
+    NONE: "none",
+    LIVE: "live",
+    UNIT: "unit",
+    CLUSTER: "cluster",
+}
+
+ROLLING = "rolling"
+BATCHED = "batched"
+SIMULTANEOUS = "simultaneous"
+AUTO = "auto"
+STRATEGIES = [ROLLING, BATCHED, SIMULTANEOUS, AUTO]
+
+# Env values that all the servers must agree on: servers with mismatched
+# values fail the internode checks.
+CLUSTER_ENV_KEYS = [
+    "MINIO_VOLUMES",
+    "MINIO_ROOT_USER",
+    "MINIO_ROOT_PASSWORD",
+    "MINIO_ERASURE_SET_DRIVE_COUNT",
+    "MINIO_STORAGE_CLASS_STANDARD",
+    "MINIO_STORAGE_CLASS_RRS",
+]
+
+
+def diff_context(old, new, path=()):
+    """Returns the list of (path, old value, new value) that differ.
+
+    Dicts are compared key by key, so ordering does not matter. A missing
+    key shows up as None.
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        result = []
+        for k in sorted(set(old.keys()) | set(new.keys())):
+            result.extend(
+                diff_context(old.get(k), new.get(k), path + (k,)))
+        return result
+    if old == new:
+        return []
+    return [(path, old, new)]
+
+
+def classify_path(path):
+    """Returns the scope of a change on path."""
+    if not path:
+        return UNIT
+    if path[0] == "cert_data":
+        return LIVE
+    if path[0] == "env_minio" and len(path) > 1 and \
+       path[1] in CLUSTER_ENV_KEYS:
+        return CLUSTER
+    return UNIT
+
+
+def classify(old, new):
+    """Classifies the differences between the old and new contexts.
+
+    Returns the scope needed to apply all of them and a dict of each
+    changed path (dot-separated) and its scope name.
+    """
+    scope = NONE
+    details = {}
+    for path, _, _ in diff_context(old, new):
+        s = classify_path(path)
+        details[".".join(str(p) for p in path)] = SCOPE_NAMES[s]
+        scope = max(scope, s)
+    return scope, details
+
+
+def choose_strategy(scope, configured=AUTO, batch_size=1):
+    """Returns the restart strategy for a change of scope.
+
+    Args:
+        scope: scope of the change, as returned by classify
+        configured: restart-strategy config
+        batch_size: restart-batch-size config
+    """
+    if configured not in STRATEGIES:
+        logger.warning("Unknown restart-strategy {}, using {}".format(
+            configured, AUTO))
+        configured = AUTO
+    if configured != AUTO:
+        return configured
+    if scope >= CLUSTER:
+        return SIMULTANEOUS
+    if batch_size != 1:
+        return BATCHED
+    return ROLLING
+
+
+def cluster_fingerprint(ctx):
+    """Returns a digest of the values all the servers must agree on."""
+    env = ctx.get("env_minio", {}) or {}
+    values = {k: env.get(k) for k in CLUSTER_ENV_KEYS}
+    return hashlib.sha256(
+        json.dumps(values, sort_keys=True).encode()).hexdigest()
@@ -0,0 +1,142 @@
+"""
+
+Restarts requested on this unit, waiting to run.
+
+Every hook that finds a service down, or a new context to apply, asks
+for a restart. Asking again for the same services while a restart is
+pending does not queue another one: the request is merged into the
+pending entry, which keeps the latest context. Hence a single restart
+event is outstanding per set of services, instead of one deferred event
+per update-status.
+
+A restart after which minio does not come back counts as a failure and
+the entry waits before being retried, twice as long after each failure
+up to a cap, so a crash-looping minio is not restarted on every hook.
+A new context resets the wait: it may be the fix.
+
+Entries are kept as json on the charm's stored state, see dumps():
+[{"services": [...], "ctx": ..., "strategy": ..., "enqueued": ...,
+  "failures": ..., "next_attempt": ..., "scheduled": ...}]
+
+scheduled is set while a restart of the entry is outstanding.
+
+"""
+
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+BACKOFF_BASE = 30
+BACKOFF_CAP = 1800
+
+
+class RestartQueue(object):
+
+    def __init__(self, raw="[]", base=BACKOFF_BASE, cap=BACKOFF_CAP):
+        self._entries = json.loads(raw)
+        self._base = base
+        self._cap = cap
+
+    def dumps(self):
+        return json.dumps(self._entries, sort_keys=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def entry(self, services):
+        """Returns the pending entry of services, or None."""
+        key = sorted(services)
+        for e in self._entries:
+            if e["services"] == key:
+                return e
+        return None
+
+    def backoff(self, failures):
+        """Seconds to wait after the given count of failed restarts."""
+        if failures <= 0:
+            return 0
+        return min(self._cap, self._base * 2 ** (failures - 1))
+
+    def push(self, services, ctx, strategy=None, now=None):
+        """Queues a restart of services to apply ctx.
+
+        Returns:
+            True if a restart must be started for it now, False if one is
+            already outstanding or the entry is backing off.
+        """
+        now = now or time.time()
+        e = self.entry(services)
+        if e is None:
+            e = {"services": sorted(services), "ctx": ctx,
+                 "strategy": strategy, "enqueued": now, "failures": 0,
+                 "next_attempt": now, "scheduled": False}
+            self._entries.append(e)
+        elif e["ctx"] != ctx:
+            # New context, do not hold it back for the old one's failures
+            logger.debug("Restart of {} merged, new context".format(
+                e["services"]))
+            e["ctx"] = ctx
+            e["failures"] = 0
+            e["next_attempt"] = now
+        else:
+            logger.debug("Restart of {} already queued".format(
+                e["services"]))
+        if not self._schedule(e, now):
+            return False
+        e["strategy"] = strategy
+        return True
+
+    def _schedule(self, e, now):
+        if e["scheduled"] or e["next_attempt"] > now:
+            return False
+        e["scheduled"] = True
+        return True
+
+    def scheduled(self, strategy):
+        """Returns the outstanding entries started with strategy."""
+        return [e for e in self._entries
+                if e["scheduled"] and e["strategy"] == strategy]
+
+    def due(self, strategy=None, now=None):
+        """Returns the entries to be started now with strategy, marked as
+        started."""
+        now = now or time.time()
+        entries = [e for e in self._entries if self._schedule(e, now)]
+        for e in entries:
+            e["strategy"] = strategy
+        return entries
+
+    def done(self, services):
+        """Drops the entry of services, restarted successfully."""
+        e = self.entry(services)
+        if e is not None:
+            self._entries.remove(e)
+
+    def failed(self, services, now=None):
+        """Services did not come back, retry the entry after a backoff."""
+        now = now or time.time()
+        e = self.entry(services)
+        if e is None:
+            return
+        e["failures"] += 1
+        e["next_attempt"] = now + self.backoff(e["failures"])
+        e["scheduled"] = False
+        logger.warning("Restart of {} failed {} time(s), retrying in "
+                       "{}s".format(e["services"], e["failures"],
+                                    self.backoff(e["failures"])))
+
+    def summary(self, now=None):
+        """Returns the queue depth and age for the status message."""
+        if not self._entries:
+            return ""
+        now = now or time.time()
+        oldest = min(e["enqueued"] for e in self._entries)
+        msg = "restart queue: {} pending, oldest {:.0f}s".format(
+            len(self._entries), now - oldest)
+        waiting = [e["next_attempt"] for e in self._entries
+                   if e["next_attempt"] > now]
+        if waiting:
+            msg += ", retry in {:.0f}s".format(min(waiting) - now)
+        return msg
@@ -0,0 +1,294 @@
+"""
+
+Restarts scheduled by the leader across the cluster.
+
+Two strategies are driven from here, the rolling restart being handled by
+the coordinator lock instead:
+
+batched: parity-aware batches, described below.
+simultaneous: every unit restarts in the same window, for changes all the
+              servers must agree on. A rolling restart would leave servers
+              with mismatched values failing their internode checks until
+              the last one restarts. The leader waits until all units
+              rendered the same cluster-wide values, then publishes a
+              single batch with all of them.
+
+Restarting one unit at a time keeps the cluster available, but is slow on
+large clusters. minio keeps write quorum on an erasure set as long as it
+does not lose more drives than its parity (parity - 1 if parity is half of
+the set). Therefore, units that do not share too many drives of any set
+can be restarted together.
+
+minio places the drives of a pool in erasure sets in the order it expands
+the volumes: with ellipsis notation, hosts vary fastest, i.e.
+host1/data1, host2/data1, ..., host1/data2, ...; with an explicit list,
+the order given. The list is then split in sets of set size drives.
+
+The leader drives the batches over the cluster relation:
+
+Each unit that needs a restart publishes on its unit data:
+restart_request: json, {"id": ..., "services": [...],
+                       "strategy": ..., "config": ...}
+and, once restarted:
+restart_done: id of the last request it fulfilled.
+
+Leader publishes the current batch on the application data:
+restart_batch: json, {"gen": ..., "strategy": ...,
+                      "units": {<unit>: <request id>}, "started": ...}
+
+Requests that arrive while a batch runs are planned with the next one.
+
+Once every unit of a batch is done, the leader waits for each of them
+to answer on /minio/health/ready before publishing the next batch.
+
+"""
+
+import logging
+import re
+import time
+
+from collections import Counter, defaultdict
+
+from admin import HEALTH_CLUSTER, HEALTH_READY, wait_healthy
+from ellipsis import has_ellipsis
+from restart_policy import BATCHED, SIMULTANEOUS
+from topology import MinioClusterInvalidTopology
+
+logger = logging.getLogger(__name__)
+
+
+def _natural_key(s):
+    return [int(t) if t.isdigit() else t for t in re.split(r"(\d+)", s)]
+
+
+def drive_order(pool, ellipsis=True):
+    """Returns the unit owning each drive of the pool, in minio's order.
+
+    Args:
+        pool: dict of unit names and {"url": ..., "folders": [...]}
+        ellipsis: if the pool is given in ellipsis notation
+    """
+    if ellipsis:
+        units = sorted(pool, key=lambda u: _natural_key(pool[u]["url"]))
+        folders = sorted(next(iter(pool.values()))["folders"],
+                         key=_natural_key)
+        return [u for _ in folders for u in units]
+    pairs = sorted((e["url"] + f, u)
+                   for u, e in pool.items() for f in e["folders"])
+    return [u for _, u in pairs]
+
+
+def erasure_sets(pool, set_size, ellipsis=True):
+    """Returns, for each erasure set, a Counter of the drives per unit."""
+    order = drive_order(pool, ellipsis=ellipsis)
+    return [Counter(order[i:i + set_size])
+            for i in range(0, len(order), set_size)]
+
+
+def plan_batches(units, sets, max_batch=0):
+    """Groups units in batches that keep write quorum on every set.
+
+    Args:
+        units: units to be restarted, in order of preference
+        sets: list of (Counter of drives per unit, tolerance), where the
+              tolerance is how many drives the set can lose
+        max_batch: upper limit of units per batch, 0 for no limit
+    Returns:
+        list of batches, each a list of units
+    """
+    remaining = list(units)
+    batches = []
+    while remaining:
+        batch = []
+        load = defaultdict(int)
+        for u in list(remaining):
+            if max_batch and len(batch) >= max_batch:
+                break
+            if all(load[i] + drives.get(u, 0) <= tolerance
+                   for i, (drives, tolerance) in enumerate(sets)):
+                batch.append(u)
+                remaining.remove(u)
+                for i, (drives, _) in enumerate(sets):
+                    load[i] += drives.get(u, 0)
+        if not batch:
+            # Unit alone holds more drives of a set than it tolerates,
+            # nothing better than restarting it alone.
+            batch = [remaining.pop(0)]
+        batches.append(batch)
+    return batches
+
+
+class RestartScheduler(object):
+
+    def __init__(self, charm, cluster, max_batch=0, ready_timeout=300):
+        self._charm = charm
+        self._cluster = cluster
+        self._max_batch = max_batch
+        self._ready_timeout = ready_timeout
+
+    def request(self, services, strategy=BATCHED, config=""):
+        """Asks the leader for a restart of services on this unit.
+
+        Args:
+            services: list of services to restart
+            strategy: BATCHED or SIMULTANEOUS
+            config: fingerprint of the cluster-wide values this unit
+                    rendered, simultaneous restarts wait until all units
+                    agree on it
+        """
+        self._cluster.set_restart_request({
+            "id": "{:.6f}".format(time.time()), "services": services,
+            "strategy": strategy, "config": config})
+
+    def _pending(self, unit=None):
+        """Returns the request of unit if not fulfilled yet, or None."""
+        req = self._cluster.get_restart_request(unit)
+        if req and req["id"] != self._cluster.get_restart_done(unit):
+            return req
+        return None
+
+    def process(self):
+        """Restarts this unit if it is in the current batch and, on the
+        leader, moves the batches forward."""
+        if not self._cluster.relation:
+            return
+        batch = self._cluster.restart_batch
+        req = self._pending()
+        if req and \
+           batch.get("units", {}).get(self._charm.unit.name) == req["id"]:
+            logger.info("Restarting {} in {} batch {}".format(
+                req["services"], batch["strategy"], batch["gen"]))
+            self._charm.restart_services(
+                req["services"], strategy=batch["strategy"])
+            self._cluster.set_restart_done(req["id"])
+        if self._charm.unit.is_leader():
+            self._advance()
+
+    def _sets(self):
+        """Returns the (drives per unit, tolerance) of each erasure set,
+        or None if the layout is not known yet."""
+        pools = self._cluster.pools
+        if not pools:
+            return None
+        try:
+            topologies = self._cluster.topologies(
+                parity=self._charm.standard_parity())
+        except MinioClusterInvalidTopology:
+            return None
+        ellipsis = len(pools) > 1 or \
+            has_ellipsis(self._cluster.minio_volumes)
+        result = []
+        for pool, t in zip(pools, topologies):
+            for s in erasure_sets(pool, t.set_size, ellipsis=ellipsis):
+                result.append((s, t.write_tolerance))
+        return result
+
+    def _wait_ready(self, units):
+        """Waits for minio to be ready on each of the units."""
+        endpoints = self._cluster.peer_endpoints()
+        for u in units:
+            url = endpoints[u]["url"] if u in endpoints \
+                else self._charm.minio_url()
+            if wait_healthy(url, path=HEALTH_READY,
+                            timeout=self._ready_timeout,
+                            ca_path=self._charm.ca_cert_path()) is None:
+                logger.warning("{} not ready after {}s".format(
+                    u, self._ready_timeout))
+                return False
+        return True
+
+    def _finish(self, batch, units):
+        """Waits for the units of a finished batch, returns True once the
+        next batch can start."""
+        if not self._wait_ready(units):
+            # Hold the batch, retried on the next hook
+            return False
+        if batch["strategy"] == SIMULTANEOUS:
+            # The whole cluster was down, account until it serves again
+            took = wait_healthy(self._charm.minio_url(),
+                                path=HEALTH_CLUSTER,
+                                timeout=self._ready_timeout,
+                                ca_path=self._charm.ca_cert_path())
+            if took is None:
+                logger.warning("Cluster not healthy after {}s".format(
+                    self._ready_timeout))
+                return False
+            self._charm.record_restart({
+                "strategy": SIMULTANEOUS,
+                "units": sorted(units),
+                "started": batch["started"],
+                "unavailable": round(time.time() - batch["started"], 3)})
+        logger.info("Restart batch {} of {} done in {:.1f}s".format(
+            batch["gen"], sorted(units), time.time() - batch["started"]))
+        return True
+
+    def _simultaneous(self, requests, units):
+        """Returns the units to restart at once, or [] to keep waiting.
+
+        All units must have rendered the same cluster-wide values, so they
+        restart with a configuration they agree on. Units that do not catch
+        up within the ready timeout are left for a later restart.
+        """
+        simultaneous = {u: r for u, r in requests.items()
+                        if r["strategy"] == SIMULTANEOUS}
+        if not simultaneous:
+            return []
+        mine = simultaneous.get(self._charm.unit.name, {}).get("config")
+        agreed = [u for u, r in simultaneous.items() if r["config"] == mine]
+        oldest = min(float(r["id"]) for r in simultaneous.values())
+        if len(agreed) < len(units) and \
+           time.time() - oldest < self._ready_timeout:
+            logger.info("Simultaneous restart: {} of {} units ready".format(
+                len(agreed), len(units)))
+            return []
+        # Past the timeout, restart those that agree with the leader or,
+        # if the leader has not rendered it yet, all of the requesters
+        return agreed if mine else list(simultaneous)
+
+    def _advance(self):
+        batch = self._cluster.restart_batch
+        units = {u.name: u for u in self._cluster.all_units()}
+        # Units that left the cluster are not waited for
+        running = [u for u in batch.get("units", {}) if u in units]
+        if running:
+            if any(self._cluster.get_restart_done(units[u]) !=
+                   batch["units"][u] for u in running):
+                return
+            if not self._finish(batch, running):
+                return
+        requests = {}
+        for name, u in units.items():
+            req = self._pending(u)
+            if req:
+                requests[name] = req
+        if not requests:
+            if batch.get("units"):
+                self._cluster.restart_batch = {
+                    "gen": batch["gen"], "units": {}}
+            return
+        strategy = SIMULTANEOUS
+        next_batch = self._simultaneous(requests, units)
+        if not next_batch:
+            strategy = BATCHED
+            batched = sorted((u for u, r in requests.items()
+                              if r["strategy"] == BATCHED),
+                             key=_natural_key)
+            if not batched:
+                return
+            sets = self._sets()
+            if sets is None:
+                # Layout not known, restart one unit at a time
+                next_batch = batched[:1]
+            else:
+                next_batch = plan_batches(
+                    batched, sets, max_batch=self._max_batch)[0]
+        gen = batch.get("gen", 0) + 1
+        self._cluster.restart_batch = {
+            "gen": gen,
+            "strategy": strategy,
+            "units": {u: requests[u]["id"] for u in next_batch},
+            "started": time.time()}
+        logger.info("Restart batch {} ({}): {}".format(
+            gen, strategy, sorted(next_batch, key=_natural_key)))
+        # Leader may be part of the batch
+        self.process()
@@ -0,0 +1,122 @@
+"""
+
+Latency of the charm's hooks and of the phases of config-changed.
+
+Durations are kept as cumulative histograms, in Prometheus terms, and
+written in the text format to node-exporter's textfile collector folder,
+so they can be scraped and alerted upon next to minio's own metrics:
+
+minio_charm_hook_duration_seconds: whole hook, labeled by hook name.
+minio_charm_phase_duration_seconds: each phase, labeled by phase name.
+The startup phase covers the imports and the setup of the charm, before
+the hook runs.
+
+Histograms must survive across hooks: the charm keeps them on its stored
+state, as returned by HookTimer.histograms.
+
+"""
+
+import logging
+import os
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600]
+
+TEXTFILE_NAME = "minio_charm.prom"
+
+HOOK_METRIC = "minio_charm_hook_duration_seconds"
+PHASE_METRIC = "minio_charm_phase_duration_seconds"
+
+
+class HookTimer(object):
+    """Times the hook and its phases.
+
+    A phase runs until the next one starts or stop() is called.
+    """
+
+    def __init__(self, histograms=None):
+        self.histograms = histograms or {HOOK_METRIC: {}, PHASE_METRIC: {}}
+        self._started = time.monotonic()
+        self._phase = None
+        self._phase_started = None
+
+    def observe(self, metric, label, seconds):
+        h = self.histograms[metric].setdefault(
+            label, {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0})
+        for i, le in enumerate(BUCKETS):
+            if seconds <= le:
+                h["buckets"][i] += 1
+        h["sum"] += seconds
+        h["count"] += 1
+
+    def phase(self, name):
+        """Ends the running phase, if any, and starts name."""
+        self.stop()
+        self._phase = name
+        self._phase_started = time.monotonic()
+
+    def stop(self):
+        if self._phase is None:
+            return
+        took = time.monotonic() - self._phase_started
+        logger.debug("Phase {} took {:.3f}s".format(self._phase, took))
+        self.observe(PHASE_METRIC, self._phase, took)
+        self._phase = None
+
+    def finish(self, hook):
+        """Ends the running phase and accounts the whole hook."""
+        self.stop()
+        took = time.monotonic() - self._started
+        logger.debug("Hook {} took {:.3f}s".format(hook, took))
+        self.observe(HOOK_METRIC, hook, took)
+
+    def render(self):
+        """Returns the histograms in Prometheus text format."""
+        lines = []
+        for metric, label_name in [(HOOK_METRIC, "hook"),
+                                   (PHASE_METRIC, "phase")]:
+            lines.append("# HELP {} Duration of the minio charm {}s.".format(
+                metric, label_name))
+            lines.append("# TYPE {} histogram".format(metric))
+            for label, h in sorted(self.histograms[metric].items()):
+                for le, count in zip(BUCKETS, h["buckets"]):
+                    lines.append('{}_bucket{{{}="{}",le="{}"}} {}'.format(
+                        metric, label_name, label, le, count))
+                lines.append('{}_bucket{{{}="{}",le="+Inf"}} {}'.format(
+                    metric, label_name, label, h["count"]))
+                lines.append('{}_sum{{{}="{}"}} {}'.format(
+                    metric, label_name, label, round(h["sum"], 6)))
+                lines.append('{}_count{{{}="{}"}} {}'.format(
+                    metric, label_name, label, h["count"]))
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, folder):
+        """Writes the histograms for node-exporter's textfile collector.
+
+        The file is replaced atomically, so node-exporter never reads it
+        half-written. Nothing is written if the folder does not exist,
+        i.e. node-exporter is not installed.
+        """
+        if not folder or not os.path.isdir(folder):
+            return
+        fd, tmp = tempfile.mkstemp(dir=folder, prefix=".minio_charm")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(self.render())
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, os.path.join(folder, TEXTFILE_NAME))
+        except OSError:
+            os.unlink(tmp)
+            raise
+
+
+def hook_name():
+    """Returns the name of the running hook or action."""
+    path = os.environ.get("JUJU_DISPATCH_PATH", "")
+    if path:
+        return os.path.basename(path)
+    return os.environ.get("JUJU_HOOK_NAME") or \
+        os.environ.get("JUJU_ACTION_NAME") or "unknown"
@@ -0,0 +1,327 @@
+"""
+
+Erasure set planner, following how minio splits the drives of a server
+pool into erasure sets, as described on:
+https://docs.min.io/minio/baremetal/concepts/erasure-coding.html
+and implemented on minio's cmd/endpoint-ellipses.go:
+
+1) The set size must divide the number of drives of the pool and be
+   between 2 and 16.
+2) If the volumes are given with ellipsis notation, the set size must be
+   symmetric with the number of servers: one divides the other.
+3) minio picks the largest set size left, i.e. the smallest set count.
+
+Parity defaults to minio's own defaults for the set size unless set.
+Either storage class parity must be at most half of the set size, and
+the RRS parity cannot exceed the STANDARD one.
+
+Scaling out happens through server pools, as described on:
+https://docs.min.io/docs/distributed-minio-quickstart-guide.html
+Each pool has its own erasure sets, which never change once the pool is
+created. New units wait until they are enough to form a new pool.
+
+"""
+
+from ellipsis import compress_endpoints
+
+SET_SIZES = list(range(2, 17))
+
+# Default parity of the RRS storage class
+DEFAULT_RRS_PARITY = 1
+
+
+class MinioClusterInvalidTopology(Exception):
+    def __init__(self, msg):
+        super().__init__(msg)
+
+
+def default_parity(set_size):
+    """Returns minio's default parity for the STANDARD storage class."""
+    if set_size == 1:
+        return 0
+    if set_size <= 3:
+        return 1
+    if set_size <= 5:
+        return 2
+    if set_size <= 7:
+        return 3
+    return 4
+
+
+def parse_parity(storage_class):
+    """Returns the parity of a storage class value, e.g. "EC:4" is 4.
+
+    Returns None if the value is empty or not in the EC:<n> format.
+    """
+    if not storage_class:
+        return None
+    prefix, _, value = str(storage_class).strip('"').partition(":")
+    if prefix != "EC" or not value.isdigit():
+        return None
+    return int(value)
+
+
+def check_parity(set_size, standard=None, rrs=None):
+    """Checks the storage class parities fit erasure sets of set_size.
+
+    Raises:
+        MinioClusterInvalidTopology with the reason if they do not
+    """
+    highest = set_size // 2
+    for name, parity in [("standard-parity", standard),
+                         ("rrs-parity", rrs)]:
+        if parity is not None and not 0 <= parity <= highest:
+            raise MinioClusterInvalidTopology(
+                "{} {} does not fit erasure sets of {} drives, it must be "
+                "between 0 and {}".format(name, parity, set_size, highest))
+    if standard is None:
+        standard = default_parity(set_size)
+    if rrs is not None and rrs > standard:
+        raise MinioClusterInvalidTopology(
+            "rrs-parity {} is above the standard parity {}".format(
+                rrs, standard))
+
+
+def possible_set_sizes(num_drives, num_servers=None):
+    """Returns the valid set sizes for a pool, in ascending order.
+
+    Args:
+        num_drives: total drives of the pool
+        num_servers: if set, only sizes symmetric with the number of
+                     servers are valid, as minio does for volumes given
+                     with ellipsis notation.
+    """
+    result = []
+    for s in SET_SIZES:
+        if num_drives % s:
+            continue
+        if num_servers and s % num_servers and num_servers % s:
+            continue
+        result.append(s)
+    return result
+
+
+class Topology(object):
+    """Erasure layout of a server pool."""
+
+    def __init__(self, num_servers, num_drives, set_size,
+                 parity=None, drive_size=0, rrs_parity=None):
+        self.num_servers = num_servers
+        self.num_drives = num_drives
+        self.set_size = set_size
+        self.set_count = num_drives // set_size
+        self.parity = default_parity(set_size) if parity is None \
+            else parity
+        self.rrs_parity = min(DEFAULT_RRS_PARITY, self.parity) \
+            if rrs_parity is None else rrs_parity
+        self.drive_size = drive_size
+
+    @property
+    def data_drives(self):
+        """Data shards of each stripe."""
+        return self.set_size - self.parity
+
+    @property
+    def usable_ratio(self):
+        return self.data_drives / self.set_size
+
+    @property
+    def write_amplification(self):
+        """Bytes written to the drives per byte stored."""
+        return self.set_size / self.data_drives
+
+    @property
+    def rrs_usable_ratio(self):
+        return (self.set_size - self.rrs_parity) / self.set_size
+
+    @property
+    def rrs_write_amplification(self):
+        return self.set_size / (self.set_size - self.rrs_parity)
+
+    @property
+    def usable_capacity(self):
+        """Usable bytes of the pool, 0 if the drive size is not known."""
+        return self.set_count * self.data_drives * self.drive_size
+
+    @property
+    def read_tolerance(self):
+        """Drives each set can lose and still serve reads."""
+        return self.parity
+
+    @property
+    def write_tolerance(self):
+        """Drives each set can lose and still accept writes.
+
+        If parity is half the set size, write quorum is parity + 1.
+        """
+        if self.parity * 2 == self.set_size:
+            return self.parity - 1
+        return self.parity
+
+    def summary(self):
+        """Short description, fit for the unit status."""
+        return "{} set(s) x {} drives, EC:{}, {:.0%} usable".format(
+            self.set_count, self.set_size, self.parity, self.usable_ratio)
+
+    def to_dict(self):
+        return {
+            "servers": self.num_servers,
+            "drives": self.num_drives,
+            "set-count": self.set_count,
+            "stripe-width": self.set_size,
+            "parity": self.parity,
+            "data-drives": self.data_drives,
+            "usable-ratio": round(self.usable_ratio, 4),
+            "usable-capacity": self.usable_capacity,
+            "write-amplification": round(self.write_amplification, 4),
+            "rrs-parity": self.rrs_parity,
+            "rrs-usable-ratio": round(self.rrs_usable_ratio, 4),
+            "rrs-write-amplification": round(
+                self.rrs_write_amplification, 4),
+            "read-tolerance": self.read_tolerance,
+            "write-tolerance": self.write_tolerance,
+        }
+
+
+def plan(drives_per_server, symmetric=False, parity=None, drive_size=0,
+         rrs_parity=None):
+    """Computes the erasure layout minio will use for a server pool.
+
+    Args:
+        drives_per_server: dict of server name and its number of drives
+        symmetric: True if the volumes are passed with ellipsis notation
+        parity: STANDARD parity, minio's default if None
+        drive_size: size of the smallest drive, in bytes, if known
+        rrs_parity: RRS parity, minio's default if None
+    Raises:
+        MinioClusterInvalidTopology if there is no valid layout or the
+        parities do not fit it
+    """
+    num_servers = len(drives_per_server)
+    num_drives = sum(drives_per_server.values())
+    sizes = possible_set_sizes(
+        num_drives, num_servers if symmetric else None)
+    if not sizes:
+        raise MinioClusterInvalidTopology(
+            "{} drives over {} units: no erasure set size between {} and "
+            "{} divides it".format(num_drives, num_servers,
+                                   SET_SIZES[0], SET_SIZES[-1]))
+    check_parity(sizes[-1], standard=parity, rrs=rrs_parity)
+    return Topology(num_servers, num_drives, sizes[-1],
+                    parity=parity, drive_size=drive_size,
+                    rrs_parity=rrs_parity)
+
+
+def pool_endpoints(pool):
+    """Returns the {url: folders} of a pool."""
+    return {e["url"]: e["folders"] for e in pool.values()}
+
+
+def pool_volumes(pools):
+    """Returns the MINIO_VOLUMES value for the server pools.
+
+    Each pool is one argument in ellipsis notation. A single pool falls
+    back to the explicit list of url/folder pairs if its units do not
+    follow a pattern. That is not possible with several pools, as minio
+    requires every pool to use ellipsis notation.
+    """
+    if len(pools) == 1:
+        compressed = compress_endpoints(pool_endpoints(pools[0]))
+        if compressed:
+            return compressed
+        vol = []
+        for url, folders in pool_endpoints(pools[0]).items():
+            # Assuming all paths come with /<path>
+            # We do not need a / between URL and path
+            vol.extend(["{}{}".format(url, f) for f in folders])
+        # Relation list may change but not the actual nodes
+        vol.sort()
+        return " ".join(vol)
+    return " ".join(compress_endpoints(pool_endpoints(p)) for p in pools)
+
+
+def _replace_gone(pools, unit_endpoints, pending):
+    """Puts pending units in the place of the units gone from the pools.
+
+    A pending unit takes the place of a gone unit with the same folders.
+    With several pools, the pool must still be written in ellipsis form.
+
+    Returns the new pools, the units still pending and, if a unit could
+    not take a place, why.
+    """
+    pending = dict(pending)
+    reason = ""
+    for i, pool in enumerate(pools):
+        for gone in sorted(u for u in pool if u not in unit_endpoints):
+            folders = sorted(pool[gone]["folders"])
+            match = next((u for u in sorted(pending)
+                          if sorted(pending[u]["folders"]) == folders),
+                         None)
+            if match is None:
+                continue
+            candidate = {u: e for u, e in pool.items() if u != gone}
+            candidate[match] = pending[match]
+            if len(pools) > 1 and \
+               compress_endpoints(pool_endpoints(candidate)) is None:
+                reason = "{} cannot replace {}: its host does not follow " \
+                         "the sequence of the pool".format(match, gone)
+                continue
+            pools[i] = pool = candidate
+            del pending[match]
+    return pools, pending, reason
+
+
+def expand_pools(pools, unit_endpoints, min_units):
+    """Places the units into server pools.
+
+    Existing pools are only reshaped to replace units: a unit that is gone
+    keeps its endpoints on its pool until a new unit with the same folders
+    takes its place, whose drives minio then heals. Other units not in any
+    pool yet are pending until there are at least min_units of them and
+    their drives form a valid erasure layout, then they are appended as a
+    new pool.
+
+    Args:
+        pools: current list of pools, each a dict of unit name and
+               {"url": ..., "folders": [...]}
+        unit_endpoints: the same dict for every unit present
+        min_units: minimum amount of units of a new pool
+    Returns:
+        the new list of pools, the dict of pending units and why they
+        cannot form a new pool, empty if they just wait for more units
+    """
+    pools = [dict(p) for p in pools]
+    for p in pools:
+        for unit in p:
+            # URLs may change, e.g. http to https
+            if unit in unit_endpoints:
+                p[unit] = unit_endpoints[unit]
+    known = set(u for p in pools for u in p)
+    pending = {u: e for u, e in unit_endpoints.items() if u not in known}
+    if not pending:
+        return pools, pending, ""
+    if not pools:
+        # Bootstrap: all units present form the first pool
+        return [pending], {}, ""
+    pools, pending, reason = _replace_gone(pools, unit_endpoints, pending)
+    if not pending:
+        return pools, pending, ""
+    # minio requires every pool in ellipsis form once there are several
+    fixed = [str(i + 1) for i, p in enumerate(pools)
+             if compress_endpoints(pool_endpoints(p)) is None]
+    if fixed:
+        return pools, pending, "No pool can be added: the hosts or " \
+            "folders of pool {} do not follow a sequence".format(
+                ", ".join(fixed))
+    if len(pending) < max(min_units, 1):
+        return pools, pending, reason
+    try:
+        plan({u: len(e["folders"]) for u, e in pending.items()},
+             symmetric=True)
+    except MinioClusterInvalidTopology:
+        return pools, pending, reason
+    if compress_endpoints(pool_endpoints(pending)) is None:
+        return pools, pending, "Units {} cannot form a pool: their " \
+            "hosts or folders do not follow a sequence".format(
+                ", ".join(sorted(pending)))
+    return pools + [pending], {}, ""
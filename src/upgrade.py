@@ -0,0 +1,240 @@
+"""
+
+Coordinated upgrade of the minio binaries across the cluster.
+
+MinIO recommends upgrading distributed deployments by replacing the binary
+on every server and then restarting all of them at once, instead of
+restarting one server at a time, which leaves the cluster running mixed
+versions for a long time.
+
+The upgrade is a state machine, driven by the leader over the cluster
+relation:
+
+stage: every unit reads the packages from the attached resources, or
+       downloads them into its package cache, and publishes the sha256
+       of what it got.
+install: the leader verified all checksums match, every unit installs the
+         staged packages. The running server is not touched.
+restart: once all units installed, the leader restarts all the servers
+         with a single "admin service restart" and waits for the cluster
+         health endpoint.
+done / failed: final states.
+
+A stage or install phase that does not finish within phase_timeout, e.g.
+a unit is down or cannot fetch the packages, fails the upgrade. The
+leader checks it on every hook, update-status included. The operator may
+also abort an upgrade in progress, see abort().
+
+Leader publishes on the application data, key "upgrade":
+{
+    "id": ...,
+    "packages": [[<url or resource:<name>>, <sha256>], ...],
+    "phase": ...,
+    "started": ...,
+    "timings": {"stage": ..., "verify": ..., "install": ...,
+                "restart": ..., "healthy": ...},
+    "message": ...,
+}
+
+Each unit publishes on its unit data, key "upgrade_state":
+{
+    "id": ...,
+    "staged": [<sha256>, ...],
+    "verify": seconds taken to checksum the staged packages,
+    "installed": true/false,
+    "error": ...,
+}
+
+"""
+
+import copy
+import logging
+import subprocess
+import time
+
+from admin import (
+    HEALTH_CLUSTER,
+    MinioAdminCommandError,
+    wait_healthy
+)
+from package_cache import (
+    PackageChecksumMismatchError,
+    sha256sum
+)
+
+logger = logging.getLogger(__name__)
+
+STAGE = "stage"
+INSTALL = "install"
+DONE = "done"
+FAILED = "failed"
+
+
+class ClusterUpgrade(object):
+
+    def __init__(self, charm, cluster, health_timeout=300,
+                 phase_timeout=1800):
+        self._charm = charm
+        self._cluster = cluster
+        self._health_timeout = health_timeout
+        self._phase_timeout = phase_timeout
+
+    @property
+    def in_progress(self):
+        return self._cluster.upgrade.get("phase") in (STAGE, INSTALL)
+
+    def start(self, packages):
+        """Leader publishes a new upgrade for the packages.
+
+        Args:
+            packages: list of (source, sha256), as returned by the
+                      charm's _package_sources
+        """
+        doc = {
+            "id": str(int(time.time())),
+            "packages": [list(p) for p in packages],
+            "phase": STAGE,
+            "started": time.time(),
+            "timings": {},
+        }
+        self._cluster.upgrade = doc
+        self.process()
+        return self._cluster.upgrade
+
+    def abort(self):
+        """Leader fails the upgrade in progress. Units that installed
+        already keep the new packages, none is restarted.
+
+        Returns False if there was no upgrade in progress.
+        """
+        if not self.in_progress:
+            return False
+        self._fail(copy.deepcopy(self._cluster.upgrade),
+                   "aborted by the operator")
+        return True
+
+    def status(self):
+        """Returns the upgrade document and the state of each unit."""
+        doc = dict(self._cluster.upgrade)
+        doc["units"] = {
+            u.name: self._cluster.get_upgrade_state(u)
+            for u in self._cluster.all_units()}
+        return doc
+
+    def process(self):
+        """Moves this unit forward on the current upgrade.
+
+        The leader also checks if all units are done with the current
+        phase and, if so, moves the cluster to the next phase.
+        """
+        # Copy, the document is shared with the other readers of this hook
+        doc = copy.deepcopy(self._cluster.upgrade)
+        if doc.get("phase") not in (STAGE, INSTALL):
+            return
+        state = self._cluster.get_upgrade_state()
+        if state.get("id") != doc["id"]:
+            state = {"id": doc["id"], "installed": False}
+        try:
+            if "staged" not in state:
+                paths = self._charm.fetch_packages(
+                    [tuple(p) for p in doc["packages"]])
+                start = time.monotonic()
+                state["staged"] = [sha256sum(p) for p in paths]
+                state["verify"] = time.monotonic() - start
+                logger.info("Upgrade {}: staged {}".format(
+                    doc["id"], paths))
+            if doc["phase"] == INSTALL and not state["installed"]:
+                paths = self._charm.fetch_packages(
+                    [tuple(p) for p in doc["packages"]])
+                for p in paths:
+                    self._charm._install_deb(p)
+                state["installed"] = True
+                # The package config now matches what is installed
+                self._charm.mark_package_installed()
+                logger.info("Upgrade {}: installed {}".format(
+                    doc["id"], paths))
+        except (subprocess.CalledProcessError,
+                PackageChecksumMismatchError) as e:
+            state["error"] = str(e)
+            logger.error("Upgrade {} failed on this unit: {}".format(
+                doc["id"], str(e)))
+        self._cluster.set_upgrade_state(state)
+        if self._charm.unit.is_leader():
+            self._advance(doc)
+
+    def _fail(self, doc, message):
+        logger.error("Upgrade {} failed: {}".format(doc["id"], message))
+        doc["phase"] = FAILED
+        doc["message"] = message
+        self._cluster.upgrade = doc
+
+    def _advance(self, doc):
+        states = {u.name: self._cluster.get_upgrade_state(u)
+                  for u in self._cluster.all_units()}
+        errors = ["{}: {}".format(u, s["error"])
+                  for u, s in states.items()
+                  if s.get("id") == doc["id"] and s.get("error")]
+        if errors:
+            self._fail(doc, ", ".join(errors))
+            return
+        if doc["phase"] == STAGE:
+            pending = [u for u, s in states.items()
+                       if s.get("id") != doc["id"] or "staged" not in s]
+            if pending:
+                self._check_timeout(doc, doc["started"], pending)
+                return
+            doc["timings"]["stage"] = time.time() - doc["started"]
+            # Units checksum their own copies while staging, the
+            # slowest one accounts for the verification
+            start = time.monotonic()
+            reference = self._cluster.get_upgrade_state()["staged"]
+            mismatch = [u for u, s in states.items()
+                        if s["staged"] != reference]
+            doc["timings"]["verify"] = time.monotonic() - start + max(
+                s.get("verify", 0) for s in states.values())
+            if mismatch:
+                self._fail(doc, "checksums differ on {}".format(
+                    ", ".join(sorted(mismatch))))
+                return
+            doc["phase"] = INSTALL
+            doc["install_started"] = time.time()
+            self._cluster.upgrade = doc
+            # Leader installs its own copy right away
+            self.process()
+        elif doc["phase"] == INSTALL:
+            pending = [u for u, s in states.items()
+                       if s.get("id") != doc["id"] or not s["installed"]]
+            if pending:
+                self._check_timeout(doc, doc["install_started"], pending)
+                return
+            doc["timings"]["install"] = \
+                time.time() - doc["install_started"]
+            self._restart(doc)
+
+    def _check_timeout(self, doc, started, pending):
+        if time.time() - started <= self._phase_timeout:
+            return
+        self._fail(doc, "{} did not {} within {}s".format(
+            ", ".join(sorted(pending)), doc["phase"], self._phase_timeout))
+
+    def _restart(self, doc):
+        start = time.monotonic()
+        try:
+            self._charm.minio_admin().service_restart()
+        except MinioAdminCommandError as e:
+            self._fail(doc, str(e))
+            return
+        doc["timings"]["restart"] = time.monotonic() - start
+        healthy = wait_healthy(
+            self._charm.minio_url(), path=HEALTH_CLUSTER,
+            timeout=self._health_timeout,
+            ca_path=self._charm.ca_cert_path())
+        if healthy is None:
+            self._fail(doc, "cluster not healthy after {}s".format(
+                self._health_timeout))
+            return
+        doc["timings"]["healthy"] = healthy
+        doc["phase"] = DONE
+        logger.info("Upgrade {} done, timings: {}".format(
+            doc["id"], doc["timings"]))
+        self._cluster.upgrade = doc
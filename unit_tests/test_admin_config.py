@@ -0,0 +1,61 @@
+# Copyright 2021 pguimaraes
+# See LICENSE file for licensing details.
+
+import unittest
+
+from mock import MagicMock
+
+import src.admin_config as admin_config
+
+
+class TestAdminConfig(unittest.TestCase):
+
+    def test_parse(self):
+        config = admin_config.parse_admin_config(
+            "api:\n  requests_max: 1600\n"
+            "compression:\n  enable: true\n"
+            "notify_webhook:primary:\n  endpoint: http://hook\n")
+        self.assertEqual(config, {
+            "api": {"requests_max": "1600"},
+            "compression": {"enable": "on"},
+            "notify_webhook:primary": {"endpoint": "http://hook"}})
+        self.assertEqual(admin_config.parse_admin_config(""), {})
+
+    def test_parse_rejects_restart_only_subsystems(self):
+        for raw in ["storage_class:\n  standard: EC:4\n",
+                    "api: 1\n", "- api\n", "api: ["]:
+            with self.assertRaises(admin_config.MinioInvalidAdminConfig):
+                admin_config.parse_admin_config(raw)
+
+    def test_parse_config_get(self):
+        self.assertEqual(admin_config.parse_config_get([{
+            "status": "success",
+            "config": [{"subSystem": "api", "kv": [
+                {"key": "requests_max", "value": "1600"},
+                {"key": "cors_allow_origin", "value": "*"}]}]}]),
+            {"requests_max": "1600", "cors_allow_origin": "*"})
+        self.assertEqual(admin_config.parse_config_get([{
+            "status": "success",
+            "value": 'scanner speed=slow comment="set by charm"'}]),
+            {"speed": "slow", "comment": "set by charm"})
+
+    def test_apply_verifies_read_back(self):
+        admin = MagicMock()
+        admin.config_set.return_value = [{"status": "success"}]
+        admin.config_get.return_value = [{
+            "status": "success", "value": "api requests_max=100"}]
+        config = {"api": {"requests_max": "1600"}}
+        self.assertEqual(
+            admin_config.apply_admin_config(admin, config),
+            {"api.requests_max": ("1600", "100")})
+        admin.config_set.assert_called_once_with(
+            "api", {"requests_max": "1600"})
+        admin.config_get.return_value = [{
+            "status": "success", "value": "api requests_max=1600"}]
+        self.assertEqual(admin_config.apply_admin_config(admin, config), {})
+
+    def test_live_env_keys(self):
+        self.assertEqual(admin_config.live_env_keys({
+            "MINIO_VOLUMES": "x", "MINIO_API_REQUESTS_MAX": "1",
+            "MINIO_SCANNER_SPEED": "slow"}),
+            ["MINIO_API_REQUESTS_MAX", "MINIO_SCANNER_SPEED"])
@@ -0,0 +1,49 @@
+# Copyright 2021 pguimaraes
+# See LICENSE file for licensing details.
+
+import os
+import tempfile
+import unittest
+
+import src.api_limits as api_limits
+
+GIB = 1 << 30
+
+
+class TestApiLimits(unittest.TestCase):
+
+    def test_compute_limits(self):
+        # Bound by the CPUs
+        self.assertEqual(api_limits.compute_limits(256 * GIB, 16, 8), {
+            "requests_max": 4096,
+            "requests_deadline": 10,
+            "cluster_deadline": 10})
+        # Bound by the memory, more drives than CPUs
+        self.assertEqual(api_limits.compute_limits(8 * GIB, 2, 8), {
+            "requests_max": 256,
+            "requests_deadline": 40,
+            "cluster_deadline": 40})
+        # Never below the minimum, deadline capped
+        self.assertEqual(api_limits.compute_limits(GIB // 2, 1, 32), {
+            "requests_max": api_limits.MIN_REQUESTS,
+            "requests_deadline": api_limits.MAX_DEADLINE,
+            "cluster_deadline": api_limits.MAX_DEADLINE})
+
+    def test_merge_limits(self):
+        self.assertIsNone(api_limits.merge_limits({"minio/0": {}}))
+        merged = api_limits.merge_limits({
+            "minio/0": api_limits.compute_limits(256 * GIB, 16, 8),
+            "minio/1": api_limits.compute_limits(8 * GIB, 2, 8),
+            "minio/2": {}})
+        self.assertEqual(api_limits.api_config(merged), {
+            "requests_max": "256",
+            "requests_deadline": "40s",
+            "cluster_deadline": "40s"})
+
+    def test_host_resources(self):
+        with tempfile.NamedTemporaryFile("w", delete=False) as f:
+            f.write("MemTotal:       16384 kB\nMemFree:  1024 kB\n")
+        self.addCleanup(os.unlink, f.name)
+        resources = api_limits.host_resources(meminfo=f.name)
+        self.assertEqual(resources["ram"], 16 * 1024 * 1024)
+        self.assertGreaterEqual(resources["cpus"], 1)
@@ -0,0 +1,49 @@
+# Copyright 2021 pguimaraes
+# See LICENSE file for licensing details.
+
+import grp
+import os
+import pwd
+import shutil
+import tempfile
+import unittest
+
+import src.artifacts as artifacts
+
+
+class TestArtifactRenderer(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        self.owner = pwd.getpwuid(os.getuid()).pw_name
+        self.group = grp.getgrgid(os.getgid()).gr_name
+
+    def _write(self, renderer, content):
+        return renderer.write(
+            "test", os.path.join(self.folder, "test"), content,
+            owner=self.owner, group=self.group, perms=0o600)
+
+    def test_write_only_if_changed(self):
+        fingerprints = {}
+        renderer = artifacts.ArtifactRenderer(fingerprints)
+        self.assertTrue(self._write(renderer, "a"))
+        self.assertFalse(self._write(renderer, "a"))
+        self.assertEqual(renderer.changed, ["test"])
+        # New hook, same fingerprints: still nothing to do
+        renderer = artifacts.ArtifactRenderer(fingerprints)
+        self.assertFalse(self._write(renderer, "a"))
+        self.assertTrue(self._write(renderer, "b"))
+        self.assertEqual(renderer.changed, ["test"])
+        with open(os.path.join(self.folder, "test")) as f:
+            self.assertEqual(f.read(), "b")
+        self.assertEqual(
+            os.stat(os.path.join(self.folder, "test")).st_mode & 0o777,
+            0o600)
+
+    def test_lost_fingerprints_same_content(self):
+        self._write(artifacts.ArtifactRenderer({}), "a")
+        renderer = artifacts.ArtifactRenderer({})
+        self.assertFalse(self._write(renderer, "a"))
+        self.assertEqual(renderer.changed, [])
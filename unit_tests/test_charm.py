@@ -4,13 +4,18 @@
 # Learn more about testing at: https://juju.is/docs/sdk/testing
 
 import unittest
+import base64
+import json
 import os
 import subprocess
 import socket
-from mock import patch, PropertyMock
+import tempfile
+from mock import MagicMock, patch, PropertyMock
 
 # Do not import MinioCharm, it will confuse the patchs
 import src.charm as charm
+import src.monitoring as monitoring
+import src.admin as charm_admin
 from ops.testing import Harness
 from ops.model import BlockedStatus
 
@@ -91,9 +96,11 @@ class TestCharm(unittest.TestCase):
     @patch.object(charm.MinioCharm, "generate_env_file_minio")
     @patch.object(charm.MinioCharm, "_cert_relation_set")
     # Overall patchs
-    @patch.object(charm, "render")
+    @patch.object(charm.ArtifactRenderer, "render")
     @patch.object(charm, "set_folders_and_permissions")
+    @patch.object(charm.PackageCache, "fetch_all")
     def test_install_user_permissions(self,
+                                      mock_fetch_all,
                                       mock_perms,
                                       mock_render,
                                       mock_certs,
@@ -113,6 +120,8 @@ class TestCharm(unittest.TestCase):
         mock_ip_get_hostname.return_value = "minio-0.test"
         mock_check_restart.return_value = False
         mock_certs.return_value = True
+        mock_check_output.return_value = b""
+        mock_fetch_all.return_value = ["/tmp/minio.deb", "/tmp/mcli.deb"]
         self.harness = Harness(charm.MinioCharm)
         self.addCleanup(self.harness.cleanup)
         self.harness.update_config({
@@ -123,13 +132,28 @@ class TestCharm(unittest.TestCase):
         })
         self.harness.begin_with_initial_hooks()
         mock_perms.assert_called_once()
-        # call_args_list is composed of:
-        # [0] wget command
-        # [1] dpkg command
+        # No resources attached: both packages come from the config URLs
+        mock_fetch_all.assert_called_once_with([
+            ("test", ""),
+            (self.harness.charm.config["mcli-package"], "")])
         # .args always returns as a set (,), that is why
-        self.assertEqual(
-            mock_check_output.call_args_list[0].args[0],
-            ['wget', 'test', '-O', '/tmp/minio.deb'])
+        cmds = [c.args[0] for c in mock_check_output.call_args_list]
+        self.assertIn(['dpkg', '-i', '/tmp/minio.deb'], cmds)
+        self.assertIn(['dpkg', '-i', '/tmp/mcli.deb'], cmds)
+        # dpkg succeeded, apt is not needed
+        mock_apt_update.assert_not_called()
+
+    @patch.object(subprocess, "check_output")
+    @patch.object(charm, "is_installed")
+    def test_install_skips_installed_version(self,
+                                             mock_is_installed,
+                                             mock_check_output):
+        mock_is_installed.return_value = True
+        self.harness = Harness(charm.MinioCharm)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.begin()
+        self.harness.charm._install_deb("/tmp/minio.deb")
+        mock_check_output.assert_not_called()
 
     @patch.object(charm, "open_port")
     @patch.object(charm, "close_port")
@@ -148,7 +172,7 @@ class TestCharm(unittest.TestCase):
     @patch.object(charm.MinioCharm, "generate_env_file_minio")
     @patch.object(charm.MinioCharm, "_cert_relation_set")
     # Overall patchs
-    @patch.object(charm, "render")
+    @patch.object(charm.ArtifactRenderer, "render")
     @patch.object(charm, "set_folders_and_permissions")
     def test_cluster_block_missing_neighb(self,
                                           mock_perms,
@@ -200,7 +224,7 @@ class TestCharm(unittest.TestCase):
     @patch.object(charm.MinioCharm, "generate_env_file_minio")
     @patch.object(charm.MinioCharm, "_cert_relation_set")
     # Overall patchs
-    @patch.object(charm, "render")
+    @patch.object(charm.ArtifactRenderer, "render")
     @patch.object(charm, "set_folders_and_permissions")
     def test_config_cluster_and_svc_file(self,
                                          mock_perms,
@@ -246,11 +270,14 @@ class TestCharm(unittest.TestCase):
             "url": "http://minio-3.test:9000",
             "used_folders": "/data1,/data2"
         })
+        # Units only render once the leader formed the first pool
+        self.harness.set_leader(True)
         self.harness.begin_with_initial_hooks()
         self.addCleanup(self.harness.cleanup)
         minio = self.harness.charm
         minio._on_config_changed(None)
         mock_render.assert_called_with(
+            'minio_svc',
             source='minio.service.j2',
             target='/etc/systemd/system/minio.service',
             owner='root', group='root', perms=420,
@@ -274,7 +301,7 @@ class TestCharm(unittest.TestCase):
     @patch.object(charm.MinioCharm, "generate_service_file_minio")
     @patch.object(charm.MinioCharm, "_cert_relation_set")
     # Overall patchs
-    @patch.object(charm, "render")
+    @patch.object(charm.ArtifactRenderer, "render")
     @patch.object(charm, "set_folders_and_permissions")
     @patch.object(charm, "genRandomPassword")
     @patch.object(charm, "OpsCoordinator")
@@ -335,18 +362,13 @@ class TestCharm(unittest.TestCase):
         self.harness = self._order_units_data('cluster', self.harness)
         self.harness.charm.generate_env_file_minio()
         mock_render.assert_called_with(
+            'env_minio',
             source='minio_env', target='/etc/minio/minio',
             owner='minio', group='minio', perms=384,
             context={
                 'env': {
-                    'MINIO_VOLUMES': "\"http://minio-0.test:9000/data1 "
-                                     "http://minio-0.test:9000/data2 "
-                                     "http://minio-1.test:9000/data1 "
-                                     "http://minio-1.test:9000/data2 "
-                                     "http://minio-2.test:9000/data1 "
-                                     "http://minio-2.test:9000/data2 "
-                                     "http://minio-3.test:9000/data1 "
-                                     "http://minio-3.test:9000/data2\"",
+                    'MINIO_VOLUMES': "\"http://minio-{0...3}.test:9000"
+                                     "/data{1...2}\"",
                     'MINIO_OPTS': '"--address :9000"',
                     'MINIO_ROOT_USER': 'minioadmin',
                     'MINIO_ROOT_PASSWORD': 'testtest'}})
@@ -367,7 +389,7 @@ class TestCharm(unittest.TestCase):
     @patch.object(charm.MinioCharm, "generate_env_file_minio")
     @patch.object(charm.MinioCharm, "generate_service_file_minio")
     # Overall patchs
-    @patch.object(charm, "render")
+    @patch.object(charm.ArtifactRenderer, "render")
     @patch.object(charm, "set_folders_and_permissions")
     @patch.object(charm, "genRandomPassword")
     @patch.object(charm, "OpsCoordinator")
@@ -376,11 +398,9 @@ class TestCharm(unittest.TestCase):
                   "binding_addr",
                   new_callable=PropertyMock)
     @patch.object(socket, "gethostname")
-    @patch.object(charm, "saveCrtChainToFile")
-    @patch.object(charm, "open")
+    @patch.object(charm.ArtifactRenderer, "write")
     def test_config_cluster_cert_relatio(self,
-                                         mock_open,
-                                         mock_save_crt_chain_file,
+                                         mock_write,
                                          mock_socket_hostname,
                                          mock_binding_addr,
                                          mock_ops_coordinator,
@@ -448,3 +468,407 @@ class TestCharm(unittest.TestCase):
             CERT)
         self.assertEqual(
             minio.get_ssl_key(), "key")
+
+    @patch.object(charm.MinioClusterManager, "relation_changed")
+    @patch.object(charm.MinioCharm, "_on_config_changed")
+    @patch.object(charm, "OpsCoordinator")
+    def test_topology_document(self, mock_ops_coordinator, mock_config,
+                               mock_relation_changed):
+        self.harness = Harness(charm.MinioCharm)
+        self.harness.add_storage("data", 2)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.set_leader(True)
+        cluster_id = self.harness.add_relation("cluster", "minio")
+        for i in range(1, 4):
+            self.harness.add_relation_unit(cluster_id, "minio/{}".format(i))
+            self.harness.update_relation_data(
+                cluster_id, "minio/{}".format(i), {
+                    "num_disks": "2",
+                    "url": "http://minio-{}.test:9000".format(i),
+                    "used_folders": "/data1,/data2"
+                })
+        self.harness.begin()
+        cluster = self.harness.charm.cluster
+        self.assertTrue(cluster.publish_topology())
+        # Same content, same generation
+        self.assertFalse(cluster.publish_topology())
+        self.assertEqual(cluster.topology_doc["gen"], 1)
+        self.assertEqual(cluster.drives_per_unit()["minio/3"], 2)
+        # A peer changes its data: the leader publishes a new generation
+        # and units read it from the document
+        self.harness.update_relation_data(cluster_id, "minio/3", {
+            "url": "https://minio-3.test:9000"})
+        self.assertEqual(cluster.topology_doc["gen"], 2)
+        self.assertEqual(cluster.peer_endpoints()["minio/3"], {
+            "url": "https://minio-3.test:9000",
+            "folders": ["/data1", "/data2"]})
+        mock_config.assert_called()
+
+    @patch.object(charm.MinioCharm, "minio_url")
+    @patch.object(charm.MinioDiskMapHelper, "used_folders")
+    @patch.object(charm, "time")
+    @patch.object(charm, "OpsCoordinator")
+    def test_bootstrap_waits_for_expected_units(self, mock_ops_coordinator,
+                                                mock_time, mock_used_folders,
+                                                mock_minio_url):
+        mock_minio_url.return_value = "http://minio-0.test:9000"
+        mock_used_folders.return_value = ["/data1", "/data2"]
+        self.harness = Harness(charm.MinioCharm)
+        self.harness.add_storage("data", 2)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.set_leader(True)
+        self.harness.update_config({
+            "min-units": 4,
+            "min-disks": 8,
+            "expected-units": 6,
+            "bootstrap-settle-timeout": 600
+        })
+        cluster_id = self.harness.add_relation("cluster", "minio")
+        for i in range(1, 4):
+            self.harness.add_relation_unit(cluster_id, "minio/{}".format(i))
+            self.harness.update_relation_data(
+                cluster_id, "minio/{}".format(i), {
+                    "num_disks": "2",
+                    "url": "http://minio-{}.test:9000".format(i),
+                    "used_folders": "/data1,/data2"
+                })
+        self.harness.begin()
+        minio = self.harness.charm
+        # min-units are there, but not the expected units
+        mock_time.time.return_value = 1000.0
+        minio._update_pools()
+        mock_time.time.return_value = 1599.0
+        minio._update_pools()
+        self.assertEqual(minio.cluster.pools, [])
+        self.assertEqual(minio.cluster.minio_volumes, "")
+        # Settle timeout expired: the units present form the first pool
+        mock_time.time.return_value = 1600.0
+        minio._update_pools()
+        self.assertEqual(len(minio.cluster.pools), 1)
+        self.assertEqual(len(minio.cluster.pools[0]), 4)
+        self.assertEqual(minio._stored.bootstrap_started, 0)
+
+    @patch.object(charm.MinioClusterManager, "send")
+    @patch.object(charm, "OpsCoordinator")
+    def test_cluster_skips_unchanged_writes(self, mock_ops_coordinator,
+                                            mock_send):
+        self.harness = Harness(charm.MinioCharm)
+        self.harness.add_storage("data", 2)
+        self.addCleanup(self.harness.cleanup)
+        cluster_id = self.harness.add_relation("cluster", "minio")
+        self.harness.update_relation_data(cluster_id, "minio/0", {
+            "url": "http://minio-0.test:9000"})
+        self.harness.begin()
+        cluster = self.harness.charm.cluster
+        cluster.url = "http://minio-0.test:9000"
+        mock_send.assert_not_called()
+        cluster.url = "https://minio-0.test:9000"
+        mock_send.assert_called_once_with(
+            "url", "https://minio-0.test:9000")
+
+    @patch.object(charm.MinioCharm, "get_ssl_cacert")
+    @patch.object(obj_stor.ObjectStorageRelationProvider, "hostname",
+                  new_callable=PropertyMock)
+    @patch.object(monitoring.BasePrometheusMonitor, "request")
+    @patch.object(charm.MinioCharm, "_on_config_changed")
+    @patch.object(charm, "OpsCoordinator")
+    def test_prometheus_joined_as_leader(self, mock_ops_coordinator,
+                                         mock_config, mock_request,
+                                         mock_hostname, mock_cacert):
+        mock_hostname.return_value = "minio-0.test"
+        mock_cacert.return_value = ""
+        self.harness = Harness(charm.MinioCharm)
+        self.harness.add_storage("data", 2)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.set_leader(True)
+        self.harness.add_relation("cluster", "minio")
+        self.harness.begin()
+        # Default config exports the hook metrics through node-exporter
+        self.assertTrue(self.harness.charm._hook_metrics_targets())
+        prom_id = self.harness.add_relation("prometheus-manual", "prometheus")
+        self.harness.add_relation_unit(prom_id, "prometheus/0")
+        jobs = [c[0][0] for c in mock_request.call_args_list]
+        self.assertIn("minio_charm_hooks", jobs)
+        self.assertIn("minio_cluster", jobs)
+        self.assertIn("minio-0_node", jobs)
+
+    @patch.object(charm, "OpsCoordinator")
+    def test_extra_opts_parsed_once_per_hook(self, mock_ops_coordinator):
+        self.harness = Harness(charm.MinioCharm)
+        self.harness.add_storage("data", 2)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.update_config({
+            "minio_env_extra_opts":
+                "MINIO_STORAGE_CLASS_STANDARD: EC:3\n"
+                "MINIO_STORAGE_CLASS_RRS: EC:1\n"})
+        self.harness.begin()
+        minio = self.harness.charm
+        minio.hook_cache.clear()
+        with patch.object(charm.yaml, "safe_load",
+                          wraps=charm.yaml.safe_load) as mock_safe_load:
+            for _ in range(3):
+                self.assertEqual(minio.standard_parity(), 3)
+                self.assertEqual(minio.rrs_parity(), 1)
+            self.assertEqual(mock_safe_load.call_count, 1)
+            # Next hook parses it again
+            minio.hook_cache.clear()
+            self.assertEqual(minio.standard_parity(), 3)
+            self.assertEqual(mock_safe_load.call_count, 2)
+
+    @patch.object(charm.MinioClusterManager, "relation_changed")
+    @patch.object(charm.MinioClusterManager, "publish_topology")
+    @patch.object(charm.ClusterUpgrade, "process")
+    @patch.object(charm.MinioCharm, "_on_config_changed")
+    @patch.object(charm, "OpsCoordinator")
+    def test_upgrade_done_reruns_config(self, mock_ops_coordinator,
+                                        mock_config, mock_process,
+                                        mock_publish, mock_relation_changed):
+        self.harness = Harness(charm.MinioCharm)
+        self.harness.add_storage("data", 2)
+        self.addCleanup(self.harness.cleanup)
+        cluster_id = self.harness.add_relation("cluster", "minio")
+        self.harness.add_relation_unit(cluster_id, "minio/1")
+        self.harness.update_relation_data(cluster_id, "minio", {
+            "topology": json.dumps({"gen": 1, "hash": "h", "units": {}}),
+            "upgrade": json.dumps({"id": "1", "phase": "install"})})
+        self.harness.begin()
+        minio = self.harness.charm
+        relation = self.harness.model.get_relation("cluster", cluster_id)
+        event = MagicMock(relation=relation)
+        minio.hook_cache.clear()
+        minio._on_cluster_relation_changed(event)
+        self.assertEqual(mock_config.call_count, 1)
+        # Nothing changed: config-changed is skipped
+        minio.hook_cache.clear()
+        minio._on_cluster_relation_changed(event)
+        self.assertEqual(mock_config.call_count, 1)
+        # The leader finished the upgrade: units blocked on it run
+        # config-changed again
+        self.harness.disable_hooks()
+        self.harness.update_relation_data(cluster_id, "minio", {
+            "upgrade": json.dumps({"id": "1", "phase": "done"})})
+        self.harness.enable_hooks()
+        minio.hook_cache.clear()
+        minio._on_cluster_relation_changed(event)
+        self.assertEqual(mock_config.call_count, 2)
+
+    @patch.object(charm.MinioCharm, "_cert_reloaded")
+    @patch.object(charm, "OpsCoordinator")
+    def test_restart_classifies_against_applied_ctx(self,
+                                                    mock_ops_coordinator,
+                                                    mock_cert_reloaded):
+        mock_cert_reloaded.return_value = True
+        self.harness = Harness(charm.MinioCharm)
+        self.harness.add_storage("data", 2)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.begin()
+        minio = self.harness.charm
+        ctx = {"env_minio": {"MINIO_VOLUMES": "https://minio-{0...3}/data"},
+               "minio_svc": {"user": "minio"},
+               "cert_data": {"cert": "a"}}
+        # Nothing rewritten: the context is recorded as applied
+        self.assertFalse(minio._check_if_need_restart(ctx, []))
+        self.assertEqual(minio.ctx, ctx)
+        # A certificate rotation is applied live, not by a restart
+        new_ctx = dict(ctx, cert_data={"cert": "b"})
+        self.assertFalse(minio._check_if_need_restart(new_ctx, ["cert"]))
+        self.assertEqual(minio.ctx, new_ctx)
+        # A hook wrote the env file and failed before restarting: its
+        # retry finds the file up to date, the restart is still needed
+        retry_ctx = dict(new_ctx, env_minio={
+            "MINIO_VOLUMES": "https://minio-{0...7}/data"})
+        self.assertTrue(minio._check_if_need_restart(retry_ctx, []))
+        self.assertEqual(minio.ctx, new_ctx)
+
+    @patch.object(charm.PackageCache, "fetch_all")
+    @patch.object(charm.MinioCharm, "_get_resource")
+    @patch.object(charm, "OpsCoordinator")
+    def test_upgrade_sources_use_resources(self, mock_ops_coordinator,
+                                           mock_get_resource,
+                                           mock_fetch_all):
+        deb = tempfile.NamedTemporaryFile(delete=False)
+        deb.write(b"minio")
+        deb.close()
+        self.addCleanup(os.unlink, deb.name)
+        # minio is attached as a resource, mcli comes from its URL
+        mock_get_resource.side_effect = \
+            lambda r: deb.name if r == "minio-package" else None
+        mock_fetch_all.return_value = ["/tmp/mcli.deb"]
+        self.harness = Harness(charm.MinioCharm)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.begin()
+        minio = self.harness.charm
+        sources = minio._package_sources()
+        self.assertEqual(sources, [
+            ("resource:minio-package", charm.sha256sum(deb.name)),
+            (minio.config["mcli-package"], "")])
+        self.assertEqual(minio.fetch_packages(sources),
+                         [deb.name, "/tmp/mcli.deb"])
+        mock_fetch_all.assert_called_once_with(
+            [(minio.config["mcli-package"], "")])
+        # The resource changed since the leader published its digest
+        with self.assertRaises(charm.PackageChecksumMismatchError):
+            minio.fetch_packages([("resource:minio-package", "0" * 64)])
+
+    @patch.object(charm, "HealJob")
+    @patch.object(charm, "OpsCoordinator")
+    def test_start_heal_without_mcli(self, mock_ops_coordinator,
+                                     mock_heal_job):
+        self.harness = Harness(charm.MinioCharm)
+        self.harness.add_storage("data", 2)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.begin()
+        minio = self.harness.charm
+        job = mock_heal_job.return_value
+        job.throttle.side_effect = FileNotFoundError(2, "mcli")
+        job.start.side_effect = FileNotFoundError(2, "mcli")
+        # The hook goes on and the heal is retried on update-status
+        self.assertIn("Heal could not start", minio._start_heal())
+        self.assertTrue(minio._stored.heal_pending)
+        self.assertFalse(minio._stored.heal_started)
+        job.start.side_effect = None
+        job.start.return_value = True
+        self.assertEqual(minio._start_heal(), "")
+        self.assertFalse(minio._stored.heal_pending)
+        self.assertTrue(minio._stored.heal_started)
+
+    @patch.object(charm, "hook_name")
+    @patch.object(charm, "OpsCoordinator")
+    def test_update_status_keeps_deferred_nrpe_events(self,
+                                                      mock_ops_coordinator,
+                                                      mock_hook_name):
+        received = []
+
+        def defer(self, event):
+            event.defer()
+
+        def record(self, event):
+            received.append(event)
+
+        # A config-changed defers an nrpe event
+        mock_hook_name.return_value = "config-changed"
+        first = Harness(charm.MinioCharm)
+        self.addCleanup(first.cleanup)
+        with patch.object(charm.MinioCharm, "on_nrpe_available", defer):
+            first.begin()
+            first.charm.nrpe.on.nrpe_available.emit()
+        storage = first.framework._storage
+        notices = list(storage.notices(None))
+        self.assertEqual(len(notices), 1)
+        # Next dispatch is update-status, with the same stored state
+        mock_hook_name.return_value = "update-status"
+        self.harness = Harness(charm.MinioCharm)
+        self.addCleanup(self.harness.cleanup)
+        for event_path, observer_path, method_name in notices:
+            self.harness.framework._storage.save_snapshot(
+                event_path, storage.load_snapshot(event_path))
+            self.harness.framework._storage.save_notice(
+                event_path, observer_path, method_name)
+        with patch.object(charm.MinioCharm, "on_nrpe_available", record):
+            self.harness.begin()
+            self.assertIsNotNone(self.harness.charm.nrpe)
+            self.harness.framework.reemit()
+        self.assertEqual(len(received), 1)
+
+
+def _pem(body):
+    return "-----BEGIN CERTIFICATE-----\n{}\n" \
+           "-----END CERTIFICATE-----\n".format(
+               base64.b64encode(body).decode())
+
+
+LEAF = _pem(b"leaf certificate")
+NEW_LEAF = _pem(b"new leaf certificate")
+CA = _pem(b"ca certificate")
+NEW_CA = _pem(b"new ca certificate")
+
+
+class TestCertRotation(unittest.TestCase):
+    """A certificate rotation is applied live, by minio reloading the
+    files, and only restarts if minio does not serve the new cert."""
+
+    def setUp(self):
+        for p in TO_PATCH_HOST:
+            _m = patch.object(charm, p)
+            _m.start()
+            self.addCleanup(_m.stop)
+        for method in ["get_ssl_cert", "get_ssl_key"]:
+            _m = patch.object(charm.MinioCharm, method)
+            setattr(self, method, _m.start())
+            self.addCleanup(_m.stop)
+        self.get_ssl_key.return_value = "key"
+        _m = patch.object(charm, "OpsCoordinator")
+        _m.start()
+        self.addCleanup(_m.stop)
+        _m = patch.object(obj_stor.ObjectStorageRelationProvider,
+                          "hostname", new_callable=PropertyMock,
+                          return_value="minio-0.test")
+        _m.start()
+        self.addCleanup(_m.stop)
+        charm.service_running.return_value = True
+        self.harness = Harness(charm.MinioCharm)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.begin()
+        self.minio = self.harness.charm
+
+    def _rotate(self, old, new):
+        """Applies the old chain, then returns the context of new."""
+        self.get_ssl_cert.return_value = old
+        self.minio.ctx = {"env_minio": {}, "minio_svc": {},
+                          "cert_data": {"cert": charm.fingerprint(old),
+                                        "key": charm.fingerprint("key")}}
+        self.get_ssl_cert.return_value = new
+        return {"env_minio": {}, "minio_svc": {},
+                "cert_data": {"cert": charm.fingerprint(new),
+                              "key": charm.fingerprint("key")}}
+
+    @patch.object(charm, "wait_cert_served")
+    def test_probe_succeeds_no_restart(self, mock_wait_cert_served):
+        mock_wait_cert_served.return_value = 0.5
+        ctx = self._rotate(LEAF + CA, NEW_LEAF + CA)
+        self.assertFalse(self.minio._check_if_need_restart(ctx, ["cert"]))
+        # The probe looks for the new leaf certificate
+        self.assertEqual(mock_wait_cert_served.call_args[0][2],
+                         charm._break_crt_chain(NEW_LEAF + CA)[0])
+        self.assertEqual(self.minio.ctx, ctx)
+        self.assertEqual(self.minio._stored.restart_scope,
+                         charm.restart_policy.NONE)
+
+    @patch.object(charm, "wait_cert_served")
+    def test_probe_times_out_restarts(self, mock_wait_cert_served):
+        mock_wait_cert_served.return_value = None
+        ctx = self._rotate(LEAF + CA, NEW_LEAF + CA)
+        self.assertTrue(self.minio._check_if_need_restart(ctx, ["cert"]))
+        self.assertEqual(self.minio._stored.restart_scope,
+                         charm.restart_policy.UNIT)
+
+    @patch("admin.served_cert_fingerprint")
+    def test_chain_only_change(self, mock_served):
+        # minio keeps serving the same leaf, only the CA changed
+        mock_served.return_value = charm_admin.cert_fingerprint(LEAF)
+        ctx = self._rotate(LEAF + CA, LEAF + NEW_CA)
+        self.assertFalse(self.minio._check_if_need_restart(ctx, ["ca"]))
+        mock_served.assert_called_once()
+
+    @patch.object(charm, "wait_cert_served")
+    @patch("artifacts.atomic_write")
+    def test_files_written_before_probe(self, mock_atomic_write,
+                                        mock_wait_cert_served):
+        calls = []
+        mock_atomic_write.side_effect = \
+            lambda target, content, **kwargs: calls.append(target)
+        mock_wait_cert_served.side_effect = \
+            lambda *args, **kwargs: calls.append("probe") or 0.5
+        ctx = self._rotate(LEAF + CA, NEW_LEAF + NEW_CA)
+        self.assertEqual(self.minio.generate_certificates(),
+                         ctx["cert_data"])
+        changes = self.minio.renderer.changed
+        self.assertFalse(self.minio._check_if_need_restart(ctx, changes))
+        # Every file is swapped in one rename, the cert last, and all
+        # of them before minio is probed
+        self.assertEqual(changes, ["ca", "key", "cert"])
+        self.assertEqual([os.path.basename(c) for c in calls],
+                         ["public.crt", "private.key", "public.crt",
+                          "probe"])
+        self.assertTrue(calls[2].startswith(
+            charm.TLS_PATH.format("minio")))
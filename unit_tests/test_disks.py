@@ -0,0 +1,225 @@
+# Copyright 2021 pguimaraes
+# See LICENSE file for licensing details.
+
+import os
+import re
+import tempfile
+import threading
+import unittest
+
+import yaml
+
+from mock import MagicMock, patch
+
+import src.disks as disks
+
+
+class TestDisks(unittest.TestCase):
+
+    def test_build_layout(self):
+        layout = yaml.safe_load(disks.build_layout("xfs", "noatime", count=2))
+        self.assertEqual(layout, [
+            {"/data1": [{"fs-type": "xfs"}, {"options": "noatime"}]},
+            {"/data2": [{"fs-type": "xfs"}, {"options": "noatime"}]}])
+        # Default profile keeps the previous layout
+        layout = yaml.safe_load(disks.build_layout())
+        self.assertEqual(len(layout), disks.DISK_COUNT)
+        self.assertEqual(layout[-1], {
+            "/data32": [{"fs-type": "ext4"}, {"options": ""}]})
+
+    def test_read_mounts(self):
+        with tempfile.NamedTemporaryFile("w", delete=False) as f:
+            f.write("/dev/sdb /data1 xfs rw,noatime,attr2 0 0\n"
+                    "/dev/sdc /data2 ext4 rw,relatime 0 0\n")
+        self.addCleanup(os.unlink, f.name)
+        mounts = disks.read_mounts(f.name)
+        self.assertEqual(mounts["/data1"], {
+            "device": "/dev/sdb", "fs-type": "xfs",
+            "options": ["rw", "noatime", "attr2"]})
+        self.assertEqual(mounts["/data2"]["fs-type"], "ext4")
+
+    def test_missing_options(self):
+        self.assertEqual(disks.missing_options("", ["rw"]), [])
+        self.assertEqual(
+            disks.missing_options("noatime,nodiratime", ["rw", "noatime"]),
+            ["nodiratime"])
+
+    def test_is_empty(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(os.rmdir, folder)
+        os.mkdir(os.path.join(folder, "lost+found"))
+        self.addCleanup(os.rmdir, os.path.join(folder, "lost+found"))
+        self.assertTrue(disks.is_empty(folder))
+        os.mkdir(os.path.join(folder, ".minio.sys"))
+        self.addCleanup(os.rmdir, os.path.join(folder, ".minio.sys"))
+        self.assertFalse(disks.is_empty(folder))
+
+    def test_device_uuids(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(os.rmdir, folder)
+        link = os.path.join(folder, "1234-abcd")
+        os.symlink("/dev/sdb", link)
+        self.addCleanup(os.unlink, link)
+        self.assertEqual(disks.device_uuids(folder), {"/dev/sdb": "1234-abcd"})
+        self.assertEqual(disks.device_uuids("/nonexistent"), {})
+
+    @patch.object(disks, "atomic_write")
+    def test_set_fstab_entry(self, mock_atomic_write):
+        with tempfile.NamedTemporaryFile("w", delete=False) as f:
+            f.write("# static\nUUID=root / ext4 defaults 0 1\n"
+                    "UUID=u1 /data1 xfs defaults 0 2")
+        self.addCleanup(os.unlink, f.name)
+        disks.set_fstab_entry("/data1", "UUID=u9", "ext4", "noatime",
+                              path=f.name)
+        disks.set_fstab_entry("/data2", "UUID=u2", "ext4", "", path=f.name)
+        # fstab is only replaced as a whole, never rewritten in place
+        self.assertEqual(mock_atomic_write.call_args_list[0][0], (
+            f.name, "# static\nUUID=root / ext4 defaults 0 1\n"
+            "UUID=u9\t/data1\text4\tnoatime\t0\t2\n"))
+        self.assertEqual(mock_atomic_write.call_args_list[1][0][1].split(
+            "\n")[-2], "UUID=u2\t/data2\text4\tdefaults\t0\t2")
+        self.assertEqual(mock_atomic_write.call_args[1], {"perms": 0o644})
+
+    def test_read_fstab(self):
+        with tempfile.NamedTemporaryFile("w", delete=False) as f:
+            f.write("# UUID=old /data1 ext4 defaults 0 2\n"
+                    "UUID=u1 /data1 xfs noatime 0 2\n")
+        self.addCleanup(os.unlink, f.name)
+        self.assertEqual(disks.read_fstab(f.name), {
+            "/data1": ["UUID=u1", "/data1", "xfs", "noatime", "0", "2"]})
+        self.assertEqual(disks.read_fstab("/nonexistent"), {})
+
+
+class FakeDrives(object):
+    """Devices, fstab and mounts of a node, driven through subprocess."""
+
+    def __init__(self, filesystems, fstab, mounts, barrier=None):
+        # {device: (fs type, uuid)}
+        self.filesystems = dict(filesystems)
+        self.fstab = dict(fstab)
+        self.mounts = dict(mounts)
+        self.calls = []
+        # mkfs and mount wait for each other on it, if set
+        self.barrier = barrier
+
+    def check_call(self, cmd):
+        self.calls.append(cmd)
+        if self.barrier:
+            self.barrier.wait()
+        if cmd[0].startswith("mkfs."):
+            device = cmd[-1]
+            self.filesystems[device] = (
+                cmd[0][len("mkfs."):], "uuid-" + device[-3:])
+        elif cmd[0] == "mount":
+            entry = self.fstab[cmd[1]]
+            self.mounts[cmd[1]] = {"device": self.device_of(entry[0]),
+                                   "fs-type": entry[2],
+                                   "options": entry[3].split(",")}
+
+    def check_output(self, cmd):
+        fs_type, uuid = self.filesystems.get(cmd[-1], ("", ""))
+        value = {"TYPE": fs_type, "UUID": uuid}[cmd[-2]]
+        if not value:
+            raise disks.subprocess.CalledProcessError(2, cmd)
+        return value.encode()
+
+    def device_of(self, spec):
+        return next(d for d, (_, u) in self.filesystems.items()
+                    if spec in ("UUID=" + u, d))
+
+    def uuids(self):
+        return {d: u for d, (_, u) in self.filesystems.items()}
+
+    def set_fstab_entry(self, folder, spec, fs_type, options):
+        self.fstab[folder] = [spec, folder, fs_type, options or "defaults",
+                              "0", "2"]
+
+
+class TestMinioDiskMapHelper(unittest.TestCase):
+
+    def helper(self, drives, devices, **kwargs):
+        for name, fake in [("read_fstab", lambda: drives.fstab),
+                           ("read_mounts", lambda: drives.mounts),
+                           ("device_uuids", drives.uuids),
+                           ("set_fstab_entry", drives.set_fstab_entry)]:
+            patcher = patch.object(disks, name, side_effect=fake)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for target, fake in [(disks.subprocess, "check_call"),
+                             (disks.subprocess, "check_output")]:
+            patcher = patch.object(target, fake,
+                                   side_effect=getattr(drives, fake))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for target, name in [(disks.os, "makedirs"), (disks.shutil, "chown")]:
+            patcher = patch.object(target, name)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        charm = MagicMock()
+        charm.model.storages = {
+            "data": [MagicMock(location=d) for d in devices]}
+        with patch.object(disks.DiskMapHelper, "__init__", return_value=None):
+            return disks.MinioDiskMapHelper(
+                charm, "data", "minio", "minio", count=4, **kwargs)
+
+    def test_fs_type_change_only_affects_new_disks(self):
+        # /dev/sdb was formatted as xfs before fs-type became ext4, and
+        # /dev/sdd was formatted as xfs elsewhere and has no fstab entry
+        drives = FakeDrives(
+            {"/dev/sdb": ("xfs", "u1"), "/dev/sdd": ("xfs", "u3")},
+            {"/data1": ["UUID=u1", "/data1", "xfs", "defaults", "0", "2"]},
+            {"/data1": {"device": "/dev/sdb", "fs-type": "xfs",
+                        "options": ["rw"]}})
+        helper = self.helper(drives, ["/dev/sdb", "/dev/sdc", "/dev/sdd"],
+                             fs_type="ext4", mount_options="noatime")
+        self.assertEqual(helper.assignments(), {
+            "/dev/sdb": "/data1", "/dev/sdc": "/data2", "/dev/sdd": "/data3"})
+        helper.attach_disks()
+        # Only the blank device is formatted, with the profile
+        self.assertEqual(
+            [c for c in drives.calls if c[0].startswith("mkfs.")],
+            [["mkfs.ext4", "/dev/sdc"]])
+        self.assertEqual(drives.fstab, {
+            "/data1": ["UUID=u1", "/data1", "xfs", "defaults", "0", "2"],
+            "/data2": ["UUID=uuid-sdc", "/data2", "ext4", "noatime",
+                       "0", "2"],
+            "/data3": ["UUID=u3", "/data3", "xfs", "defaults", "0", "2"]})
+        self.assertEqual(
+            {f: m["fs-type"] for f, m in drives.mounts.items()},
+            {"/data1": "xfs", "/data2": "ext4", "/data3": "xfs"})
+        self.assertNotIn(["mount", "/data1"], drives.calls)
+        self.assertEqual(helper.used_folders(), ["/data1", "/data2", "/data3"])
+
+    def test_attach_disks_skips_prepared(self):
+        drives = FakeDrives(
+            {"/dev/sdb": ("xfs", "u1"), "/dev/sdc": ("xfs", "u2")},
+            {"/data1": ["UUID=u1", "/data1", "xfs", "defaults", "0", "2"],
+             "/data2": ["UUID=u2", "/data2", "xfs", "defaults", "0", "2"]},
+            {"/data1": {"device": "/dev/sdb"}})
+        helper = self.helper(drives, ["/dev/sdb", "/dev/sdc"])
+        # sdc is formatted but not mounted
+        self.assertEqual(helper.unprepared(), ["/dev/sdc"])
+        helper.attach_disks()
+        self.assertEqual(drives.calls, [["mount", "/data2"]])
+        drives.calls = []
+        disks.subprocess.check_output.reset_mock()
+        helper.attach_disks()
+        self.assertEqual(drives.calls, [])
+        disks.subprocess.check_output.assert_not_called()
+
+    def test_attach_disks_in_parallel(self):
+        devices = ["/dev/sdb", "/dev/sdc", "/dev/sdd"]
+        # Each mkfs, then each mount, only returns once all three started
+        drives = FakeDrives({}, {}, {},
+                            barrier=threading.Barrier(3, timeout=5))
+        helper = self.helper(drives, devices, fs_type="xfs")
+        with self.assertLogs(disks.logger, "DEBUG") as logs:
+            helper.attach_disks()
+        self.assertEqual(sorted(c for c in drives.calls if c[0] == "mount"),
+                         [["mount", "/data1"], ["mount", "/data2"],
+                          ["mount", "/data3"]])
+        for i, device in enumerate(devices, 1):
+            self.assertTrue(any(re.search(
+                r"Prepared {} on /data{}: mkfs [\d.]+s, mount [\d.]+s".format(
+                    device, i), line) for line in logs.output))
+        self.assertIn("Prepared 3 disks in", logs.output[-1])
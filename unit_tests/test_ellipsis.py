@@ -0,0 +1,38 @@
+# Copyright 2021 pguimaraes
+# See LICENSE file for licensing details.
+
+import unittest
+
+import src.ellipsis as ellipsis
+
+
+class TestEllipsis(unittest.TestCase):
+
+    def test_compress_hosts_and_folders(self):
+        endpoints = {
+            "http://10.0.0.{}:9000".format(i):
+                ["/data{}".format(j) for j in range(32, 0, -1)]
+            for i in range(10, 2, -1)}
+        self.assertEqual(
+            ellipsis.compress_endpoints(endpoints),
+            "http://10.0.0.{3...10}:9000/data{1...32}")
+
+    def test_zero_padded(self):
+        self.assertEqual(
+            ellipsis.compress_sequence(["/disk01", "/disk02", "/disk03"]),
+            "/disk{01...03}")
+        self.assertIsNone(
+            ellipsis.compress_sequence(["/disk09", "/disk010"]))
+
+    def test_fallback(self):
+        for endpoints in [
+                # Gap in the hostnames
+                {"http://minio-0:9000": ["/data1"],
+                 "http://minio-2:9000": ["/data1"]},
+                # Different folders per unit
+                {"http://minio-0:9000": ["/data1"],
+                 "http://minio-1:9000": ["/data1", "/data2"]},
+                # More than one varying number
+                {"http://rack1-minio-1:9000": ["/data1"],
+                 "http://rack2-minio-2:9000": ["/data1"]}]:
+            self.assertIsNone(ellipsis.compress_endpoints(endpoints))
@@ -0,0 +1,31 @@
+# Copyright 2021 pguimaraes
+# See LICENSE file for licensing details.
+
+import unittest
+
+from mock import MagicMock
+
+import src.hook_cache as hook_cache
+
+
+class TestHookCache(unittest.TestCase):
+
+    def test_fetch_once(self):
+        cache = hook_cache.HookCache()
+        fetch = MagicMock(return_value="value")
+        self.assertEqual(cache.get("key", fetch), "value")
+        self.assertEqual(cache.get("key", fetch), "value")
+        fetch.assert_called_once_with()
+        self.assertEqual((cache.misses, cache.hits), (1, 1))
+
+    def test_invalidate_and_clear(self):
+        cache = hook_cache.HookCache()
+        fetch = MagicMock(return_value="value")
+        cache.get("key", fetch)
+        cache.invalidate("key")
+        cache.get("key", fetch)
+        self.assertEqual(fetch.call_count, 2)
+        cache.clear()
+        self.assertEqual((cache.misses, cache.hits), (0, 0))
+        cache.get("key", fetch)
+        self.assertEqual(fetch.call_count, 3)
@@ -0,0 +1,62 @@
+# Copyright 2021 pguimaraes
+# See LICENSE file for licensing details.
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from mock import patch
+
+import src.package_cache as package_cache
+
+
+class TestPackageCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.cache = package_cache.PackageCache(cache_dir=self.cache_dir)
+
+    def _wget(self, content):
+        def wget(cmd):
+            with open(cmd[-1], "wb") as f:
+                f.write(content)
+            return b""
+        return wget
+
+    @patch.object(package_cache.subprocess, "check_output")
+    def test_failed_download_leaves_no_partial_file(self, mock_check_output):
+        def wget(cmd):
+            self._wget(b"part")(cmd)
+            raise subprocess.CalledProcessError(4, cmd)
+        mock_check_output.side_effect = wget
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.cache.fetch_all([("http://pkg/minio.deb", "")])
+        self.assertEqual(os.listdir(self.cache_dir), [])
+        # Same for a checksum mismatch
+        mock_check_output.side_effect = self._wget(b"minio")
+        with self.assertRaises(package_cache.PackageChecksumMismatchError):
+            self.cache.fetch_all([("http://pkg/minio.deb", "0" * 64)])
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+    @patch.object(package_cache, "sha256sum",
+                  wraps=package_cache.sha256sum)
+    @patch.object(package_cache.subprocess, "check_output")
+    def test_lookup_hashes_only_changed_files(self, mock_check_output,
+                                              mock_sha256sum):
+        mock_check_output.side_effect = self._wget(b"minio")
+        path, = self.cache.fetch_all([("http://pkg/minio.deb", "")])
+        mock_sha256sum.reset_mock()
+        self.assertEqual(
+            self.cache.fetch_all([("http://pkg/minio.deb", "")]), [path])
+        mock_sha256sum.assert_not_called()
+        mock_check_output.assert_called_once()
+        # The cached file was corrupted: it is hashed and downloaded again
+        with open(path, "ab") as f:
+            f.write(b"garbage")
+        self.assertEqual(
+            self.cache.fetch_all([("http://pkg/minio.deb", "")]), [path])
+        mock_sha256sum.assert_called()
+        self.assertEqual(mock_check_output.call_count, 2)
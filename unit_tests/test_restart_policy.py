@@ -0,0 +1,64 @@
+# Copyright 2021 pguimaraes
+# See LICENSE file for licensing details.
+
+import unittest
+
+import src.restart_policy as restart_policy
+
+
+class TestRestartPolicy(unittest.TestCase):
+
+    CTX = {
+        "env_minio": {
+            "MINIO_VOLUMES": "\"http://minio-{0...3}.test:9000/data1\"",
+            "MINIO_OPTS": "\"--address :9000\"",
+        },
+        "minio_svc": {"user": "minio", "group": "minio"},
+        "cert_data": {"cert": "aaa", "key": "bbb"},
+    }
+
+    def _change(self, section, key, value):
+        new = {k: dict(v) for k, v in self.CTX.items()}
+        new[section][key] = value
+        return new
+
+    def test_no_changes_reordered(self):
+        new = {k: dict(reversed(list(v.items())))
+               for k, v in reversed(list(self.CTX.items()))}
+        self.assertEqual(
+            restart_policy.classify(self.CTX, new),
+            (restart_policy.NONE, {}))
+
+    def test_scopes(self):
+        for section, key, scope in [
+                ("cert_data", "cert", restart_policy.LIVE),
+                ("env_minio", "MINIO_OPTS", restart_policy.UNIT),
+                ("env_minio", "EXTRA_OPT", restart_policy.UNIT),
+                ("minio_svc", "user", restart_policy.UNIT),
+                ("env_minio", "MINIO_VOLUMES", restart_policy.CLUSTER)]:
+            result, details = restart_policy.classify(
+                self.CTX, self._change(section, key, "new"))
+            self.assertEqual(result, scope)
+            self.assertEqual(
+                details, {"{}.{}".format(section, key):
+                          restart_policy.SCOPE_NAMES[scope]})
+
+    def test_choose_strategy(self):
+        choose = restart_policy.choose_strategy
+        self.assertEqual(choose(restart_policy.CLUSTER),
+                         restart_policy.SIMULTANEOUS)
+        self.assertEqual(choose(restart_policy.UNIT),
+                         restart_policy.ROLLING)
+        self.assertEqual(choose(restart_policy.UNIT, batch_size=0),
+                         restart_policy.BATCHED)
+        self.assertEqual(choose(restart_policy.CLUSTER, "rolling"),
+                         restart_policy.ROLLING)
+        self.assertEqual(choose(restart_policy.CLUSTER, "unknown"),
+                         restart_policy.SIMULTANEOUS)
+
+    def test_cluster_fingerprint(self):
+        fp = restart_policy.cluster_fingerprint(self.CTX)
+        self.assertEqual(fp, restart_policy.cluster_fingerprint(
+            self._change("env_minio", "MINIO_OPTS", "new")))
+        self.assertNotEqual(fp, restart_policy.cluster_fingerprint(
+            self._change("env_minio", "MINIO_VOLUMES", "new")))
@@ -0,0 +1,51 @@
+# Copyright 2021 pguimaraes
+# See LICENSE file for licensing details.
+
+import unittest
+
+import src.restart_queue as restart_queue
+
+
+class TestRestartQueue(unittest.TestCase):
+
+    def test_requests_are_merged(self):
+        q = restart_queue.RestartQueue()
+        self.assertTrue(q.push(["minio"], {"a": 1}, "rolling", now=100))
+        # Outstanding already, even with a newer context
+        self.assertFalse(q.push(["minio"], {"a": 1}, "rolling", now=110))
+        self.assertFalse(q.push(["minio"], {"a": 2}, "rolling", now=120))
+        self.assertEqual(len(q), 1)
+        self.assertEqual(q.entry(["minio"])["ctx"], {"a": 2})
+        self.assertEqual(q.summary(now=130),
+                         "restart queue: 1 pending, oldest 30s")
+        self.assertEqual(len(q.scheduled("rolling")), 1)
+        q.done(["minio"])
+        self.assertEqual(len(q), 0)
+        self.assertEqual(q.summary(), "")
+
+    def test_backoff(self):
+        q = restart_queue.RestartQueue(base=30, cap=100)
+        self.assertEqual([q.backoff(f) for f in range(5)],
+                         [0, 30, 60, 100, 100])
+        q.push(["minio"], {}, "rolling", now=100)
+        q.failed(["minio"], now=200)
+        # Same context waits for the backoff
+        self.assertFalse(q.push(["minio"], {}, "rolling", now=210))
+        self.assertEqual(q.due(now=220), [])
+        self.assertEqual(q.summary(now=220),
+                         "restart queue: 1 pending, oldest 120s, "
+                         "retry in 10s")
+        self.assertEqual(len(q.due("batched", now=230)), 1)
+        self.assertEqual(q.entry(["minio"])["strategy"], "batched")
+        q.failed(["minio"], now=240)
+        self.assertEqual(q.entry(["minio"])["next_attempt"], 300)
+        # A new context is tried right away
+        self.assertTrue(q.push(["minio"], {"a": 1}, "rolling", now=250))
+        self.assertEqual(q.entry(["minio"])["failures"], 0)
+
+    def test_survives_dumps(self):
+        q = restart_queue.RestartQueue()
+        q.push(["minio"], {"a": 1}, "rolling", now=100)
+        q = restart_queue.RestartQueue(q.dumps())
+        self.assertFalse(q.push(["minio"], {"a": 1}, "rolling", now=110))
+        self.assertEqual(q.entry(["minio"])["enqueued"], 100)
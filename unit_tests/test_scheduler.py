@@ -0,0 +1,78 @@
+# Copyright 2021 pguimaraes
+# See LICENSE file for licensing details.
+
+import unittest
+
+from collections import Counter
+
+import src.scheduler as scheduler
+import src.topology as topology
+
+
+def _pool(num_units, folders):
+    return {"minio/{}".format(i): {
+        "url": "http://minio-{}:9000".format(i), "folders": folders}
+        for i in range(num_units)}
+
+
+class TestBatchedRestart(unittest.TestCase):
+
+    def test_drive_order_hosts_vary_fastest(self):
+        pool = _pool(10, ["/data1", "/data2"])
+        order = scheduler.drive_order(pool)
+        # minio-10 sorts after minio-9, as minio expands {0...9}
+        self.assertEqual(order[:3], ["minio/0", "minio/1", "minio/2"])
+        self.assertEqual(order[9:11], ["minio/9", "minio/0"])
+
+    def test_drive_order_explicit_list(self):
+        pool = _pool(2, ["/data1", "/data2"])
+        self.assertEqual(
+            scheduler.drive_order(pool, ellipsis=False),
+            ["minio/0", "minio/0", "minio/1", "minio/1"])
+
+    def test_erasure_sets(self):
+        sets = scheduler.erasure_sets(_pool(8, ["/data1", "/data2"]), 8)
+        self.assertEqual(len(sets), 2)
+        self.assertEqual(sets[0], Counter(
+            {"minio/{}".format(i): 1 for i in range(8)}))
+
+    def test_large_cluster(self):
+        pool = _pool(48, ["/data{}".format(i) for i in range(1, 5)])
+        t = topology.plan({u: 4 for u in pool}, symmetric=True)
+        self.assertEqual((t.set_size, t.parity), (16, 4))
+        sets = [(s, t.write_tolerance)
+                for s in scheduler.erasure_sets(pool, t.set_size)]
+        batches = scheduler.plan_batches(sorted(pool), sets)
+        self.assertEqual([len(b) for b in batches], [12] * 4)
+        self.assertEqual(sorted(u for b in batches for u in b),
+                         sorted(pool))
+        # No batch takes more than parity drives of any set
+        for b in batches:
+            for s, tolerance in sets:
+                self.assertLessEqual(sum(s[u] for u in b), tolerance)
+
+    def test_max_batch(self):
+        pool = _pool(48, ["/data{}".format(i) for i in range(1, 5)])
+        sets = [(s, 4) for s in scheduler.erasure_sets(pool, 16)]
+        batches = scheduler.plan_batches(sorted(pool), sets, max_batch=5)
+        self.assertEqual([len(b) for b in batches],
+                         [5] * 9 + [3])
+
+    def test_half_parity_one_at_a_time(self):
+        # 4 drives with EC:2, write quorum needs 3 drives
+        pool = _pool(4, ["/data1"])
+        t = topology.plan({u: 1 for u in pool}, symmetric=True)
+        sets = [(s, t.write_tolerance)
+                for s in scheduler.erasure_sets(pool, t.set_size)]
+        self.assertEqual(len(scheduler.plan_batches(sorted(pool), sets)), 4)
+
+    def test_unit_over_tolerance_restarts_alone(self):
+        sets = [(Counter({"a": 3, "b": 1}), 2)]
+        self.assertEqual(scheduler.plan_batches(["a", "b"], sets),
+                         [["b"], ["a"]])
+
+    def test_parse_parity(self):
+        self.assertEqual(topology.parse_parity("EC:3"), 3)
+        self.assertEqual(topology.parse_parity("\"EC:2\""), 2)
+        self.assertIsNone(topology.parse_parity(""))
+        self.assertIsNone(topology.parse_parity("foo"))
@@ -0,0 +1,47 @@
+# Copyright 2021 pguimaraes
+# See LICENSE file for licensing details.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+import src.timing as timing
+
+
+class TestHookTimer(unittest.TestCase):
+
+    @patch.object(timing, "time")
+    def test_histograms(self, mock_time):
+        mock_time.monotonic.side_effect = [0, 0, 0.2, 0.2, 3, 3, 4]
+        timer = timing.HookTimer()
+        timer.phase("attach_disks")
+        timer.phase("render")
+        timer.finish("config-changed")
+        render = timer.histograms[timing.PHASE_METRIC]["render"]
+        self.assertEqual(render["count"], 1)
+        self.assertEqual(render["buckets"][:6], [0, 0, 0, 0, 0, 1])
+        hook = timer.histograms[timing.HOOK_METRIC]["config-changed"]
+        self.assertEqual((hook["sum"], hook["count"]), (3, 1))
+        # Histograms carry over to the next hook
+        timer = timing.HookTimer(timer.histograms)
+        timer.observe(timing.HOOK_METRIC, "config-changed", 0.05)
+        text = timer.render()
+        self.assertIn('minio_charm_hook_duration_seconds_bucket'
+                      '{hook="config-changed",le="0.1"} 1', text)
+        self.assertIn('minio_charm_hook_duration_seconds_count'
+                      '{hook="config-changed"} 2', text)
+        self.assertIn('minio_charm_phase_duration_seconds_bucket'
+                      '{phase="attach_disks",le="+Inf"} 1', text)
+
+    def test_write_textfile(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        timer = timing.HookTimer()
+        timer.finish("update-status")
+        timer.write_textfile(folder)
+        self.assertEqual(os.listdir(folder), [timing.TEXTFILE_NAME])
+        # node-exporter not installed: nothing to do
+        timer.write_textfile(os.path.join(folder, "missing"))
@@ -0,0 +1,147 @@
+# Copyright 2021 pguimaraes
+# See LICENSE file for licensing details.
+
+import unittest
+
+import src.topology as topology
+
+
+class TestTopology(unittest.TestCase):
+
+    def _plan(self, servers, drives, **kwargs):
+        return topology.plan(
+            {"minio/{}".format(i): drives for i in range(servers)},
+            **kwargs)
+
+    def test_set_sizes_not_divisible_by_4(self):
+        # Layouts the old "divisible by 4" check used to reject
+        for servers, drives, set_size, parity in [
+                (3, 2, 6, 3), (5, 2, 10, 4), (7, 1, 7, 3)]:
+            t = self._plan(servers, drives)
+            self.assertEqual(
+                (t.set_count, t.set_size, t.parity),
+                (1, set_size, parity))
+
+    def test_largest_set_size(self):
+        t = self._plan(4, 8, drive_size=100)
+        self.assertEqual((t.set_count, t.set_size, t.parity), (2, 16, 4))
+        self.assertEqual(t.usable_capacity, 2 * 12 * 100)
+        self.assertEqual(t.summary(), "2 set(s) x 16 drives, EC:4, "
+                                      "75% usable")
+
+    def test_symmetric(self):
+        # 9 divides 18 drives but is not symmetric with 6 servers
+        self.assertEqual(self._plan(6, 3).set_size, 9)
+        self.assertEqual(
+            self._plan(6, 3, symmetric=True).set_size, 6)
+
+    def test_write_tolerance(self):
+        t = self._plan(2, 2)
+        self.assertEqual((t.parity, t.read_tolerance, t.write_tolerance),
+                         (2, 2, 1))
+
+    def test_invalid(self):
+        with self.assertRaises(topology.MinioClusterInvalidTopology):
+            self._plan(17, 1)
+
+    def test_parity(self):
+        t = self._plan(4, 4, parity=6, rrs_parity=2)
+        d = t.to_dict()
+        self.assertEqual((d["parity"], d["rrs-parity"]), (6, 2))
+        self.assertEqual(d["usable-ratio"], 0.625)
+        self.assertEqual(d["write-amplification"], 1.6)
+        self.assertEqual(d["rrs-write-amplification"], 1.1429)
+        self.assertEqual(self._plan(4, 4).rrs_parity,
+                         topology.DEFAULT_RRS_PARITY)
+        # Above half of the 16 drives set
+        with self.assertRaisesRegex(topology.MinioClusterInvalidTopology,
+                                    "between 0 and 8"):
+            self._plan(4, 4, parity=9)
+        # RRS above the default standard parity, EC:4
+        with self.assertRaisesRegex(topology.MinioClusterInvalidTopology,
+                                    "above the standard parity 4"):
+            self._plan(4, 4, rrs_parity=5)
+
+
+class TestServerPools(unittest.TestCase):
+
+    def _endpoints(self, units, scheme="http"):
+        return {"minio/{}".format(i): {
+            "url": "{}://minio-{}:9000".format(scheme, i),
+            "folders": ["/data1", "/data2"]} for i in units}
+
+    def test_scale_out(self):
+        pools, pending, _ = topology.expand_pools(
+            [], self._endpoints(range(4)), 4)
+        self.assertEqual((len(pools), pending), (1, {}))
+        # Not enough units for a new pool: existing pool untouched
+        pools, pending, reason = topology.expand_pools(
+            pools, self._endpoints(range(7)), 4)
+        self.assertEqual(len(pools), 1)
+        self.assertEqual(sorted(pending), ["minio/4", "minio/5", "minio/6"])
+        self.assertEqual(reason, "")
+        pools, pending, _ = topology.expand_pools(
+            pools, self._endpoints(range(8)), 4)
+        self.assertEqual(pending, {})
+        self.assertEqual(
+            topology.pool_volumes(pools),
+            "http://minio-{0...3}:9000/data{1...2} "
+            "http://minio-{4...7}:9000/data{1...2}")
+
+    def test_pools_are_fixed(self):
+        pools, _, _ = topology.expand_pools(
+            [], self._endpoints(range(4)), 4)
+        # minio/3 is gone but keeps its endpoints, URLs are refreshed
+        endpoints = self._endpoints(range(3), scheme="https")
+        pools, _, _ = topology.expand_pools(pools, endpoints, 4)
+        self.assertEqual(
+            topology.pool_volumes(pools),
+            "http://minio-3:9000/data1 http://minio-3:9000/data2 "
+            "https://minio-0:9000/data1 https://minio-0:9000/data2 "
+            "https://minio-1:9000/data1 https://minio-1:9000/data2 "
+            "https://minio-2:9000/data1 https://minio-2:9000/data2")
+
+    def test_replaces_gone_unit(self):
+        pools, _, _ = topology.expand_pools(
+            [], self._endpoints(range(4)), 4)
+        # minio/3 is gone, minio/4 takes its place and its folders
+        endpoints = self._endpoints([0, 1, 2, 4])
+        pools, pending, reason = topology.expand_pools(pools, endpoints, 4)
+        self.assertEqual((pending, reason), ({}, ""))
+        self.assertEqual(sorted(pools[0]),
+                         ["minio/0", "minio/1", "minio/2", "minio/4"])
+        # A unit with other folders cannot take the place
+        pools, _, _ = topology.expand_pools(
+            [], self._endpoints(range(4)), 4)
+        endpoints = self._endpoints(range(3))
+        endpoints["minio/4"] = {"url": "http://minio-4:9000",
+                                "folders": ["/data1"]}
+        pools, pending, _ = topology.expand_pools(pools, endpoints, 4)
+        self.assertEqual(sorted(pending), ["minio/4"])
+        self.assertIn("minio/3", pools[0])
+
+    def test_replacement_keeps_ellipsis_with_pools(self):
+        pools, _, _ = topology.expand_pools(
+            [], self._endpoints(range(8)), 4)
+        pools = [{u: e for u, e in pools[0].items() if u < "minio/4"},
+                 {u: e for u, e in pools[0].items() if u >= "minio/4"}]
+        # minio/8 cannot replace minio/1: minio-{0,2,3,8} is no sequence
+        endpoints = self._endpoints([0, 2, 3, 4, 5, 6, 7, 8])
+        pools, pending, reason = topology.expand_pools(pools, endpoints, 4)
+        self.assertEqual(sorted(pending), ["minio/8"])
+        self.assertEqual(reason, "minio/8 cannot replace minio/1: its host "
+                                 "does not follow the sequence of the pool")
+
+    def test_pool_without_sequence_blocks_expansion(self):
+        endpoints = {"minio/{}".format(i): {
+            "url": "http://{}:9000".format(ip),
+            "folders": ["/data1", "/data2"]}
+            for i, ip in enumerate(["10.0.0.7", "10.0.0.3", "10.0.1.9",
+                                    "10.0.0.21"])}
+        pools, _, _ = topology.expand_pools([], endpoints, 4)
+        endpoints.update(self._endpoints(range(4, 8)))
+        pools, pending, reason = topology.expand_pools(pools, endpoints, 4)
+        self.assertEqual(len(pools), 1)
+        self.assertEqual(len(pending), 4)
+        self.assertEqual(reason, "No pool can be added: the hosts or "
+                                 "folders of pool 1 do not follow a sequence")
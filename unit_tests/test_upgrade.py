@@ -0,0 +1,90 @@
+# Copyright 2021 pguimaraes
+# See LICENSE file for licensing details.
+
+import unittest
+
+from mock import MagicMock, patch
+
+import src.upgrade as upgrade
+
+
+class FakeUnit(object):
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeCluster(object):
+    """Application and unit data of the cluster relation."""
+
+    def __init__(self, units):
+        self.units = [FakeUnit(u) for u in units]
+        self.upgrade = {}
+        self.states = {}
+
+    def all_units(self):
+        return self.units
+
+    def get_upgrade_state(self, unit=None):
+        return dict(self.states.get((unit or self.units[0]).name, {}))
+
+    def set_upgrade_state(self, state):
+        self.states[self.units[0].name] = dict(state)
+
+
+class TestClusterUpgrade(unittest.TestCase):
+
+    def setUp(self):
+        self.cluster = FakeCluster(["minio/0", "minio/1"])
+        self.charm = MagicMock()
+        self.charm.unit.is_leader.return_value = True
+        self.charm.fetch_packages.return_value = ["/tmp/minio.deb"]
+        self.upgrade = upgrade.ClusterUpgrade(
+            self.charm, self.cluster, phase_timeout=600)
+        patcher = patch.object(upgrade, "sha256sum", return_value="abc")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch.object(upgrade, "time")
+    def test_stage_timeout_fails_upgrade(self, mock_time):
+        mock_time.time.return_value = 1000.0
+        mock_time.monotonic.return_value = 0.0
+        self.upgrade.start([("http://pkg/minio.deb", "")])
+        # minio/1 is down and never stages
+        self.assertTrue(self.upgrade.in_progress)
+        mock_time.time.return_value = 1600.0
+        self.upgrade.process()
+        self.assertTrue(self.upgrade.in_progress)
+        mock_time.time.return_value = 1601.0
+        self.upgrade.process()
+        self.assertFalse(self.upgrade.in_progress)
+        self.assertEqual(self.cluster.upgrade["phase"], upgrade.FAILED)
+        self.assertEqual(self.cluster.upgrade["message"],
+                         "minio/1 did not stage within 600s")
+
+    @patch.object(upgrade, "time")
+    def test_install_timeout_fails_upgrade(self, mock_time):
+        mock_time.time.return_value = 1000.0
+        mock_time.monotonic.return_value = 0.0
+        self.upgrade.start([("http://pkg/minio.deb", "")])
+        self.cluster.states["minio/1"] = {
+            "id": self.cluster.upgrade["id"], "staged": ["abc"],
+            "verify": 2.5, "installed": False}
+        self.upgrade.process()
+        self.assertEqual(self.cluster.upgrade["phase"], upgrade.INSTALL)
+        # Slowest unit verification accounts for the verify phase
+        self.assertEqual(self.cluster.upgrade["timings"]["verify"], 2.5)
+        self.charm._install_deb.assert_called_once_with("/tmp/minio.deb")
+        self.charm.mark_package_installed.assert_called_once_with()
+        mock_time.time.return_value = 1000.0 + 601
+        self.upgrade.process()
+        self.assertEqual(self.cluster.upgrade["message"],
+                         "minio/1 did not install within 600s")
+
+    def test_abort(self):
+        self.assertFalse(self.upgrade.abort())
+        self.upgrade.start([("http://pkg/minio.deb", "")])
+        self.assertTrue(self.upgrade.abort())
+        self.assertFalse(self.upgrade.in_progress)
+        self.assertEqual(self.cluster.upgrade["message"],
+                         "aborted by the operator")
+        self.charm.minio_admin.assert_not_called()